@@ -1,21 +1,73 @@
 from langgraph.graph import StateGraph, END
-from langchain_openai import ChatOpenAI
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from langchain.schema import HumanMessage, SystemMessage
-from typing import TypedDict, List, Annotated, Dict, Any
+from typing import (TypedDict, List, Annotated, Dict, Any, AsyncIterator, Callable, Iterable,
+                    Iterator, Optional, Tuple)
+import asyncio
+import functools
+import json
 import operator
-from tools.sql_tool import SQLQueryTool
+import os
+import queue
+import re
+import threading
+from tools.sql_tool import ERROR_PREFIX as SQL_ERROR_PREFIX, SQLQueryTool
 from tools.analysis_tool import DataAnalysisTool
 from tools.visualization_tool import VisualizationTool
 from tools.document_search_tool import DocumentSearchTool
+from agents.query_templates import match_template
+from utils.concurrency import run_blocking
+from utils.schema_catalog import schema_prompt
+from utils.llm_cache import ResponseCache, default_llm_cache, make_cache_key
+from utils.semantic_cache import SemanticAnswerCache, default_semantic_cache
+from utils.instrumentation import add_llm_call, deep_merge, node_stats, summarize, tool_stats, write_trace
 from dotenv import load_dotenv
 import uuid
 import time
 
 load_dotenv()
 
+# Canonical node order, used to report the path a run took
+NODE_ORDER = ["planner", "doc_searcher", "sql_executor", "analyzer", "synthesizer"]
+
+# Route used when the planner's ROUTE line is missing or malformed
+DEFAULT_ROUTE = {"documents": True, "sql": True, "analysis": True}
+
+_ROUTE_PATTERN = re.compile(r'^\s*ROUTE:\s*(\{.*\})\s*$', re.MULTILINE)
+
+
+def parse_route(plan: str) -> Tuple[str, Dict[str, bool]]:
+    """Split the planner output into the plan text and its route flags"""
+    match = _ROUTE_PATTERN.search(plan)
+    if not match:
+        return plan.strip(), dict(DEFAULT_ROUTE)
+
+    try:
+        flags = json.loads(match.group(1))
+        route = {key: bool(flags.get(key, True)) for key in DEFAULT_ROUTE}
+    except (ValueError, AttributeError):
+        route = dict(DEFAULT_ROUTE)
+
+    plan_text = (plan[:match.start()] + plan[match.end():]).strip()
+    return plan_text, route
+
+
+def merge_dicts(left: Dict[str, Any], right: Dict[str, Any]) -> Dict[str, Any]:
+    """Reducer that merges metadata written by parallel branches.
+
+    Nested dicts (per-node cache stats, timings, ...) are merged recursively
+    so each node can add its own entry.
+    """
+    return deep_merge(left, right)
+
 
 class AgentState(TypedDict):
-    """State that gets passed between nodes"""
+    """State that gets passed between nodes.
+
+    Nodes return only the keys they write. `messages` and `metadata` have
+    reducers so the doc_searcher and sql_executor branches can update them
+    in the same step.
+    """
     messages: Annotated[List[Dict[str, str]], operator.add]
     query: str
     run_id: str
@@ -25,12 +77,34 @@ class AgentState(TypedDict):
     analysis_results: str
     visualization: str
     final_answer: str
-    metadata: Dict[str, Any]
+    route: Dict[str, bool]
+    fast_mode: bool
+    prepared: Dict[str, str]
+    template: Dict[str, Any]
+    metadata: Annotated[Dict[str, Any], merge_dicts]
 
 
 class FinancialAnalystAgent:
-    def __init__(self, model_name="gpt-4o-mini"):
+    def __init__(self, model_name="gpt-4o-mini", llm_cache: Optional[ResponseCache] = None,
+                 use_llm_cache=True, semantic_cache: Optional[SemanticAnswerCache] = None,
+                 use_semantic_cache=True, fast_mode=False, use_templates=True,
+                 sql_repair_attempts: Optional[int] = None):
+        self.model_name = model_name
+        self.fast_mode = fast_mode
+        self.use_templates = use_templates
+        # Failed SQL is sent back to the LLM with its error up to this many times
+        self.sql_repair_attempts = sql_repair_attempts if sql_repair_attempts is not None else \
+            int(os.getenv('SQL_REPAIR_ATTEMPTS', '2'))
         self.llm = ChatOpenAI(model=model_name, temperature=0)
+        self.json_llm = self.llm.bind(response_format={"type": "json_object"})
+        # temperature=0 makes responses reusable for identical prompts
+        self.llm_cache = llm_cache if llm_cache is not None else (
+            default_llm_cache() if use_llm_cache else None
+        )
+        # Near-duplicate questions reuse a prior answer for the same data version
+        self.semantic_cache = semantic_cache if semantic_cache is not None else (
+            default_semantic_cache(OpenAIEmbeddings()) if use_semantic_cache else None
+        )
         self.tools = {
             'sql': SQLQueryTool(),
             'analysis': DataAnalysisTool(),
@@ -38,32 +112,239 @@ class FinancialAnalystAgent:
             'docs': DocumentSearchTool()
         }
         self.graph = self._build_graph()
-    
-    def _build_graph(self):
-        """Build the LangGraph workflow"""
+        self.async_graph = self._build_graph(use_async=True)
+        self._batch_loop = None
+        # run_id -> callback receiving synthesizer tokens while streaming
+        self._token_sinks: Dict[str, Callable[[str], None]] = {}
+
+    def _build_graph(self, use_async=False):
+        """Build the LangGraph workflow.
+
+        With use_async=True the nodes are the coroutine versions, which
+        await the LLM and run tool I/O on the shared executor.
+        """
         workflow = StateGraph(AgentState)
-        
+
         # Define nodes (each step in the reasoning process)
-        workflow.add_node("planner", self.plan_analysis)
-        workflow.add_node("doc_searcher", self.search_documents)
-        workflow.add_node("sql_executor", self.execute_sql)
-        workflow.add_node("analyzer", self.analyze_data)
-        workflow.add_node("synthesizer", self.synthesize_answer)
-        
+        if use_async:
+            nodes = {
+                "planner": self.aplan_analysis,
+                "doc_searcher": self.asearch_documents,
+                "sql_executor": self.aexecute_sql,
+                "analyzer": self.aanalyze_data,
+                "synthesizer": self.asynthesize_answer,
+            }
+        else:
+            nodes = {
+                "planner": self.plan_analysis,
+                "doc_searcher": self.search_documents,
+                "sql_executor": self.execute_sql,
+                "analyzer": self.analyze_data,
+                "synthesizer": self.synthesize_answer,
+            }
+        for name, node in nodes.items():
+            workflow.add_node(name, self._timed(name, node))
+        workflow.add_node("join", self._join)
+
         # Define edges (flow between steps)
+        # Document search and SQL only depend on the plan, so they fan out
+        # after the planner and join again. Each branch returns immediately
+        # when the planner's route doesn't need it, and the analyzer is
+        # skipped through a conditional edge.
         workflow.set_entry_point("planner")
         workflow.add_edge("planner", "doc_searcher")
-        workflow.add_edge("doc_searcher", "sql_executor")
-        workflow.add_edge("sql_executor", "analyzer")
+        workflow.add_edge("planner", "sql_executor")
+        workflow.add_conditional_edges(
+            "join",
+            self._route_after_retrieval,
+            {"analyzer": "analyzer", "synthesizer": "synthesizer"}
+        )
+        workflow.add_edge(["doc_searcher", "sql_executor"], "join")
         workflow.add_edge("analyzer", "synthesizer")
         workflow.add_edge("synthesizer", END)
-        
+
         return workflow.compile()
-    
-    def plan_analysis(self, state: AgentState) -> AgentState:
-        """Step 1: Plan the analysis approach"""
-        print("📋 Planning analysis...")
-        
+
+    # ------------------------------------------------------------------
+    # Routing
+    # ------------------------------------------------------------------
+
+    def _join(self, state: AgentState) -> Dict[str, Any]:
+        """Fan-in point for the document and SQL branches.
+
+        The analyzer is bypassed by the conditional edge rather than run,
+        so its "skipped" path entry is recorded here.
+        """
+        if not self._needs(state, 'analysis'):
+            return self._skipped("analyzer")
+        return {}
+
+    def _route_after_retrieval(self, state: AgentState) -> str:
+        if state.get('route', DEFAULT_ROUTE).get('analysis', True):
+            return "analyzer"
+        return "synthesizer"
+
+    def _needs(self, state: AgentState, step: str) -> bool:
+        return state.get('route', DEFAULT_ROUTE).get(step, True)
+
+    def _node_metadata(self, node: str, *fragments: Dict[str, Any]) -> Dict[str, Any]:
+        metadata = {"path": {node: "ran"}}
+        for fragment in fragments:
+            metadata = deep_merge(metadata, fragment)
+        return metadata
+
+    # ------------------------------------------------------------------
+    # Instrumentation
+    # ------------------------------------------------------------------
+
+    def _timed(self, node: str, fn):
+        """Wrap a node so its wall time lands in metadata['nodes'][node]"""
+        def _with_duration(update: Dict[str, Any], start_time: float) -> Dict[str, Any]:
+            update = dict(update or {})
+            update['metadata'] = deep_merge(
+                update.get('metadata', {}),
+                node_stats(node, duration=time.time() - start_time)
+            )
+            return update
+
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def _async_node(state):
+                start_time = time.time()
+                return _with_duration(await fn(state), start_time)
+            return _async_node
+
+        @functools.wraps(fn)
+        def _node(state):
+            start_time = time.time()
+            return _with_duration(fn(state), start_time)
+        return _node
+
+    def _count_tokens(self, messages: list, content: str, response=None) -> Tuple[int, int]:
+        """Prompt/completion tokens from the API usage, or estimated with tiktoken"""
+        usage = (getattr(response, 'response_metadata', None) or {}).get('token_usage')
+        if usage:
+            return usage.get('prompt_tokens', 0), usage.get('completion_tokens', 0)
+        try:
+            return (self.llm.get_num_tokens_from_messages(messages),
+                    self.llm.get_num_tokens(content))
+        except Exception:
+            prompt_chars = sum(len(m.content) for m in messages)
+            return prompt_chars // 4, len(content) // 4
+
+    def _llm_metadata(self, node: str, messages: list, content: str, response,
+                      start_time: float, cache: Optional[str]) -> Dict[str, Any]:
+        duration = time.time() - start_time
+        if cache == "hit":
+            prompt_tokens, completion_tokens = 0, 0
+        else:
+            prompt_tokens, completion_tokens = self._count_tokens(messages, content, response)
+        metadata = {"llm_cache": {node: cache}} if cache else {}
+        return add_llm_call(metadata, node, duration, prompt_tokens, completion_tokens, cache)
+
+    def _add_llm_metadata(self, node: str, total: Dict[str, Any], call: Dict[str, Any]) -> Dict[str, Any]:
+        """Fold one _call_llm metadata fragment into a node's running totals"""
+        stats = call["nodes"][node]
+        total = add_llm_call(total, node, stats["llm_duration"], stats["prompt_tokens"],
+                             stats["completion_tokens"], stats.get("cache"))
+        return deep_merge(total, {k: v for k, v in call.items() if k != "nodes"})
+
+    def _call_tool(self, node: str, tool: str, arg: str) -> Tuple[str, Dict[str, Any]]:
+        """Run a tool, returning its output and the node's tool stats"""
+        start_time = time.time()
+        result = self.tools[tool]._run(arg)
+        return result, tool_stats(node, tool, result, time.time() - start_time, arg)
+
+    async def _acall_tool(self, node: str, tool: str, arg: str) -> Tuple[str, Dict[str, Any]]:
+        start_time = time.time()
+        result = await self.tools[tool]._arun(arg)
+        return result, tool_stats(node, tool, result, time.time() - start_time, arg)
+
+    def _skipped(self, node: str) -> Dict[str, Any]:
+        print(f"⏭️  Skipping {node} (not needed for this query)")
+        return {"metadata": {"path": {node: "skipped"}}}
+
+    # ------------------------------------------------------------------
+    # LLM calls (through the response cache)
+    # ------------------------------------------------------------------
+
+    def _invoke_llm(self, llm, messages: list, on_token: Optional[Callable[[str], None]] = None):
+        """Return the response content and, when not streaming, the response"""
+        if on_token is None:
+            response = llm.invoke(messages)
+            return response.content, response
+
+        parts = []
+        for chunk in llm.stream(messages):
+            if chunk.content:
+                parts.append(chunk.content)
+                on_token(chunk.content)
+        return "".join(parts), None
+
+    async def _ainvoke_llm(self, llm, messages: list, on_token: Optional[Callable[[str], None]] = None):
+        if on_token is None:
+            response = await llm.ainvoke(messages)
+            return response.content, response
+
+        parts = []
+        async for chunk in llm.astream(messages):
+            if chunk.content:
+                parts.append(chunk.content)
+                on_token(chunk.content)
+        return "".join(parts), None
+
+    def _call_llm(self, node: str, messages: list, json_mode=False,
+                  on_token: Optional[Callable[[str], None]] = None) -> Tuple[str, Dict[str, Any]]:
+        """Invoke the LLM, returning the content and the node's metadata.
+
+        When on_token is given the response is streamed through it (a cached
+        response is passed as a single token).
+        """
+        llm = self.json_llm if json_mode else self.llm
+        start_time = time.time()
+        if self.llm_cache is None:
+            content, response = self._invoke_llm(llm, messages, on_token)
+            return content, self._llm_metadata(node, messages, content, response, start_time, None)
+
+        key = make_cache_key(self._cache_model_tag(json_mode), messages)
+        content = self.llm_cache.get(key)
+        if content is not None:
+            if on_token is not None:
+                on_token(content)
+            return content, self._llm_metadata(node, messages, content, None, start_time, "hit")
+
+        content, response = self._invoke_llm(llm, messages, on_token)
+        self.llm_cache.set(key, content)
+        return content, self._llm_metadata(node, messages, content, response, start_time, "miss")
+
+    async def _acall_llm(self, node: str, messages: list, json_mode=False,
+                         on_token: Optional[Callable[[str], None]] = None) -> Tuple[str, Dict[str, Any]]:
+        """Async version of _call_llm; cache I/O runs on the shared executor"""
+        llm = self.json_llm if json_mode else self.llm
+        start_time = time.time()
+        if self.llm_cache is None:
+            content, response = await self._ainvoke_llm(llm, messages, on_token)
+            return content, self._llm_metadata(node, messages, content, response, start_time, None)
+
+        key = make_cache_key(self._cache_model_tag(json_mode), messages)
+        content = await run_blocking(self.llm_cache.get, key)
+        if content is not None:
+            if on_token is not None:
+                on_token(content)
+            return content, self._llm_metadata(node, messages, content, None, start_time, "hit")
+
+        content, response = await self._ainvoke_llm(llm, messages, on_token)
+        await run_blocking(self.llm_cache.set, key, content)
+        return content, self._llm_metadata(node, messages, content, response, start_time, "miss")
+
+    def _cache_model_tag(self, json_mode: bool) -> str:
+        return f"{self.model_name}:json" if json_mode else self.model_name
+
+    # ------------------------------------------------------------------
+    # Prompts and state updates shared by the sync and async nodes
+    # ------------------------------------------------------------------
+
+    def _plan_messages(self, state: AgentState) -> list:
         prompt = f"""You are a financial data analyst planning how to answer this question.
 
 User query: {state['query']}
@@ -74,26 +355,127 @@ Create a step-by-step analysis plan. Include:
 3. What insights to look for
 4. What context from documents might be relevant
 
-Be specific and actionable. Keep it concise (3-5 steps)."""
+Be specific and actionable. Keep it concise (3-5 steps).
+
+Finish with one last line saying which steps this question needs, in exactly this form:
+ROUTE: {{"documents": true, "sql": true, "analysis": true}}
+- documents: context from risk reports, lending policies or economic outlooks (explanations, "why", policy questions)
+- sql: numbers from the loans/transactions tables
+- analysis: statistics beyond a single SQL query (correlations, trends, multi-step comparisons)"""
 
-        response = self.llm.invoke([
+        return [
             SystemMessage(content="You are an expert financial analyst."),
             HumanMessage(content=prompt)
-        ])
-        
-        state['analysis_plan'] = response.content
-        state['messages'].append({
-            "role": "assistant",
-            "step": "planning",
-            "content": f"**Analysis Plan:**\n{response.content}"
-        })
-        
-        return state
-    
-    def search_documents(self, state: AgentState) -> AgentState:
-        """Step 2: Search for relevant context in documents"""
-        print("📚 Searching internal documents...")
-        
+        ]
+
+    def _plan_update(self, content: str) -> Dict[str, Any]:
+        plan, route = parse_route(content)
+        print(f"   Route: {', '.join(step for step, needed in route.items() if needed) or 'answer directly'}")
+        return {
+            "analysis_plan": plan,
+            "route": route,
+            "messages": [{
+                "role": "assistant",
+                "step": "planning",
+                "content": f"**Analysis Plan:**\n{plan}"
+            }]
+        }
+
+    def _template_plan_update(self, template: Dict[str, Any]) -> Dict[str, Any]:
+        """Deterministic plan for a query matched by the template library"""
+        print(f"   Matched template: {template['name']}")
+        plan = (f"1. Use the pre-written '{template['name']}' template: {template['title']}\n"
+                f"2. Run its SQL and pandas code directly (no code generation)")
+        if not template['numeric_only']:
+            plan += "\n3. Search internal documents for context and explain the results"
+
+        return {
+            "analysis_plan": plan,
+            "route": {"documents": not template['numeric_only'], "sql": True, "analysis": True},
+            "prepared": {
+                "search_query": template['search_query'],
+                "sql": template['sql'],
+                "analysis_code": template['analysis_code'],
+            },
+            "template": template,
+            "messages": [{
+                "role": "assistant",
+                "step": "planning",
+                "content": f"**Analysis Plan:**\n{plan}"
+            }]
+        }
+
+    def _template_answer(self, state: AgentState) -> str:
+        """Final answer for numeric-only template queries, built without the LLM"""
+        analysis = state['analysis_results']
+        if analysis and not analysis.startswith(("Using SQL results", "Analysis step skipped")):
+            return analysis
+        return f"**{state['template']['title']}**\n\n```\n{state['sql_results']}\n```"
+
+    def _schema_block(self, dataframes: bool = False) -> str:
+        """Catalog of the tables for the system prompt, rebuilt only when the data changes"""
+        heading = "Available DataFrames" if dataframes else "Available tables (SQLite)"
+        return (f"{heading}, with column types, ranges and the exact values of categorical columns:\n"
+                f"{schema_prompt(dataframes)}")
+
+    def _fast_plan_messages(self, state: AgentState) -> list:
+        prompt = f"""You are a financial data analyst. Plan how to answer this question and
+prepare every tool input in one go.
+
+User query: {state['query']}
+
+Return a JSON object with exactly these keys:
+- "plan": a concise step-by-step analysis plan (3-5 steps) as one string
+- "route": {{"documents": bool, "sql": bool, "analysis": bool}}
+    documents = needs context from risk reports, lending policies or economic outlooks
+    sql = needs numbers from the loans/transactions tables
+    analysis = needs statistics beyond a single SQL query
+- "search_query": a 3-7 word search for internal documents about WHY trends occurred, or null
+- "sql": one valid SQLite query (dates like BETWEEN '2024-01-01' AND '2024-12-31',
+  aggregations where appropriate), or null
+- "analysis_code": Python using pandas/numpy on loans_df and transactions_df (same
+  columns as the tables, application_date/timestamp already parsed) that stores a
+  formatted string of key findings in a variable called 'result', or null"""
+
+        return [
+            SystemMessage(content=f"""You are an expert financial analyst. Respond only with a JSON object.
+
+{self._schema_block()}"""),
+            HumanMessage(content=prompt)
+        ]
+
+    def _fast_plan_update(self, content: str) -> Dict[str, Any]:
+        """Unpack the single structured planning response.
+
+        Falls back to the regular plan (and per-node LLM calls) if the
+        response is not valid JSON.
+        """
+        try:
+            data = json.loads(content)
+            plan = str(data.get('plan') or '')
+            flags = data.get('route') or {}
+            route = {key: bool(flags.get(key, True)) for key in DEFAULT_ROUTE}
+        except (ValueError, AttributeError):
+            print("   ⚠️ Fast plan was not valid JSON, using step-by-step mode")
+            return self._plan_update(content)
+
+        prepared = {
+            key: data[key].strip() for key in ('search_query', 'sql', 'analysis_code')
+            if isinstance(data.get(key), str) and data[key].strip()
+        }
+        print(f"   Route: {', '.join(step for step, needed in route.items() if needed) or 'answer directly'}")
+        return {
+            "analysis_plan": plan,
+            "route": route,
+            "prepared": prepared,
+            "messages": [{
+                "role": "assistant",
+                "step": "planning",
+                "content": f"**Analysis Plan:**\n{plan}"
+            }]
+        }
+
+    def _doc_search_messages(self, state: AgentState) -> list:
         prompt = f"""Based on this query: {state['query']}
 
 And this analysis plan: {state['analysis_plan']}
@@ -101,73 +483,97 @@ And this analysis plan: {state['analysis_plan']}
 What should we search for in our internal risk reports, lending policies, and economic outlooks?
 Provide a concise search query (3-7 words) to find relevant context about WHY trends might have occurred."""
 
-        response = self.llm.invoke([
+        return [
             SystemMessage(content="You are a research assistant."),
             HumanMessage(content=prompt)
-        ])
-        
-        search_query = response.content.strip()
-        print(f"   Searching for: {search_query}")
-        
-        # Execute document search
-        doc_results = self.tools['docs']._run(search_query)
-        
-        state['document_context'] = doc_results
-        state['messages'].append({
-            "role": "assistant",
-            "step": "document_search",
-            "content": f"**Document Search:** {search_query}\n\nFound relevant context in internal documents."
-        })
-        
-        return state
-    
-    def execute_sql(self, state: AgentState) -> AgentState:
-        """Step 3: Execute SQL queries to get data"""
-        print("🔍 Executing SQL query...")
-        
+        ]
+
+    def _doc_search_update(self, search_query: str, doc_results: str) -> Dict[str, Any]:
+        return {
+            "document_context": doc_results,
+            "messages": [{
+                "role": "assistant",
+                "step": "document_search",
+                "content": f"**Document Search:** {search_query}\n\nFound relevant context in internal documents."
+            }]
+        }
+
+    def _sql_messages(self, state: AgentState) -> list:
         prompt = f"""Based on this analysis plan:
 {state['analysis_plan']}
 
-Available tables and columns:
-- loans: loan_id, application_date, loan_type, amount, interest_rate, term_months, 
-         credit_score, province, customer_age, income, employment_status, defaulted, days_past_due
-- transactions: transaction_id, timestamp, customer_id, type, amount, merchant, is_fraud
-
-Write a SQL query to get the necessary data. 
-IMPORTANT: 
+Write a SQL query to get the necessary data.
+IMPORTANT:
 - Use proper date formatting: BETWEEN '2024-01-01' AND '2024-12-31'
 - Include aggregations where appropriate (AVG, COUNT, SUM)
 - Keep it focused on the user's question
 
 Provide ONLY the SQL query, nothing else."""
 
-        response = self.llm.invoke([
-            SystemMessage(content="You are a SQL expert. Return only valid SQL queries."),
+        return [
+            SystemMessage(content=f"""You are a SQL expert. Return only valid SQL queries.
+
+{self._schema_block()}"""),
             HumanMessage(content=prompt)
-        ])
-        
-        # Clean up the SQL query
-        sql_query = response.content.strip()
-        sql_query = sql_query.replace('```sql', '').replace('```', '').strip()
-        
-        print(f"   Query: {sql_query[:100]}...")
-        
-        # Execute the query
-        results = self.tools['sql']._run(sql_query)
-        
-        state['sql_results'] = results
-        state['messages'].append({
-            "role": "assistant",
-            "step": "sql_execution",
-            "content": f"**SQL Query:**\n```sql\n{sql_query}\n```\n\n**Results:** Retrieved data successfully."
-        })
-        
-        return state
-    
-    def analyze_data(self, state: AgentState) -> AgentState:
-        """Step 4: Perform statistical analysis"""
-        print("📊 Performing statistical analysis...")
-        
+        ]
+
+    def _sql_repair_messages(self, state: AgentState, attempts: List[Dict[str, Any]]) -> list:
+        failures = "\n\n".join(
+            f"Attempt {i}:\n{a['sql']}\nError: {a['error']}" for i, a in enumerate(attempts, 1)
+        )
+        prompt = f"""Based on this analysis plan:
+{state['analysis_plan']}
+
+These SQL queries failed:
+
+{failures}
+
+Fix the last query so it runs on the tables above. Use only the listed columns
+and the exact categorical values shown. If the error says the query is too
+expensive, follow its hint (filter earlier, aggregate, add join conditions).
+
+Provide ONLY the corrected SQL query, nothing else."""
+
+        return [
+            SystemMessage(content=f"""You are a SQL expert. Return only valid SQL queries.
+
+{self._schema_block()}"""),
+            HumanMessage(content=prompt)
+        ]
+
+    def _sql_attempt(self, sql_query: str, results: str, llm_call: Dict[str, Any],
+                     tool_meta: Dict[str, Any]) -> Dict[str, Any]:
+        """Accounting for one generate/repair + execute round"""
+        llm = llm_call.get("nodes", {}).get("sql_executor", {})
+        failed = results.startswith(SQL_ERROR_PREFIX)
+        return {
+            "sql": sql_query,
+            "error": results[len(SQL_ERROR_PREFIX):].split("\n")[0] if failed else None,
+            "llm_duration": llm.get("llm_duration", 0.0),
+            "prompt_tokens": llm.get("prompt_tokens", 0),
+            "completion_tokens": llm.get("completion_tokens", 0),
+            "tool_duration": tool_meta["nodes"]["sql_executor"]["tool_duration"],
+        }
+
+    def _clean_sql(self, content: str) -> str:
+        sql_query = content.strip()
+        return sql_query.replace('```sql', '').replace('```', '').strip()
+
+    def _sql_repair_stats(self, attempts: List[Dict[str, Any]]) -> Dict[str, Any]:
+        return node_stats("sql_executor", sql_attempts=attempts, sql_repairs=len(attempts) - 1,
+                          sql_failed=attempts[-1]["error"] is not None)
+
+    def _sql_update(self, sql_query: str, results: str) -> Dict[str, Any]:
+        return {
+            "sql_results": results,
+            "messages": [{
+                "role": "assistant",
+                "step": "sql_execution",
+                "content": f"**SQL Query:**\n```sql\n{sql_query}\n```\n\n**Results:** Retrieved data successfully."
+            }]
+        }
+
+    def _analysis_messages(self, state: AgentState) -> list:
         prompt = f"""Based on these SQL results:
     {state['sql_results'][:1000]}
 
@@ -175,10 +581,7 @@ Provide ONLY the SQL query, nothing else."""
     {state['analysis_plan']}
 
     Write Python code using pandas and numpy to compute relevant statistics, trends, or comparisons.
-    You have access to:
-    - loans_df: DataFrame with columns: loan_id, application_date, loan_type, amount, interest_rate, 
-    term_months, credit_score, province, customer_age, income, employment_status, defaulted, days_past_due
-    - transactions_df: DataFrame with columns: transaction_id, timestamp, customer_id, type, amount, merchant, is_fraud
+    You have access to the loans_df and transactions_df DataFrames described above.
 
     CRITICAL - Use EXACT column names:
     - For loans: 'defaulted' (not 'default_status'), 'amount' (not 'loan_amount')
@@ -193,42 +596,34 @@ Provide ONLY the SQL query, nothing else."""
 
     Provide ONLY Python code, nothing else."""
 
-        response = self.llm.invoke([
-            SystemMessage(content="You are a Python data analysis expert."),
+        return [
+            SystemMessage(content=f"""You are a Python data analysis expert.
+
+{self._schema_block(dataframes=True)}"""),
             HumanMessage(content=prompt)
-        ])
-        
-        # Clean up code
-        code = response.content.strip()
-        code = code.replace('```python', '').replace('```', '').strip()
-        
-        print(f"   Executing analysis code...")
-        
-        # Execute analysis
-        try:
-            analysis_results = self.tools['analysis']._run(code)
-            
-            # If analysis failed but we have SQL results, use those
-            if "Error in analysis" in analysis_results and state['sql_results']:
-                analysis_results = "Using SQL results directly: " + state['sql_results'][:500]
-                
-        except Exception as e:
-            # Fallback: use SQL results if analysis fails
-            analysis_results = f"Analysis step skipped. Using SQL results: {state['sql_results'][:500]}"
-        
-        state['analysis_results'] = analysis_results
-        state['messages'].append({
-            "role": "assistant",
-            "step": "analysis",
-            "content": f"**Statistical Analysis:**\n{analysis_results}"
-        })
-        
-        return state
-    
-    def synthesize_answer(self, state: AgentState) -> AgentState:
-        """Step 5: Synthesize comprehensive answer"""
-        print("✨ Synthesizing final answer...")
-        
+        ]
+
+    def _clean_code(self, content: str) -> str:
+        code = content.strip()
+        return code.replace('```python', '').replace('```', '').strip()
+
+    def _analysis_fallback(self, state: AgentState, analysis_results: str) -> str:
+        # If analysis failed but we have SQL results, use those
+        if "Error in analysis" in analysis_results and state['sql_results']:
+            return "Using SQL results directly: " + state['sql_results'][:500]
+        return analysis_results
+
+    def _analysis_update(self, analysis_results: str) -> Dict[str, Any]:
+        return {
+            "analysis_results": analysis_results,
+            "messages": [{
+                "role": "assistant",
+                "step": "analysis",
+                "content": f"**Statistical Analysis:**\n{analysis_results}"
+            }]
+        }
+
+    def _synthesis_messages(self, state: AgentState) -> list:
         prompt = f"""User asked: {state['query']}
 
 You have gathered the following information:
@@ -259,59 +654,601 @@ Format:
 
 Keep it concise (200-300 words) but comprehensive."""
 
-        response = self.llm.invoke([
+        return [
             SystemMessage(content="You are a senior financial analyst presenting findings to business stakeholders."),
             HumanMessage(content=prompt)
-        ])
-        
-        state['final_answer'] = response.content
-        state['messages'].append({
-            "role": "assistant",
-            "step": "final_answer",
-            "content": response.content
-        })
-        
-        return state
-    
-    def run(self, query: str) -> dict:
-        """Run the agent on a query"""
-        print(f"\n{'='*60}")
-        print(f"🤖 Processing Query: {query}")
-        print(f"{'='*60}\n")
-        
-        start_time = time.time()
-        run_id = str(uuid.uuid4())
-        
-        initial_state = {
+        ]
+
+    def _synthesis_update(self, answer: str) -> Dict[str, Any]:
+        return {
+            "final_answer": answer,
+            "messages": [{
+                "role": "assistant",
+                "step": "final_answer",
+                "content": answer
+            }]
+        }
+
+    # ------------------------------------------------------------------
+    # Graph nodes (sync)
+    # ------------------------------------------------------------------
+
+    def plan_analysis(self, state: AgentState) -> Dict[str, Any]:
+        """Step 1: Plan the analysis approach"""
+        print("📋 Planning analysis...")
+
+        template = match_template(state['query']) if self.use_templates else None
+        if template is not None:
+            llm_meta = {"template": template['name']}
+            update = self._template_plan_update(template)
+        elif state.get('fast_mode'):
+            content, llm_meta = self._call_llm("planner", self._fast_plan_messages(state), json_mode=True)
+            update = self._fast_plan_update(content)
+        else:
+            content, llm_meta = self._call_llm("planner", self._plan_messages(state))
+            update = self._plan_update(content)
+
+        return {
+            **update,
+            "metadata": self._node_metadata("planner", llm_meta)
+        }
+
+    def search_documents(self, state: AgentState) -> Dict[str, Any]:
+        """Step 2: Search for relevant context in documents"""
+        if not self._needs(state, "documents"):
+            return self._skipped("doc_searcher")
+
+        print("📚 Searching internal documents...")
+
+        search_query = state.get('prepared', {}).get('search_query')
+        llm_meta = {}
+        if not search_query:
+            content, llm_meta = self._call_llm("doc_searcher", self._doc_search_messages(state))
+            search_query = content.strip()
+        print(f"   Searching for: {search_query}")
+
+        # Execute document search
+        doc_results, tool_meta = self._call_tool("doc_searcher", 'docs', search_query)
+
+        return {
+            **self._doc_search_update(search_query, doc_results),
+            "metadata": self._node_metadata("doc_searcher", llm_meta, tool_meta)
+        }
+
+    def execute_sql(self, state: AgentState) -> Dict[str, Any]:
+        """Step 3: Execute SQL queries to get data"""
+        if not self._needs(state, "sql"):
+            return self._skipped("sql_executor")
+
+        print("🔍 Executing SQL query...")
+
+        # Fast mode already generated the SQL during planning
+        sql_query = state.get('prepared', {}).get('sql')
+        llm_meta = {}
+        if not sql_query:
+            content, llm_meta = self._call_llm("sql_executor", self._sql_messages(state))
+            sql_query = content
+        sql_query = self._clean_sql(sql_query)
+        print(f"   Query: {sql_query[:100]}...")
+
+        # Execute the query, sending errors back to the LLM for a fix
+        results, tool_meta = self._call_tool("sql_executor", 'sql', sql_query)
+        attempts = [self._sql_attempt(sql_query, results, llm_meta, tool_meta)]
+        while attempts[-1]["error"] and len(attempts) <= self.sql_repair_attempts:
+            print(f"   🔧 Query failed ({attempts[-1]['error'][:80]}), "
+                  f"repair {len(attempts)}/{self.sql_repair_attempts}...")
+            content, call_meta = self._call_llm("sql_executor", self._sql_repair_messages(state, attempts))
+            llm_meta = self._add_llm_metadata("sql_executor", llm_meta, call_meta)
+            sql_query = self._clean_sql(content)
+            results, tool_meta = self._call_tool("sql_executor", 'sql', sql_query)
+            attempts.append(self._sql_attempt(sql_query, results, call_meta, tool_meta))
+
+        return {
+            **self._sql_update(sql_query, results),
+            "metadata": self._node_metadata("sql_executor", llm_meta, tool_meta,
+                                            self._sql_repair_stats(attempts))
+        }
+
+    def analyze_data(self, state: AgentState) -> Dict[str, Any]:
+        """Step 4: Perform statistical analysis"""
+        print("📊 Performing statistical analysis...")
+
+        code = state.get('prepared', {}).get('analysis_code')
+        llm_meta = {}
+        if not code:
+            content, llm_meta = self._call_llm("analyzer", self._analysis_messages(state))
+            code = content
+        code = self._clean_code(code)
+        print(f"   Executing analysis code...")
+
+        # Execute analysis
+        tool_meta = {}
+        try:
+            analysis_results, tool_meta = self._call_tool("analyzer", 'analysis', code)
+            analysis_results = self._analysis_fallback(state, analysis_results)
+        except Exception as e:
+            # Fallback: use SQL results if analysis fails
+            analysis_results = f"Analysis step skipped. Using SQL results: {state['sql_results'][:500]}"
+
+        return {
+            **self._analysis_update(analysis_results),
+            "metadata": self._node_metadata("analyzer", llm_meta, tool_meta)
+        }
+
+    def synthesize_answer(self, state: AgentState) -> Dict[str, Any]:
+        """Step 5: Synthesize comprehensive answer"""
+        print("✨ Synthesizing final answer...")
+
+        on_token = self._token_sinks.get(state['run_id'])
+        if state.get('template', {}).get('numeric_only'):
+            # Template queries that only ask for numbers need no LLM at all
+            answer, llm_meta = self._template_answer(state), {}
+            if on_token is not None:
+                on_token(answer)
+        else:
+            answer, llm_meta = self._call_llm(
+                "synthesizer", self._synthesis_messages(state), on_token=on_token
+            )
+
+        return {
+            **self._synthesis_update(answer),
+            "metadata": self._node_metadata("synthesizer", llm_meta)
+        }
+
+    # ------------------------------------------------------------------
+    # Graph nodes (async)
+    # ------------------------------------------------------------------
+
+    async def aplan_analysis(self, state: AgentState) -> Dict[str, Any]:
+        """Step 1 (async): Plan the analysis approach"""
+        print("📋 Planning analysis...")
+
+        template = match_template(state['query']) if self.use_templates else None
+        if template is not None:
+            llm_meta = {"template": template['name']}
+            update = self._template_plan_update(template)
+        elif state.get('fast_mode'):
+            content, llm_meta = await self._acall_llm("planner", self._fast_plan_messages(state), json_mode=True)
+            update = self._fast_plan_update(content)
+        else:
+            content, llm_meta = await self._acall_llm("planner", self._plan_messages(state))
+            update = self._plan_update(content)
+
+        return {
+            **update,
+            "metadata": self._node_metadata("planner", llm_meta)
+        }
+
+    async def asearch_documents(self, state: AgentState) -> Dict[str, Any]:
+        """Step 2 (async): Search for relevant context in documents"""
+        if not self._needs(state, "documents"):
+            return self._skipped("doc_searcher")
+
+        print("📚 Searching internal documents...")
+
+        search_query = state.get('prepared', {}).get('search_query')
+        llm_meta = {}
+        if not search_query:
+            content, llm_meta = await self._acall_llm("doc_searcher", self._doc_search_messages(state))
+            search_query = content.strip()
+        print(f"   Searching for: {search_query}")
+
+        doc_results, tool_meta = await self._acall_tool("doc_searcher", 'docs', search_query)
+
+        return {
+            **self._doc_search_update(search_query, doc_results),
+            "metadata": self._node_metadata("doc_searcher", llm_meta, tool_meta)
+        }
+
+    async def aexecute_sql(self, state: AgentState) -> Dict[str, Any]:
+        """Step 3 (async): Execute SQL queries to get data"""
+        if not self._needs(state, "sql"):
+            return self._skipped("sql_executor")
+
+        print("🔍 Executing SQL query...")
+
+        # Fast mode already generated the SQL during planning
+        sql_query = state.get('prepared', {}).get('sql')
+        llm_meta = {}
+        if not sql_query:
+            content, llm_meta = await self._acall_llm("sql_executor", self._sql_messages(state))
+            sql_query = content
+        sql_query = self._clean_sql(sql_query)
+        print(f"   Query: {sql_query[:100]}...")
+
+        results, tool_meta = await self._acall_tool("sql_executor", 'sql', sql_query)
+        attempts = [self._sql_attempt(sql_query, results, llm_meta, tool_meta)]
+        while attempts[-1]["error"] and len(attempts) <= self.sql_repair_attempts:
+            print(f"   🔧 Query failed ({attempts[-1]['error'][:80]}), "
+                  f"repair {len(attempts)}/{self.sql_repair_attempts}...")
+            content, call_meta = await self._acall_llm(
+                "sql_executor", self._sql_repair_messages(state, attempts)
+            )
+            llm_meta = self._add_llm_metadata("sql_executor", llm_meta, call_meta)
+            sql_query = self._clean_sql(content)
+            results, tool_meta = await self._acall_tool("sql_executor", 'sql', sql_query)
+            attempts.append(self._sql_attempt(sql_query, results, call_meta, tool_meta))
+
+        return {
+            **self._sql_update(sql_query, results),
+            "metadata": self._node_metadata("sql_executor", llm_meta, tool_meta,
+                                            self._sql_repair_stats(attempts))
+        }
+
+    async def aanalyze_data(self, state: AgentState) -> Dict[str, Any]:
+        """Step 4 (async): Perform statistical analysis"""
+        print("📊 Performing statistical analysis...")
+
+        code = state.get('prepared', {}).get('analysis_code')
+        llm_meta = {}
+        if not code:
+            content, llm_meta = await self._acall_llm("analyzer", self._analysis_messages(state))
+            code = content
+        code = self._clean_code(code)
+        print(f"   Executing analysis code...")
+
+        try:
+            analysis_results, tool_meta = await self._acall_tool("analyzer", 'analysis', code)
+            analysis_results = self._analysis_fallback(state, analysis_results)
+        except Exception as e:
+            analysis_results = f"Analysis step skipped. Using SQL results: {state['sql_results'][:500]}"
+
+        return {
+            **self._analysis_update(analysis_results),
+            "metadata": self._node_metadata("analyzer", llm_meta, tool_meta)
+        }
+
+    async def asynthesize_answer(self, state: AgentState) -> Dict[str, Any]:
+        """Step 5 (async): Synthesize comprehensive answer"""
+        print("✨ Synthesizing final answer...")
+
+        on_token = self._token_sinks.get(state['run_id'])
+        if state.get('template', {}).get('numeric_only'):
+            # Template queries that only ask for numbers need no LLM at all
+            answer, llm_meta = self._template_answer(state), {}
+            if on_token is not None:
+                on_token(answer)
+        else:
+            answer, llm_meta = await self._acall_llm(
+                "synthesizer", self._synthesis_messages(state), on_token=on_token
+            )
+
+        return {
+            **self._synthesis_update(answer),
+            "metadata": self._node_metadata("synthesizer", llm_meta)
+        }
+
+    # ------------------------------------------------------------------
+    # Entry points
+    # ------------------------------------------------------------------
+
+    def _initial_state(self, query: str, fast_mode: bool = False) -> AgentState:
+        return {
             "messages": [],
             "query": query,
-            "run_id": run_id,
+            "run_id": str(uuid.uuid4()),
             "analysis_plan": "",
             "document_context": "",
             "sql_results": "",
             "analysis_results": "",
             "visualization": "",
             "final_answer": "",
+            "route": dict(DEFAULT_ROUTE),
+            "fast_mode": fast_mode,
+            "prepared": {},
+            "template": {},
             "metadata": {
-                "start_time": start_time,
-                "model": "gpt-4o-mini"
+                "fast_mode": fast_mode,
+                "start_time": time.time(),
+                "model": self.model_name
             }
         }
-        
+
+    def _use_semantic_cache(self, query: str) -> bool:
+        """Template queries skip the cache: they are answered exactly and cheaply"""
+        if self.semantic_cache is None:
+            return False
+        return not (self.use_templates and match_template(query) is not None)
+
+    def _semantic_lookup(self, query: str) -> Tuple[Optional[List[float]], Optional[Dict[str, Any]]]:
+        """Embed the query and look for a cached answer to a similar one"""
+        if not self._use_semantic_cache(query):
+            return None, None
+        try:
+            embedding = self.semantic_cache.embeddings.embed_query(query)
+            return embedding, self.semantic_cache.lookup(embedding, query)
+        except Exception as e:
+            print(f"⚠️ Semantic cache unavailable: {e}")
+            return None, None
+
+    async def _asemantic_lookup(self, query: str) -> Tuple[Optional[List[float]], Optional[Dict[str, Any]]]:
+        if not self._use_semantic_cache(query):
+            return None, None
+        try:
+            embedding = await self.semantic_cache.embeddings.aembed_query(query)
+            return embedding, await run_blocking(self.semantic_cache.lookup, embedding, query)
+        except Exception as e:
+            print(f"⚠️ Semantic cache unavailable: {e}")
+            return None, None
+
+    def _semantic_store(self, query: str, embedding: Optional[List[float]], final_state: AgentState) -> None:
+        if self.semantic_cache is None or embedding is None:
+            return
+        try:
+            self.semantic_cache.store(query, embedding, final_state)
+        except Exception as e:
+            print(f"⚠️ Could not store answer in semantic cache: {e}")
+
+    def _from_semantic_cache(self, initial_state: AgentState, hit: Dict[str, Any]) -> AgentState:
+        """Build a final state from a cached answer, recording its provenance"""
+        provenance = hit['provenance']
+        print(f"♻️ Reusing answer to: {provenance['original_query']} "
+              f"(similarity {provenance['similarity']:.3f})")
+
+        cached_state = {**initial_state, **hit['state']}
+        cached_state['metadata']['semantic_cache'] = {"hit": True, **provenance}
+        return cached_state
+
+    def _finish(self, final_state: AgentState) -> AgentState:
+        duration = time.time() - final_state['metadata']['start_time']
+        final_state['metadata']['duration'] = duration
+        final_state['metadata']['success'] = True
+        final_state['metadata'].setdefault('semantic_cache', {"hit": False})
+
+        path = final_state['metadata'].get('path', {})
+        final_state['metadata']['path_taken'] = [n for n in NODE_ORDER if path.get(n) == "ran"]
+
+        cache_stats = list(final_state['metadata'].get('llm_cache', {}).values())
+        final_state['metadata']['llm_cache_hits'] = cache_stats.count('hit')
+        final_state['metadata']['llm_cache_misses'] = cache_stats.count('miss')
+        final_state['metadata'].update(summarize(final_state['metadata']))
+        write_trace(final_state)
+
+        print(f"\n✅ Analysis complete in {duration:.2f}s")
+        print(f"{'='*60}\n")
+
+        return final_state
+
+    def _fail(self, initial_state: AgentState, error: Exception) -> None:
+        print(f"\n❌ Error: {str(error)}\n")
+        initial_state['metadata']['duration'] = time.time() - initial_state['metadata']['start_time']
+        initial_state['metadata']['success'] = False
+        initial_state['metadata']['error'] = str(error)
+        write_trace(initial_state)
+
+    def run(self, query: str, fast_mode: Optional[bool] = None) -> dict:
+        """Run the agent on a query.
+
+        fast_mode merges planning, document-query and SQL generation into one
+        structured LLM call (defaults to the agent's setting).
+        """
+        print(f"\n{'='*60}")
+        print(f"🤖 Processing Query: {query}")
+        print(f"{'='*60}\n")
+
+        initial_state = self._initial_state(
+            query, self.fast_mode if fast_mode is None else fast_mode
+        )
+
+        embedding, hit = self._semantic_lookup(query)
+        if hit is not None:
+            return self._finish(self._from_semantic_cache(initial_state, hit))
+
         try:
             final_state = self.graph.invoke(initial_state)
-            
-            duration = time.time() - start_time
-            final_state['metadata']['duration'] = duration
-            final_state['metadata']['success'] = True
-            
-            print(f"\n✅ Analysis complete in {duration:.2f}s")
-            print(f"{'='*60}\n")
-            
-            return final_state
-            
+            self._semantic_store(query, embedding, final_state)
+            return self._finish(final_state)
+
+        except Exception as e:
+            self._fail(initial_state, e)
+            raise
+
+    async def arun(self, query: str, fast_mode: Optional[bool] = None) -> dict:
+        """Run the agent on a query without blocking the event loop"""
+        print(f"\n{'='*60}")
+        print(f"🤖 Processing Query: {query}")
+        print(f"{'='*60}\n")
+
+        initial_state = self._initial_state(
+            query, self.fast_mode if fast_mode is None else fast_mode
+        )
+
+        embedding, hit = await self._asemantic_lookup(query)
+        if hit is not None:
+            return self._finish(self._from_semantic_cache(initial_state, hit))
+
+        try:
+            final_state = await self.async_graph.ainvoke(initial_state)
+            await run_blocking(self._semantic_store, query, embedding, final_state)
+            return self._finish(final_state)
+
         except Exception as e:
-            print(f"\n❌ Error: {str(e)}\n")
-            initial_state['metadata']['success'] = False
-            initial_state['metadata']['error'] = str(e)
-            raise
\ No newline at end of file
+            self._fail(initial_state, e)
+            raise
+
+    def _stream_event(self, node: str, update: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if node == "join":
+            # The join only reports the analyzer, when the route bypasses it
+            if not update:
+                return None
+            node = "analyzer"
+        status = (update or {}).get('metadata', {}).get('path', {}).get(node, "ran")
+        return {"type": "node", "node": node, "status": status, "update": update or {}}
+
+    def stream(self, query: str, fast_mode: Optional[bool] = None) -> Iterator[Dict[str, Any]]:
+        """Run the agent on a query, yielding progress events as they happen.
+
+        Events are dicts with a "type" of:
+        - "node": a graph node finished; has "node", "status" (ran/skipped)
+          and the state "update" it wrote
+        - "token": a chunk of the synthesizer's answer in "content"
+        - "result": the final state in "result" (always the last event)
+        Errors from the graph are re-raised.
+        """
+        print(f"\n{'='*60}")
+        print(f"🤖 Processing Query (streaming): {query}")
+        print(f"{'='*60}\n")
+
+        initial_state = self._initial_state(
+            query, self.fast_mode if fast_mode is None else fast_mode
+        )
+
+        embedding, hit = self._semantic_lookup(query)
+        if hit is not None:
+            result = self._finish(self._from_semantic_cache(initial_state, hit))
+            yield {"type": "token", "content": result['final_answer']}
+            yield {"type": "result", "result": result}
+            return
+
+        events = queue.Queue()
+        done = object()
+        run_id = initial_state['run_id']
+        self._token_sinks[run_id] = lambda token: events.put({"type": "token", "content": token})
+
+        def _drive():
+            try:
+                for chunk in self.graph.stream(initial_state, output_keys=NODE_ORDER + ["join", END]):
+                    for key, value in chunk.items():
+                        event = None if key == END else self._stream_event(key, value)
+                        if key == END:
+                            events.put({"type": "_final", "state": value})
+                        elif event is not None:
+                            events.put(event)
+            except Exception as e:
+                events.put({"type": "_error", "error": e})
+            finally:
+                events.put(done)
+
+        threading.Thread(target=_drive, daemon=True).start()
+
+        final_state, error = None, None
+        try:
+            while True:
+                event = events.get()
+                if event is done:
+                    break
+                if event['type'] == "_final":
+                    final_state = event['state']
+                elif event['type'] == "_error":
+                    error = event['error']
+                else:
+                    yield event
+        finally:
+            self._token_sinks.pop(run_id, None)
+
+        if error is not None:
+            self._fail(initial_state, error)
+            raise error
+
+        self._semantic_store(query, embedding, final_state)
+        yield {"type": "result", "result": self._finish(final_state)}
+
+    async def astream(self, query: str, fast_mode: Optional[bool] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Async version of stream, built on the async graph"""
+        print(f"\n{'='*60}")
+        print(f"🤖 Processing Query (streaming): {query}")
+        print(f"{'='*60}\n")
+
+        initial_state = self._initial_state(
+            query, self.fast_mode if fast_mode is None else fast_mode
+        )
+
+        embedding, hit = await self._asemantic_lookup(query)
+        if hit is not None:
+            result = self._finish(self._from_semantic_cache(initial_state, hit))
+            yield {"type": "token", "content": result['final_answer']}
+            yield {"type": "result", "result": result}
+            return
+
+        events = asyncio.Queue()
+        done = object()
+        run_id = initial_state['run_id']
+        self._token_sinks[run_id] = lambda token: events.put_nowait({"type": "token", "content": token})
+
+        async def _drive():
+            final_state = None
+            try:
+                async for chunk in self.async_graph.astream(initial_state, output_keys=NODE_ORDER + ["join", END]):
+                    for key, value in chunk.items():
+                        event = None if key == END else self._stream_event(key, value)
+                        if key == END:
+                            final_state = value
+                        elif event is not None:
+                            events.put_nowait(event)
+                return final_state
+            finally:
+                events.put_nowait(done)
+
+        task = asyncio.ensure_future(_drive())
+        try:
+            while True:
+                event = await events.get()
+                if event is done:
+                    break
+                yield event
+            final_state = await task
+        except Exception as e:
+            self._fail(initial_state, e)
+            raise
+        finally:
+            self._token_sinks.pop(run_id, None)
+            task.cancel()
+
+        await run_blocking(self._semantic_store, query, embedding, final_state)
+        yield {"type": "result", "result": self._finish(final_state)}
+
+    async def arun_batch(self, queries: Iterable[str], max_concurrency: int = 8) -> AsyncIterator[Dict[str, Any]]:
+        """Run many queries concurrently, yielding each result as it completes.
+
+        All pipelines share this agent's LLM client and vector store, and the
+        loans/transactions DataFrames are loaded once for the whole batch.
+        Each item has the query's position in the input, the query, the final
+        state (or None), the error (or None) and the query's duration.
+        """
+        queries = list(queries)
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def _run_one(index: int, query: str) -> Dict[str, Any]:
+            async with semaphore:
+                start_time = time.time()
+                result, error = None, None
+                try:
+                    result = await self.arun(query)
+                except Exception as e:
+                    error = str(e)
+                return {
+                    "index": index,
+                    "query": query,
+                    "result": result,
+                    "error": error,
+                    "duration": time.time() - start_time
+                }
+
+        frames = await run_blocking(DataAnalysisTool.load_frames)
+        if DataAnalysisTool._worker_pool is not None:
+            await run_blocking(DataAnalysisTool._worker_pool.prefork)
+        with DataAnalysisTool.share_frames(frames):
+            tasks = [asyncio.ensure_future(_run_one(i, q)) for i, q in enumerate(queries)]
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    yield await next_done
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+    def run_batch(self, queries: Iterable[str], max_concurrency: int = 8) -> Iterator[Dict[str, Any]]:
+        """Synchronous wrapper around arun_batch, yielding in completion order"""
+        # Reuse one loop per agent so the async OpenAI client stays bound to it
+        if self._batch_loop is None or self._batch_loop.is_closed():
+            self._batch_loop = asyncio.new_event_loop()
+        loop = self._batch_loop
+
+        batch = self.arun_batch(queries, max_concurrency=max_concurrency)
+        try:
+            while True:
+                try:
+                    yield loop.run_until_complete(batch.__anext__())
+                except StopAsyncIteration:
+                    break
+        finally:
+            loop.run_until_complete(batch.aclose())
@@ -0,0 +1,340 @@
+"""Deterministic fast path for common portfolio questions.
+
+A handful of question shapes over the loans table make up most traffic:
+default rate by province / loan type / period, averages by a dimension, and
+credit-score band vs default. `match_template` recognises those shapes with
+simple keyword rules and returns pre-written SQL and pandas code, so the
+agent can skip LLM planning, SQL generation and code generation for them.
+A question must name both the metric (a default rate, or an average of a
+loan column) and the grouping ("by province", "quarterly", "Q1 vs Q2"),
+and every period it mentions must be one the template can filter on.
+Anything ambiguous (several dimensions, transactions, no clear grouping,
+months or relative periods) returns None and goes through the normal LLM
+pipeline.
+"""
+import re
+from typing import Any, Dict, List, Optional
+
+from utils.rollups import CREDIT_BAND_SQL, QUARTER_SQL
+from utils.schema_catalog import mentioned_values
+
+CREDIT_BAND_PANDAS = ("pd.cut(df['credit_score'], bins=[0, 600, 650, 700, 750, 10000], right=False, "
+                      "labels=['1. <600', '2. 600-649', '3. 650-699', '4. 700-749', '5. 750+']).astype(str)")
+
+# Grouping dimensions: label, SQL expression, pandas key expression, and
+# whether results are ordered by the key (time) or by the value
+DIMENSIONS = {
+    'province': {
+        'label': 'province',
+        'sql': 'province',
+        'pandas': "df['province']",
+        'ordered': False,
+    },
+    'loan_type': {
+        'label': 'loan type',
+        'sql': 'loan_type',
+        'pandas': "df['loan_type']",
+        'ordered': False,
+    },
+    'employment_status': {
+        'label': 'employment status',
+        'sql': 'employment_status',
+        'pandas': "df['employment_status']",
+        'ordered': False,
+    },
+    'quarter': {
+        'label': 'quarter',
+        'sql': QUARTER_SQL,
+        'pandas': "df['application_date'].dt.to_period('Q').astype(str).str.replace('Q', '-Q')",
+        'ordered': True,
+    },
+    'month': {
+        'label': 'month',
+        'sql': "strftime('%Y-%m', application_date)",
+        'pandas': "df['application_date'].dt.strftime('%Y-%m')",
+        'ordered': True,
+    },
+    'year': {
+        'label': 'year',
+        'sql': "strftime('%Y', application_date)",
+        'pandas': "df['application_date'].dt.strftime('%Y')",
+        'ordered': True,
+    },
+    'credit_band': {
+        'label': 'credit score band',
+        'sql': CREDIT_BAND_SQL,
+        'pandas': CREDIT_BAND_PANDAS,
+        'ordered': True,
+    },
+}
+
+# Dimension nouns; they only group when a cue such as "by" or "per" precedes them
+_DIMENSION_NOUNS = [
+    ('province', r'(provinces?|regions?)'),
+    ('loan_type', r'(loan types?|types? of loans?|loan products?|products?)'),
+    ('employment_status', r'(employment(?: status(?:es)?| types?)?)'),
+    ('quarter', r'(quarters?)'),
+    ('month', r'(months?)'),
+    ('year', r'(years?)'),
+]
+_GROUPING_CUE = r'\b(by|per|across|each|every|which|between|among)\s+(the\s+|each\s+|every\s+|all\s+|different\s+)?'
+_QUARTER_REF = r'\bq[1-4]\b(\s*20\d{2})?'
+_COMPARED = r'\s*(vs\.?|versus|and|or|to|compared (to|with)|against|,)\s*'
+
+# Words that group on their own
+_DIMENSION_WORDS = [
+    ('province', r'\b(provincial|regional)\b'),
+    ('quarter', r'\bquarterly\b'),
+    ('month', r'\b(monthly|seasonal|seasonality)\b'),
+    ('year', r'\b(yearly|annual|annually|year over year)\b'),
+]
+# Compared periods group by that period, unless another dimension is asked
+# for ("monthly default rate in Q4 2023 vs Q1 2024")
+_PERIOD_COMPARISONS = [
+    ('quarter', _QUARTER_REF + _COMPARED + _QUARTER_REF),
+    ('year', r'\b20\d{2}' + _COMPARED + r'20\d{2}\b'),
+]
+
+_DIMENSION_PATTERNS = [(name, _GROUPING_CUE + noun + r'\b') for name, noun in _DIMENSION_NOUNS] + _DIMENSION_WORDS
+
+# A default rate (or count of defaults), not just the word "default"
+_DEFAULT_METRIC = re.compile(
+    r'\bdefault(s|ed|ing)?\s+(rates?|ratios?|percentages?|levels?|counts?)\b|'
+    r'\b(rates?|percentages?|share|numbers?|counts?) of defaults?\b|\bdefaults\b|\bdefaulted\b|\bdefaulting\b'
+)
+# Credit score vs default, asked without the word "rate"
+_CREDIT_VS_DEFAULT = re.compile(
+    r'\bcredit scores?( bands?)?\b.*\b(vs\.?|versus|against|relat\w*|affect\w*|impact\w*)\b.*\bdefault|'
+    r'\bdefault\w*\b.*\b(by|vs\.?|versus|across|per|against)\s+(credit scores?|credit score bands?)\b'
+)
+
+# Periods the templates can't filter on: month names, halves, relative ranges
+_UNSUPPORTED_PERIOD = re.compile(
+    r'\b(january|february|march|april|june|july|august|september|october|november|december|'
+    r'jan|feb|mar|apr|jun|jul|aug|sept?|oct|nov|dec|may\s+20\d{2}|h[12]|ytd|year to date|'
+    r'last|this|past|previous|prior|current|recent|since|before|after|until|through)\b'
+)
+
+# Averaged metrics: column, phrase pattern, display label and value format
+METRICS = [
+    ('amount', r'\b(loan amounts?|amounts?|loan sizes?)\b', 'average loan amount', '${:,.0f}'),
+    ('interest_rate', r'\binterest rates?\b', 'average interest rate', '{:.2f}%'),
+    ('credit_score', r'\bcredit scores?\b', 'average credit score', '{:.0f}'),
+    ('income', r'\bincomes?\b', 'average income', '${:,.0f}'),
+]
+
+# Words that mean the user wants an explanation, not just the numbers
+_EXPLANATION_PATTERN = re.compile(
+    r'\b(why|explain|explanation|cause[sd]?|reasons?|drivers?|driven|policy|policies|recommend\w*|root)\b'
+)
+
+# Questions about these are outside the templates
+_UNSUPPORTED_PATTERN = re.compile(r'\b(transactions?|fraud|merchants?|correlat\w*|factors?|predict\w*)\b')
+
+# Thresholds and qualifiers that restrict which loans are counted; the
+# templates only filter on dates, so these go to the LLM
+_FILTER_PATTERN = re.compile(
+    r'\b(over|under|above|below|more than|less than|greater than|fewer than|at least|at most'
+    r'|exceed\w*|between|among|amongst|excluding|exclude[sd]?|except|only|where|whose|without|not|non)\b'
+    r'|(?<!compared )\bwith\b'
+    r'|\bfor\b[^,.?]*\b(loans?|borrowers?|customers?|clients?|applicants?)\b(?!\s+(types?|products?))'
+)
+
+# Years and quarter/half names are periods; any other number is a threshold
+_PERIOD_NUMBER = re.compile(r'\b(20\d{2}|q[1-4]|h[12])\b')
+
+
+def _period_range(year: int, quarter: Optional[int] = None) -> Dict[str, str]:
+    if quarter is None:
+        return {'start': f"{year}-01-01", 'end': f"{year + 1}-01-01", 'label': str(year)}
+    start_month = 3 * (quarter - 1) + 1
+    end = f"{year + 1}-01-01" if quarter == 4 else f"{year}-{start_month + 3:02d}-01"
+    return {'start': f"{year}-{start_month:02d}-01", 'end': end, 'label': f"Q{quarter} {year}"}
+
+
+def _date_filter(query: str, dimension: str) -> Optional[Dict[str, Any]]:
+    """The years or quarters the query asks about, as date ranges.
+
+    Returns {} for no restriction and None when the periods can't be
+    honoured by a one-dimension template: several periods compared across
+    a non-time dimension, or a quarter without a year.
+    """
+    if _UNSUPPORTED_PERIOD.search(query):
+        return None
+    years = sorted({int(y) for y in re.findall(r'\b(20\d{2})\b', query)})
+    quarters = re.findall(r'\bq([1-4])\b(?:\s*(20\d{2}))?', query)
+
+    ranges = []
+    for quarter, year in quarters:
+        if not year:
+            # "Q1 vs Q2 2024": a bare quarter takes the only year mentioned
+            if len(years) != 1:
+                return None
+            year = years[0]
+        ranges.append(_period_range(int(year), int(quarter)))
+    # Years not already narrowed to quarters are periods of their own
+    used = {int(year) for _, year in quarters if year} | ({years[0]} if any(not y for _, y in quarters) else set())
+    ranges.extend(_period_range(year) for year in years if year not in used)
+    ranges = sorted({r['start']: r for r in ranges}.values(), key=lambda r: r['start'])
+
+    if not ranges:
+        return {}
+    if len(ranges) > 1 and dimension not in ('quarter', 'month', 'year'):
+        return None
+    return {'ranges': ranges, 'label': " vs ".join(r['label'] for r in ranges)}
+
+
+def _mentioned_dimensions(query: str) -> set:
+    """Dimensions named anywhere in the query, grouped by or not"""
+    return ({name for name, noun in _DIMENSION_NOUNS if re.search(r'\b' + noun + r'\b', query)}
+            | {name for name, pattern in _DIMENSION_WORDS if re.search(pattern, query)})
+
+
+def _find_dimension(query: str) -> Optional[str]:
+    """The one dimension the query groups by; None if there is none, or
+    another dimension is mentioned too ("by province over the years")"""
+    found = {name for name, pattern in _DIMENSION_PATTERNS if re.search(pattern, query)}
+    if not found:
+        found = {name for name, pattern in _PERIOD_COMPARISONS if re.search(pattern, query)}
+    if len(found) != 1 or _mentioned_dimensions(query) - found:
+        return None
+    return found.pop()
+
+
+def _sql_where(date_filter: Dict[str, Any]) -> str:
+    if not date_filter:
+        return ""
+    conditions = [f"application_date >= '{r['start']}' AND application_date < '{r['end']}'"
+                  for r in date_filter['ranges']]
+    if len(conditions) == 1:
+        return f"\nWHERE {conditions[0]}"
+    return "\nWHERE " + " OR ".join(f"({c})" for c in conditions)
+
+
+def _pandas_frame(date_filter: Dict[str, Any]) -> str:
+    if not date_filter:
+        return "df = loans_df"
+    masks = [f"((loans_df['application_date'] >= '{r['start']}') & (loans_df['application_date'] < '{r['end']}'))"
+             for r in date_filter['ranges']]
+    return f"df = loans_df[{' | '.join(masks)}]"
+
+
+def _default_rate_template(dimension: str, date_filter: Dict[str, Any]) -> Dict[str, Any]:
+    dim = DIMENSIONS[dimension]
+    scope = f" ({date_filter['label']})" if date_filter else ""
+    title = f"Default rate by {dim['label']}{scope}"
+    order_by = "group_key" if dim['ordered'] else "default_rate_pct DESC"
+
+    sql = f"""SELECT {dim['sql']} AS group_key,
+    COUNT(*) AS loans,
+    SUM(defaulted) AS defaults,
+    ROUND(100.0 * AVG(defaulted), 2) AS default_rate_pct
+FROM loans{_sql_where(date_filter)}
+GROUP BY group_key
+ORDER BY {order_by}"""
+
+    sort = ("grouped = grouped.sort_index()" if dim['ordered']
+            else "grouped = grouped.sort_values('default_rate_pct', ascending=False)")
+    code = f"""{_pandas_frame(date_filter)}
+grouped = df.groupby({dim['pandas']}, observed=True).agg(loans=('loan_id', 'count'), defaults=('defaulted', 'sum'))
+grouped['default_rate_pct'] = grouped['defaults'] / grouped['loans'] * 100
+{sort}
+overall = df['defaulted'].mean() * 100 if len(df) else 0.0
+lines = [f"**{title}** (overall {{overall:.1f}}% across {{len(df):,}} loans)", ""]
+for key, row in grouped.iterrows():
+    lines.append(f"- {{key}}: {{row['default_rate_pct']:.1f}}% ({{int(row['defaults'])}} of {{int(row['loans'])}} loans)")
+if len(grouped) > 1:
+    highest = grouped['default_rate_pct'].idxmax()
+    lowest = grouped['default_rate_pct'].idxmin()
+    lines.append("")
+    lines.append(f"Highest: **{{highest}}** at {{grouped.loc[highest, 'default_rate_pct']:.1f}}%; "
+                 f"lowest: **{{lowest}}** at {{grouped.loc[lowest, 'default_rate_pct']:.1f}}%.")
+result = "\\n".join(lines)"""
+
+    return {
+        'name': 'default_rate_by_dimension',
+        'title': title,
+        'search_query': f"default rate drivers by {dim['label']}",
+        'sql': sql,
+        'analysis_code': code,
+    }
+
+
+def _average_template(metric: tuple, dimension: str, date_filter: Dict[str, Any]) -> Dict[str, Any]:
+    column, _, label, value_format = metric
+    dim = DIMENSIONS[dimension]
+    scope = f" ({date_filter['label']})" if date_filter else ""
+    title = f"{label.capitalize()} by {dim['label']}{scope}"
+    order_by = "group_key" if dim['ordered'] else f"avg_{column} DESC"
+
+    sql = f"""SELECT {dim['sql']} AS group_key,
+    COUNT(*) AS loans,
+    ROUND(AVG({column}), 2) AS avg_{column}
+FROM loans{_sql_where(date_filter)}
+GROUP BY group_key
+ORDER BY {order_by}"""
+
+    sort = ("grouped = grouped.sort_index()" if dim['ordered']
+            else "grouped = grouped.sort_values('mean', ascending=False)")
+    code = f"""{_pandas_frame(date_filter)}
+grouped = df.groupby({dim['pandas']}, observed=True)['{column}'].agg(['count', 'mean'])
+{sort}
+fmt = {value_format!r}.format
+lines = [f"**{title}** (overall {{fmt(df['{column}'].mean()) if len(df) else 'n/a'}} across {{len(df):,}} loans)", ""]
+for key, row in grouped.iterrows():
+    lines.append(f"- {{key}}: {{fmt(row['mean'])}} ({{int(row['count'])}} loans)")
+result = "\\n".join(lines)"""
+
+    return {
+        'name': f'average_{column}_by_dimension',
+        'title': title,
+        'search_query': f"{label} trends by {dim['label']}",
+        'sql': sql,
+        'analysis_code': code,
+    }
+
+
+def match_template(query: str) -> Optional[Dict[str, Any]]:
+    """Match a query against the template library.
+
+    Returns a dict with the template name, title, search_query, sql,
+    analysis_code and numeric_only (True when the user only asked for
+    numbers), or None when no template applies.
+    """
+    q = query.lower()
+    if _UNSUPPORTED_PATTERN.search(q):
+        return None
+    # "for mortgage loans", "in Ontario", "over $500,000": the answer
+    # would ignore the filter, so leave these to the LLM
+    if _FILTER_PATTERN.search(q) or re.search(r'\d', _PERIOD_NUMBER.sub('', q)) or mentioned_values(query):
+        return None
+
+    asks_default_rate = _DEFAULT_METRIC.search(q) is not None
+    averaged = [m for m in METRICS if re.search(m[1], q)] if re.search(r'\b(average|avg|mean)\b', q) else []
+    dimension = _find_dimension(q)
+
+    if _CREDIT_VS_DEFAULT.search(q) and not _mentioned_dimensions(q):
+        dimension = 'credit_band'
+        date_filter = _date_filter(q, dimension)
+        if date_filter is None:
+            return None
+        template = _default_rate_template(dimension, date_filter)
+        template['name'] = 'credit_band_vs_default'
+    elif dimension is None:
+        return None
+    elif asks_default_rate and not averaged:
+        date_filter = _date_filter(q, dimension)
+        if date_filter is None:
+            return None
+        template = _default_rate_template(dimension, date_filter)
+    elif len(averaged) == 1 and not asks_default_rate:
+        date_filter = _date_filter(q, dimension)
+        if date_filter is None:
+            return None
+        template = _average_template(averaged[0], dimension, date_filter)
+    else:
+        # e.g. "average income of defaulted loans": neither template answers it
+        return None
+
+    template['numeric_only'] = _EXPLANATION_PATTERN.search(q) is None
+    return template
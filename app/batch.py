@@ -0,0 +1,74 @@
+"""Run a pack of questions through the agent concurrently.
+
+Usage:
+    python app/batch.py queries.txt --max-concurrency 8 --output results.jsonl
+
+The input file has one question per line (blank lines and lines starting
+with '#' are skipped). Results are written as JSON lines in completion order.
+The agent's progress messages go to stderr, so `--output -` (the default)
+leaves stdout as valid JSONL.
+"""
+import argparse
+import json
+import sys
+import time
+from contextlib import redirect_stdout
+
+from dotenv import load_dotenv
+
+from agents.financial_analyst import FinancialAnalystAgent
+
+load_dotenv()
+
+
+def read_queries(path):
+    with open(path) as f:
+        return [
+            line.strip() for line in f
+            if line.strip() and not line.strip().startswith('#')
+        ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a batch of analyst queries")
+    parser.add_argument("queries", help="Text file with one query per line")
+    parser.add_argument("--max-concurrency", type=int, default=8,
+                        help="Maximum number of pipelines in flight (default: 8)")
+    parser.add_argument("--output", default="-",
+                        help="JSONL output path, '-' for stdout (default)")
+    parser.add_argument("--model", default="gpt-4o-mini")
+    args = parser.parse_args(argv)
+
+    queries = read_queries(args.queries)
+    out = sys.stdout if args.output == "-" else open(args.output, "w")
+    start_time = time.time()
+    failures = 0
+    try:
+        # The agent and its worker threads print progress; keep it out of the JSONL
+        with redirect_stdout(sys.stderr):
+            agent = FinancialAnalystAgent(model_name=args.model)
+            for item in agent.run_batch(queries, max_concurrency=args.max_concurrency):
+                result = item["result"] or {}
+                if item["error"]:
+                    failures += 1
+                record = {
+                    "index": item["index"],
+                    "query": item["query"],
+                    "final_answer": result.get("final_answer"),
+                    "error": item["error"],
+                    "duration": item["duration"],
+                    "metadata": result.get("metadata", {}),
+                }
+                out.write(json.dumps(record, default=str) + "\n")
+                out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    print(f"✅ {len(queries) - failures}/{len(queries)} queries succeeded "
+          f"in {time.time() - start_time:.2f}s", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
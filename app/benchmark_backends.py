@@ -0,0 +1,190 @@
+"""Compare the SQLite and Parquet/DuckDB query backends on recorded queries.
+
+Usage:
+    python app/benchmark_backends.py                  # queries from the agent trace
+    python app/benchmark_backends.py --queries q.sql --repeat 5
+    python app/benchmark_backends.py --frames         # DataFrame memory / load time
+
+Each query runs --repeat times on both backends (bypassing the result
+cache); the report shows median latencies, the speedup and whether both
+backends returned the same result: the same rows, in the same order when
+the query has an ORDER BY, with floats compared to 9 significant digits.
+--frames instead compares the analysis DataFrames loaded with default
+and compact dtypes, and attached from a memory-mapped snapshot.
+"""
+import argparse
+import datetime
+import gc
+import os
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from utils.backends import TABLES, ParquetBackend, SQLiteBackend
+from utils.frame_store import FrameStore
+from utils.instrumentation import recorded_sql
+from utils.sql_guard import QueryRejected
+from utils.worker_pool import private_rss
+
+
+def read_queries(path):
+    """Queries separated by ';' at end of line (a .sql file) or one per line"""
+    with open(path) as f:
+        text = f.read()
+    parts = text.split(";\n") if ";\n" in text else text.splitlines()
+    return [p.strip().rstrip(';') for p in parts
+            if p.strip() and not p.strip().startswith('--')]
+
+
+def time_query(backend, query, repeat, max_rows, max_bytes):
+    """(median seconds, fetched result) or (None, error message)"""
+    timings = []
+    fetched = None
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        try:
+            fetched = backend.fetch(query, max_rows, max_bytes)
+        except QueryRejected as e:
+            return None, e.details['reason']
+        except Exception as e:
+            return None, str(e).splitlines()[0]
+        timings.append(time.perf_counter() - start_time)
+    return statistics.median(timings), fetched
+
+
+def _comparable(value):
+    """A fetched value with backend-specific types and float noise removed"""
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, float):
+        return float(f"{value:.9g}")
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return str(value)
+    return value
+
+
+def same_result(query, first, second):
+    """Whether two backends' fetched results hold the same rows"""
+    if first['total_rows'] != second['total_rows'] or len(first['rows']) != len(second['rows']):
+        return False
+    rows = [[tuple(_comparable(v) for v in row) for row in fetched['rows']] for fetched in (first, second)]
+    if not re.search(r'\border\s+by\b', query, re.IGNORECASE):
+        rows = [sorted(r, key=repr) for r in rows]
+    return rows[0] == rows[1]
+
+
+# Typical group-bys from generated analysis code, per table
+GROUP_BYS = {
+    'loans': (['province', 'loan_type'], 'defaulted'),
+    'transactions': (['type', 'merchant'], 'amount'),
+}
+
+
+def frame_report(backends, repeat):
+    """Memory, load time and group-by time of each table: default dtypes,
+    compact dtypes, and compact dtypes attached from a memory-mapped snapshot.
+
+    private is the growth in this process's unshared memory from the load.
+    """
+    store = FrameStore(tempfile.mkdtemp(prefix='frames-'))
+    print(f"{'table':<22} {'dtypes':<8} {'memory':>10} {'private':>10} {'load':>9} {'group-by':>9}")
+    for backend in backends:
+        for table in TABLES:
+            keys, value = GROUP_BYS[table]
+            results = {}
+            for mode in ('default', 'compact', 'mapped'):
+                gc.collect()
+                before = private_rss(os.getpid()) or 0
+                start_time = time.perf_counter()
+                if mode == 'mapped':
+                    df = store.load(table, backend.name)
+                else:
+                    df = backend.load_table(table, compact=mode != 'default')
+                load = time.perf_counter() - start_time
+                private = (private_rss(os.getpid()) or 0) - before
+                if mode == 'compact':
+                    store.save(table, backend.name, df)
+                memory = df.memory_usage(deep=True).sum()
+                timings = []
+                for _ in range(repeat):
+                    start_time = time.perf_counter()
+                    df.groupby(keys, observed=True)[value].agg(['mean', 'sum', 'count'])
+                    timings.append(time.perf_counter() - start_time)
+                results[mode] = (memory, load, statistics.median(timings))
+                del df
+                print(f"{backend.name + ':' + table:<22} {mode:<8} {memory / 2**20:>8.1f}MB "
+                      f"{private / 2**20:>8.1f}MB {load:>8.2f}s {results[mode][2] * 1000:>7.1f}ms")
+            (mem, load, group), (c_mem, c_load, c_group) = results['default'], results['compact']
+            print(f"{'':<22} {'ratio':<8} {mem / max(c_mem, 1):>9.1f}x {'':>10} "
+                  f"{load / max(c_load, 1e-9):>8.1f}x {group / max(c_group, 1e-9):>8.1f}x")
+    shutil.rmtree(store.directory, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the SQLite and Parquet query backends")
+    parser.add_argument("--queries", help="SQL file to use instead of the agent's recorded queries")
+    parser.add_argument("--trace", help="Trace file to read recorded queries from")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per query (default: 3)")
+    parser.add_argument("--max-rows", type=int, default=1000)
+    parser.add_argument("--max-bytes", type=int, default=1024 * 1024)
+    parser.add_argument("--frames", action="store_true",
+                        help="Compare DataFrame memory and load time with default vs compact dtypes")
+    args = parser.parse_args(argv)
+
+    if args.frames:
+        backends = [SQLiteBackend()]
+        if ParquetBackend().unavailable_reason() is None:
+            backends.append(ParquetBackend())
+        frame_report(backends, args.repeat)
+        return 0
+
+    queries = read_queries(args.queries) if args.queries else recorded_sql(args.trace)
+    if not queries:
+        print("⚠️ No queries to run; pass --queries or run the agent with tracing on", file=sys.stderr)
+        return 1
+
+    sqlite_backend, parquet_backend = SQLiteBackend(), ParquetBackend()
+    reason = parquet_backend.unavailable_reason()
+    if reason is not None:
+        print(f"❌ Parquet backend unavailable: {reason}. "
+              f"Run python app/data/generate_data.py --parquet-only", file=sys.stderr)
+        return 1
+
+    totals = {'sqlite': 0.0, 'parquet': 0.0}
+    mismatches = failures = 0
+    print(f"{'sqlite':>10} {'parquet':>10} {'speedup':>8}  same  query")
+    for query in queries:
+        sqlite_time, sqlite_result = time_query(sqlite_backend, query, args.repeat,
+                                                args.max_rows, args.max_bytes)
+        parquet_time, parquet_result = time_query(parquet_backend, query, args.repeat,
+                                                  args.max_rows, args.max_bytes)
+        label = " ".join(query.split())[:70]
+        if sqlite_time is None or parquet_time is None:
+            failures += 1
+            errors = [f"{name}: {result}" for name, t, result in
+                      (('sqlite', sqlite_time, sqlite_result), ('parquet', parquet_time, parquet_result))
+                      if t is None]
+            print(f"{'-':>10} {'-':>10} {'-':>8}  ❌    {label}\n{'':>33}{'; '.join(errors)}")
+            continue
+
+        totals['sqlite'] += sqlite_time
+        totals['parquet'] += parquet_time
+        same = same_result(query, sqlite_result, parquet_result)
+        mismatches += not same
+        print(f"{sqlite_time * 1000:>8.1f}ms {parquet_time * 1000:>8.1f}ms "
+              f"{sqlite_time / max(parquet_time, 1e-9):>7.1f}x  {'✅' if same else '⚠️'}    {label}")
+
+    ran = len(queries) - failures
+    print(f"\n📊 {ran}/{len(queries)} queries ran on both backends: "
+          f"sqlite {totals['sqlite']:.3f}s, parquet {totals['parquet']:.3f}s "
+          f"({totals['sqlite'] / max(totals['parquet'], 1e-9):.1f}x)")
+    if mismatches:
+        print(f"⚠️ {mismatches} queries returned different results")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
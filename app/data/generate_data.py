@@ -1,7 +1,36 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
+import argparse
+import os
+import re
 import sqlite3
+import sys
+from pathlib import Path
+
+# Make app/ importable when run as a script
+sys.path.append(str(Path(__file__).parent.parent))
+
+from utils.backends import PARQUET_DIR, export_parquet
+from utils.data_version import bump_data_version
+from utils.instrumentation import recorded_sql
+from utils.rollups import build_rollups
+
+DB_PATH = 'app/data/structured/banking.db'
+TRACE_PATH = os.getenv('AGENT_TRACE_PATH', 'app/data/traces/agent_trace.jsonl')
+
+# Indexes for the agent's common query shapes: date-range filters, group-bys
+# on province / loan type, default-rate filters and customer lookups. Extra
+# trailing columns let the usual aggregates be answered from the index alone.
+INDEXES = [
+    ('idx_loans_application_date', 'loans',
+     ['application_date', 'province', 'loan_type', 'defaulted', 'amount']),
+    ('idx_loans_province', 'loans', ['province', 'defaulted', 'amount', 'application_date']),
+    ('idx_loans_loan_type', 'loans', ['loan_type', 'defaulted', 'amount', 'application_date']),
+    ('idx_loans_defaulted', 'loans', ['defaulted', 'credit_score', 'province', 'loan_type']),
+    ('idx_transactions_timestamp', 'transactions', ['timestamp', 'type', 'amount', 'is_fraud']),
+    ('idx_transactions_customer_id', 'transactions', ['customer_id', 'timestamp', 'amount']),
+]
 
 def generate_loan_data(n_records=1000):
     """Generate synthetic loan performance data"""
@@ -65,7 +94,7 @@ def generate_transaction_data(n_records=5000):
 
 def create_database():
     """Create SQLite database with all tables"""
-    conn = sqlite3.connect('app/data/structured/banking.db')
+    conn = sqlite3.connect(DB_PATH)
     
     # Generate and save data
     loans_df = generate_loan_data()
@@ -73,6 +102,8 @@ def create_database():
     
     loans_df.to_sql('loans', conn, if_exists='replace', index=False)
     transactions_df.to_sql('transactions', conn, if_exists='replace', index=False)
+    bump_data_version(conn)
+    conn.commit()
     
     # Also save as CSV for flexibility
     loans_df.to_csv('app/data/structured/loans.csv', index=False)
@@ -80,9 +111,109 @@ def create_database():
     
     print(f"✅ Generated {len(loans_df)} loan records")
     print(f"✅ Generated {len(transactions_df)} transaction records")
-    print(f"✅ Database created at app/data/structured/banking.db")
+    print(f"✅ Database created at {DB_PATH}")
     
     conn.close()
+    
+    refresh_rollups()
+    build_indexes()
+    refresh_parquet()
+
+def refresh_rollups(db_path=DB_PATH):
+    """Rebuild the loans_rollup summary table the SQL tool answers aggregates from"""
+    rows = build_rollups(db_path)
+    print(f"✅ Built loans_rollup ({rows} rows) on {db_path}")
+
+def refresh_parquet(db_path=DB_PATH, directory=PARQUET_DIR):
+    """Re-export the Parquet snapshots the columnar query backend reads"""
+    try:
+        counts = export_parquet(db_path, directory)
+    except ImportError as e:
+        print(f"⚠️ Skipping Parquet export: {e}")
+        return
+    print(f"✅ Exported {', '.join(f'{t} ({n} rows)' for t, n in counts.items())} to {directory}")
+
+def build_indexes(db_path=DB_PATH):
+    """Create the query indexes and refresh planner statistics (safe to re-run)"""
+    conn = sqlite3.connect(db_path)
+    
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    for name, table, columns in INDEXES:
+        if table not in tables:
+            print(f"⚠️ Skipping {name}: no {table} table")
+            continue
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})")
+    
+    # Row counts and selectivity for the query planner (stored in sqlite_stat1)
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+    
+    print(f"✅ Built {len(INDEXES)} indexes and ran ANALYZE on {db_path}")
+
+def index_usage_report(db_path=DB_PATH, trace_path=TRACE_PATH):
+    """Show which indexes the recorded agent queries use, and which queries still scan"""
+    queries = recorded_sql(trace_path)
+    if not queries:
+        print(f"⚠️ No recorded queries in {trace_path}")
+        return {}
+    
+    conn = sqlite3.connect(db_path)
+    usage = {name: 0 for name, _, _ in INDEXES}
+    full_scans = []
+    failed = 0
+    
+    for sql in queries:
+        try:
+            plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+        except sqlite3.Error:
+            failed += 1
+            continue
+        
+        used = set()
+        for detail in plan:
+            match = re.search(r'USING (?:COVERING )?INDEX (\w+)', detail)
+            if match:
+                used.add(match.group(1))
+            elif re.match(r'SCAN (?:TABLE )?(loans|transactions)\b', detail):
+                full_scans.append((sql, detail))
+        for name in used:
+            usage[name] = usage.get(name, 0) + 1
+    conn.close()
+    
+    print(f"📊 Index usage across {len(queries)} recorded queries:")
+    for name, count in sorted(usage.items(), key=lambda item: -item[1]):
+        print(f"   {name}: {count}")
+    if full_scans:
+        print(f"\n⚠️ {len(full_scans)} full table scans:")
+        for sql, detail in full_scans:
+            print(f"   {detail}: {' '.join(sql.split())[:100]}")
+    if failed:
+        print(f"\n⚠️ {failed} queries could not be planned")
+    
+    return {'queries': len(queries), 'usage': usage, 'full_scans': len(full_scans)}
 
 if __name__ == "__main__":
-    create_database()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Generate banking.db and build its indexes")
+    parser.add_argument('--indexes-only', action='store_true',
+                        help="Only build indexes and statistics on the existing database")
+    parser.add_argument('--rollups-only', action='store_true',
+                        help="Only rebuild the rollup tables on the existing database")
+    parser.add_argument('--parquet-only', action='store_true',
+                        help="Only re-export the Parquet snapshots of the existing database")
+    parser.add_argument('--report', action='store_true',
+                        help="Report which indexes the agent's recorded queries use")
+    args = parser.parse_args()
+    
+    if args.rollups_only:
+        refresh_rollups()
+    if args.indexes_only or args.rollups_only:
+        build_indexes()
+    if args.indexes_only or args.rollups_only or args.parquet_only:
+        # Any write changes banking.db's version, so re-snapshot it
+        refresh_parquet()
+    elif not args.report:
+        create_database()
+    
+    if args.report:
+        index_usage_report()
\ No newline at end of file
@@ -0,0 +1,50 @@
+"""Append or upsert new loans / transactions into banking.db.
+
+Usage:
+    python app/ingest.py loans new_loans.csv
+    python app/ingest.py transactions tx.jsonl --mode upsert
+
+Each file is loaded in one transaction. loans_rollup is updated
+incrementally and the data-version counter is bumped, so cached SQL results
+and answers computed on the old data are dropped. If a Parquet snapshot
+exists for the columnar backend it is re-exported afterwards.
+"""
+import argparse
+import sys
+import time
+
+from utils.backends import ParquetBackend, export_parquet
+from utils.data_version import DB_PATH
+from utils.ingestion import MODES, TABLES, ingest, read_batch
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load new rows into banking.db")
+    parser.add_argument("table", choices=list(TABLES))
+    parser.add_argument("files", nargs="+", help="CSV, JSONL, JSON or Parquet files of rows")
+    parser.add_argument("--mode", choices=MODES, default="append",
+                        help="append fails on existing keys; upsert replaces them (default: append)")
+    parser.add_argument("--db", default=DB_PATH)
+    args = parser.parse_args(argv)
+
+    for path in args.files:
+        start_time = time.time()
+        try:
+            result = ingest(args.table, read_batch(path), mode=args.mode, db_path=args.db)
+        except (ValueError, OSError) as e:
+            print(f"❌ {path}: {e}", file=sys.stderr)
+            return 1
+        print(f"✅ {path}: {result['inserted']} inserted, {result['updated']} updated "
+              f"into {args.table} in {time.time() - start_time:.2f}s "
+              f"(data version {result['data_version']})")
+
+    parquet = ParquetBackend()
+    if args.db == DB_PATH and parquet.manifest() is not None:
+        start_time = time.time()
+        export_parquet(args.db, parquet.directory)
+        print(f"✅ Re-exported Parquet snapshot in {time.time() - start_time:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -118,6 +118,52 @@ with st.sidebar:
 # Main chat interface
 st.header("💬 Chat")
 
+STEP_LABELS = {
+    "planner": "📋 Planning",
+    "doc_searcher": "📚 Document search",
+    "sql_executor": "🔍 SQL query",
+    "analyzer": "📊 Statistical analysis",
+}
+
+
+def render_step(node, update):
+    """Render one reasoning step from the state update its node wrote"""
+    # Planning
+    if node == "planner" and update.get('analysis_plan'):
+        st.markdown("### 📋 Step 1: Planning")
+        st.info(update['analysis_plan'])
+    
+    # Document Search
+    elif node == "doc_searcher" and update.get('document_context') and 'No documents' not in update['document_context']:
+        st.markdown("### 📚 Step 2: Document Search")
+        doc_context = update['document_context']
+        if len(doc_context) > 800:
+            st.info(doc_context[:800] + "\n\n... (truncated for brevity)")
+        else:
+            st.info(doc_context)
+    
+    # SQL Execution
+    elif node == "sql_executor" and update.get('sql_results'):
+        st.markdown("### 🔍 Step 3: SQL Query & Results")
+        sql_results = update['sql_results']
+        if len(sql_results) > 600:
+            st.code(sql_results[:600] + "\n... (truncated)", language="text")
+        else:
+            st.code(sql_results, language="text")
+    
+    # Analysis
+    elif node == "analyzer" and update.get('analysis_results'):
+        st.markdown("### 📊 Step 4: Statistical Analysis")
+        analysis = update['analysis_results']
+        if "Error in analysis" not in analysis:
+            if len(analysis) > 800:
+                st.success(analysis[:800] + "...")
+            else:
+                st.success(analysis)
+        else:
+            st.warning("Analysis step used SQL results directly (fallback)")
+
+
 # Display chat history
 for message in st.session_state.messages:
     with st.chat_message(message["role"]):
@@ -136,92 +182,83 @@ if query:
     with st.chat_message("user"):
         st.markdown(query)
     
-    # Get agent response
+    # Get agent response, rendering each step as soon as it finishes
     with st.chat_message("assistant"):
-        with st.spinner("🤔 Analyzing..."):
-            start_time = time.time()
+        start_time = time.time()
+        progress = st.status("🤔 Analyzing...", expanded=False)
+        answer_box = st.empty()
+        answer_text = ""
+        
+        try:
+            result = None
+            for event in st.session_state.agent.stream(query):
+                if event['type'] == 'node':
+                    if event['status'] != 'ran' or event['node'] == 'synthesizer':
+                        continue
+                    progress.update(label=f"🤔 Analyzing... {STEP_LABELS[event['node']]} done")
+                    if st.session_state.show_reasoning:
+                        with progress:
+                            render_step(event['node'], event['update'])
+                elif event['type'] == 'token':
+                    answer_text += event['content']
+                    answer_box.markdown(answer_text + "▌")
+                elif event['type'] == 'result':
+                    result = event['result']
+            
+            duration = time.time() - start_time
+            
+            # Update metrics
+            st.session_state.query_count += 1
+            st.session_state.total_duration += duration
+            
+            progress.update(label=f"✅ Analysis complete in {duration:.1f}s", state="complete")
+            
+            # Metadata
+            if st.session_state.show_reasoning:
+                with progress:
+                    st.markdown("### ⏱️ Execution Metrics")
+                    col1, col2, col3 = st.columns(3)
+                    with col1:
+                        st.metric("Duration", f"{duration:.2f}s")
+                    with col2:
+                        steps = result.get('metadata', {}).get('path_taken')
+                        st.metric("Steps Completed", len(steps) if steps is not None else 5)
+                    with col3:
+                        tokens = result.get('metadata', {}).get('estimated_tokens', 0)
+                        st.metric("Est. Tokens", f"{tokens:,}" if tokens else "N/A")
+            
+            # Show final answer
+            answer_box.markdown(result['final_answer'])
+            
+            semantic = result.get('metadata', {}).get('semantic_cache', {})
+            if semantic.get('hit'):
+                st.caption(
+                    f"♻️ Answer reused from a similar question: \"{semantic['original_query']}\" "
+                    f"({semantic['age_seconds'] / 60:.0f} min ago, similarity {semantic['similarity']:.2f})"
+                )
+            
+            # Add feedback buttons
+            col1, col2, col3 = st.columns([1, 1, 8])
+            with col1:
+                if st.button("👍", key=f"up_{st.session_state.query_count}"):
+                    st.success("Thanks!")
+            with col2:
+                if st.button("👎", key=f"down_{st.session_state.query_count}"):
+                    st.warning("Thanks for feedback!")
+            
+            # Store message
+            st.session_state.messages.append({
+                "role": "assistant",
+                "content": result['final_answer']
+            })
             
-            try:
-                result = st.session_state.agent.run(query)
-                duration = time.time() - start_time
-                
-                # Update metrics
-                st.session_state.query_count += 1
-                st.session_state.total_duration += duration
-                
-                # Show reasoning steps if enabled
-                if st.session_state.show_reasoning:
-                    with st.expander("🔍 View Reasoning Steps", expanded=False):
-                        # Planning
-                        if result.get('analysis_plan'):
-                            st.markdown("### 📋 Step 1: Planning")
-                            st.info(result['analysis_plan'])
-                        
-                        # Document Search
-                        if result.get('document_context') and 'No documents' not in result['document_context']:
-                            st.markdown("### 📚 Step 2: Document Search")
-                            doc_context = result['document_context']
-                            if len(doc_context) > 800:
-                                st.info(doc_context[:800] + "\n\n... (truncated for brevity)")
-                            else:
-                                st.info(doc_context)
-                        
-                        # SQL Execution
-                        if result.get('sql_results'):
-                            st.markdown("### 🔍 Step 3: SQL Query & Results")
-                            sql_results = result['sql_results']
-                            if len(sql_results) > 600:
-                                st.code(sql_results[:600] + "\n... (truncated)", language="text")
-                            else:
-                                st.code(sql_results, language="text")
-                        
-                        # Analysis
-                        if result.get('analysis_results'):
-                            st.markdown("### 📊 Step 4: Statistical Analysis")
-                            analysis = result['analysis_results']
-                            if "Error in analysis" not in analysis:
-                                if len(analysis) > 800:
-                                    st.success(analysis[:800] + "...")
-                                else:
-                                    st.success(analysis)
-                            else:
-                                st.warning("Analysis step used SQL results directly (fallback)")
-                        
-                        # Metadata
-                        st.markdown("### ⏱️ Execution Metrics")
-                        col1, col2, col3 = st.columns(3)
-                        with col1:
-                            st.metric("Duration", f"{duration:.2f}s")
-                        with col2:
-                            st.metric("Steps Completed", 5)
-                        with col3:
-                            tokens = result.get('metadata', {}).get('estimated_tokens', 0)
-                            st.metric("Est. Tokens", f"{tokens:,}" if tokens else "N/A")
-                
-                # Show final answer
-                st.markdown(result['final_answer'])
-                
-                # Add feedback buttons
-                col1, col2, col3 = st.columns([1, 1, 8])
-                with col1:
-                    if st.button("👍", key=f"up_{st.session_state.query_count}"):
-                        st.success("Thanks!")
-                with col2:
-                    if st.button("👎", key=f"down_{st.session_state.query_count}"):
-                        st.warning("Thanks for feedback!")
-                
-                # Store message
-                st.session_state.messages.append({
-                    "role": "assistant",
-                    "content": result['final_answer']
-                })
-                
-            except Exception as e:
-                st.error(f"❌ An error occurred: {str(e)}")
-                st.session_state.messages.append({
-                    "role": "assistant",
-                    "content": f"I encountered an error: {str(e)}\n\nPlease try rephrasing your question."
-                })
+        except Exception as e:
+            progress.update(label="❌ Analysis failed", state="error")
+            st.error(f"❌ An error occurred: {str(e)}")
+            st.session_state.messages.append({
+                "role": "assistant",
+                "content": f"I encountered an error: {str(e)}\n\nPlease try rephrasing your question."
+            })
 
 # Footer
 st.markdown("---")
@@ -1,8 +1,15 @@
 from langchain.tools import BaseTool
 import pandas as pd
 import numpy as np
-from typing import Dict, Any
-import sqlite3
+from typing import Dict, Any, List, Optional
+from contextlib import contextmanager
+import threading
+from utils.concurrency import run_blocking
+from utils.backends import TABLES, get_backend
+from utils.frame_cache import FrameCache, copy_on_write, default_frame_cache, view
+from utils.frame_usage import LAZY_FRAMES, frame_columns, select_frames
+from utils.sandbox import restricted_builtins
+from utils.worker_pool import WorkerError, WorkerPool, default_worker_pool
 
 class DataAnalysisTool(BaseTool):
     name = "data_analysis"
@@ -14,36 +21,102 @@ class DataAnalysisTool(BaseTool):
     Returns: Analysis results as string
     """
     
-    def _run(self, code: str) -> str:
+    # Tables loaded once per data version and shared by every instance
+    _frame_cache: Optional[FrameCache] = default_frame_cache()
+    
+    # Pre-forked workers that run the code (see the bottom of this module)
+    _worker_pool: Optional[WorkerPool] = None
+    
+    # DataFrames pinned while a batch is running (see share_frames)
+    _shared_frames: Optional[Dict[str, pd.DataFrame]] = None
+    _share_count: int = 0
+    _share_lock = threading.Lock()
+    
+    @classmethod
+    def load_frames(cls, code: Optional[str] = None) -> Dict[str, pd.DataFrame]:
+        """The loans and transactions tables with parsed dates, cached per data version.
+
+        Given the analysis code, only the tables and columns it reads are loaded.
+        """
+        backend = get_backend()
+        tables = cls.tables_read(code, backend) if code is not None else None
+        if cls._frame_cache is not None:
+            return cls._frame_cache.frames(tables)
+        if tables is None:
+            tables = dict.fromkeys(TABLES)
+        return {f"{table}_df": backend.load_table(table, columns=columns) for table, columns in tables.items()}
+    
+    @staticmethod
+    def tables_read(code: str, backend=None) -> Optional[Dict[str, Optional[List[str]]]]:
+        """Table -> the columns the code reads (None: all), or None if that can't be told"""
+        if not LAZY_FRAMES:
+            return None
+        backend = backend or get_backend()
+        usage = frame_columns(code, {f"{table}_df": backend.columns(table) for table in TABLES})
+        if usage is None:
+            return None
+        return {frame[:-len('_df')]: columns for frame, columns in usage.items()}
+    
+    @classmethod
+    @contextmanager
+    def share_frames(cls, frames: Optional[Dict[str, pd.DataFrame]] = None):
+        """Reuse one loaded copy of the tables for every call inside the block"""
+        with cls._share_lock:
+            if cls._share_count == 0:
+                cls._shared_frames = frames if frames is not None else cls.load_frames()
+            cls._share_count += 1
         try:
-            # Load data
-            conn = sqlite3.connect('app/data/structured/banking.db')
-            loans_df = pd.read_sql_query("SELECT * FROM loans", conn)
-            transactions_df = pd.read_sql_query("SELECT * FROM transactions", conn)
-            conn.close()
-            
-            # Parse dates
-            loans_df['application_date'] = pd.to_datetime(loans_df['application_date'])
-            transactions_df['timestamp'] = pd.to_datetime(transactions_df['timestamp'])
-            
-            # Execute code in controlled namespace
-            namespace = {
-                'pd': pd,
-                'np': np,
-                'loans_df': loans_df,
-                'transactions_df': transactions_df
-            }
-            
-            exec(code, namespace)
-            
-            # Capture 'result' variable from executed code
-            if 'result' in namespace:
-                return str(namespace['result'])
-            else:
-                return "Code executed but no 'result' variable was set."
+            yield cls._shared_frames
+        finally:
+            with cls._share_lock:
+                cls._share_count -= 1
+                if cls._share_count == 0:
+                    cls._shared_frames = None
+    
+    @staticmethod
+    def execute(code: str, frames: Dict[str, pd.DataFrame]) -> str:
+        """Run analysis code against copy-on-write views of the frames it reads"""
+        try:
+            with copy_on_write():
+                # Execute code in controlled namespace
+                namespace = {
+                    '__builtins__': restricted_builtins(),
+                    'pd': pd,
+                    'np': np,
+                    **{name: view(df) for name, df in select_frames(code, frames).items()}
+                }
+                
+                exec(code, namespace)
                 
+                # Capture 'result' variable from executed code
+                if 'result' in namespace:
+                    return str(namespace['result'])
+                else:
+                    return "Code executed but no 'result' variable was set."
+                
+        except MemoryError:
+            return "Error in analysis: ran out of memory"
         except Exception as e:
             return f"Error in analysis: {str(e)}"
     
+    def _run(self, code: str) -> str:
+        pool = DataAnalysisTool._worker_pool
+        if pool is not None:
+            try:
+                return pool.run(code)
+            except WorkerError as e:
+                return f"Error in analysis: {e}"
+        
+        # In-process: the batch-wide frames if pinned, else what the code reads
+        shared = DataAnalysisTool._shared_frames
+        return self.execute(code, shared if shared is not None else self.load_frames(code))
+    
     async def _arun(self, code: str) -> str:
-        return self._run(code)
\ No newline at end of file
+        return await run_blocking(self._run, code)
+
+
+# With ANALYSIS_WORKERS=N, generated code runs in forked, sandboxed workers
+# that already hold the frames; by default it runs in-process
+DataAnalysisTool._worker_pool = default_worker_pool(
+    DataAnalysisTool.execute, DataAnalysisTool.load_frames, lambda: get_backend().version()
+)
@@ -7,6 +7,7 @@ import os
 from typing import Optional, Type
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
+from utils.concurrency import run_blocking
 
 load_dotenv()
 
@@ -122,4 +123,4 @@ class DocumentSearchTool(BaseTool):
             return f"Error searching documents: {str(e)}"
     
     async def _arun(self, query: str) -> str:
-        return self._run(query)
\ No newline at end of file
+        return await run_blocking(self._run, query)
\ No newline at end of file
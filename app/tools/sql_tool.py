@@ -1,37 +1,145 @@
 from langchain.tools import BaseTool
-from typing import Optional
-import sqlite3
+from typing import Any, Dict, List, Optional
+import os
 import pandas as pd
+from utils.backends import get_backend
+from utils.concurrency import run_blocking
+from utils.data_version import db_version
+from utils.schema_catalog import schema_prompt
+from utils.sql_cache import SQLResultCache, default_sql_cache, make_sql_key
+from utils.sql_guard import QueryRejected
+
+# Start of every failed-query result, so callers can tell errors from data
+ERROR_PREFIX = "Error executing query: "
 
 class SQLQueryTool(BaseTool):
     name = "sql_query"
     description = """
     Execute SQL queries on the banking database.
-    Available tables: 
-    - loans: loan_id, application_date, loan_type, amount, interest_rate, term_months, 
-             credit_score, province, customer_age, income, employment_status, defaulted, days_past_due
-    - transactions: transaction_id, timestamp, customer_id, type, amount, merchant, is_fraud
-    
+    Available tables:
+{schema}
+
     Input should be a valid SQL query string.
     Returns: Query results as a formatted string
     """
-    
+
+    # Fetch budget: stop reading the cursor after this many rows or
+    # (approximate) bytes, and print at most head_rows of them
+    max_rows: int = int(os.getenv('SQL_MAX_ROWS', '1000'))
+    max_bytes: int = int(os.getenv('SQL_MAX_BYTES', str(1024 * 1024)))
+    head_rows: int = int(os.getenv('SQL_HEAD_ROWS', '100'))
+    # 'sqlite' or 'parquet'; None follows QUERY_BACKEND
+    backend: Optional[str] = None
+
+    # Results shared by every instance, keyed on normalized SQL + DB version
+    _result_cache: Optional[SQLResultCache] = default_sql_cache()
+
+    def __getattribute__(self, name: str) -> Any:
+        # The table list is filled in from the schema catalog on every read,
+        # so it follows schema changes and recovers once banking.db is readable
+        value = super().__getattribute__(name)
+        if name == 'description' and '{schema}' in value:
+            schema = schema_prompt()
+            value = value.format(schema="\n".join(f"    {line}" for line in schema.splitlines()))
+        return value
+
+    def fetch(self, query: str) -> Dict[str, Any]:
+        """Run a query, reading rows only until the row/byte budget is spent.
+
+        Returns the column names, the fetched rows, whether the result was
+        truncated (and by which budget), and the true total row count.
+        The query runs on the configured backend (see utils.backends).
+        Raises QueryTooExpensive when the plan is over budget and
+        QueryBudgetExceeded when the query runs too long.
+        """
+        return get_backend(self.backend).fetch(query, self.max_rows, self.max_bytes)
+
+    def cached_fetch(self, query: str) -> Dict[str, Any]:
+        """fetch, reusing the result of an equivalent query on the same data"""
+        cache = SQLQueryTool._result_cache
+        if cache is None:
+            return self.fetch(query)
+
+        backend = get_backend(self.backend)
+        version = db_version()
+        cache.sync_version(version)
+        key = make_sql_key(query, f"{backend.name}:{version}:{self.max_rows}:{self.max_bytes}")
+        fetched = cache.get(key)
+        if fetched is None:
+            fetched = backend.fetch(query, self.max_rows, self.max_bytes)
+            cache.set(key, fetched, fetched['bytes'])
+        return fetched
+
+    @classmethod
+    def cache_stats(cls) -> Dict[str, int]:
+        """Hit/miss/eviction counters and size of the shared result cache"""
+        return cls._result_cache.stats() if cls._result_cache is not None else {}
+
+    @staticmethod
+    def column_stats(df: pd.DataFrame) -> List[str]:
+        """One summary line per column of the fetched rows"""
+        lines = []
+        for column in df.columns:
+            values = df[column].dropna()
+            nulls = len(df) - len(values)
+            null_note = f", {nulls} null" if nulls else ""
+            numeric = pd.to_numeric(values, errors='coerce')
+            if len(values) and numeric.notna().all():
+                fmt = lambda v: f"{v:,.0f}" if abs(v) >= 1000 else f"{v:.4g}"
+                lines.append(
+                    f"- {column}: min={fmt(numeric.min())}, max={fmt(numeric.max())}, "
+                    f"mean={fmt(numeric.mean())}{null_note}"
+                )
+            elif len(values):
+                counts = values.astype(str).value_counts()
+                if counts.iloc[0] == 1:
+                    lines.append(f"- {column}: {len(counts)} distinct values{null_note}")
+                else:
+                    lines.append(
+                        f"- {column}: {len(counts)} distinct, most common "
+                        f"{counts.index[0]!r} ({counts.iloc[0]}){null_note}"
+                    )
+            else:
+                lines.append(f"- {column}: all null")
+        return lines
+
+    def format_result(self, fetched: Dict[str, Any]) -> str:
+        """Compact summary for the LLM: head rows, column stats and truncation"""
+        rows = fetched['rows']
+        if not rows:
+            return "Query returned no results."
+
+        total = fetched['total_rows']
+        df = pd.DataFrame(rows, columns=fetched['columns'])
+
+        # Format for LLM consumption
+        if total is None:
+            result = f"Query executed successfully. Returned more than {len(df)} rows.\n"
+        else:
+            result = f"Query executed successfully. Returned {total} rows.\n"
+        if fetched['truncated']:
+            result += (f"Result truncated: read the first {len(df)} rows "
+                       f"(stopped at the {fetched['truncated_by']} budget). "
+                       f"Aggregate in SQL to see everything.\n")
+
+        head = df.head(self.head_rows)
+        if len(head) < len(df):
+            result += f"Showing the first {len(head)} rows.\n"
+        result += "\n" + head.to_string(index=False)
+
+        if len(head) < len(df) or fetched['truncated']:
+            scope = "fetched rows" if fetched['truncated'] else "all rows"
+            result += f"\n\nColumn stats ({scope}):\n" + "\n".join(self.column_stats(df))
+
+        return result
+
     def _run(self, query: str) -> str:
         try:
-            conn = sqlite3.connect('app/data/structured/banking.db')
-            df = pd.read_sql_query(query, conn)
-            conn.close()
-            
-            if df.empty:
-                return "Query returned no results."
-            
-            # Format for LLM consumption
-            result = f"Query executed successfully. Returned {len(df)} rows.\n\n"
-            result += df.to_string(index=False, max_rows=100)
-            
-            return result
+            return self.format_result(self.cached_fetch(query))
+        except QueryRejected as e:
+            return ERROR_PREFIX + e.to_message()
         except Exception as e:
-            return f"Error executing query: {str(e)}"
-    
+            return ERROR_PREFIX + str(e)
+
     async def _arun(self, query: str) -> str:
-        return self._run(query)
\ No newline at end of file
+        return await run_blocking(self._run, query)
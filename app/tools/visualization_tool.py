@@ -2,7 +2,8 @@ from langchain.tools import BaseTool
 import plotly.express as px
 import plotly.graph_objects as go
 import pandas as pd
-import sqlite3
+from utils.concurrency import run_blocking
+from utils.db import read_connection
 import os
 from typing import Dict
 
@@ -20,9 +21,8 @@ class VisualizationTool(BaseTool):
             spec = json.loads(viz_spec)
             
             # Get data
-            conn = sqlite3.connect('app/data/structured/banking.db')
-            df = pd.read_sql_query(spec['data_query'], conn)
-            conn.close()
+            with read_connection() as conn:
+                df = pd.read_sql_query(spec['data_query'], conn)
             
             # Create visualization
             viz_type = spec.get('type', 'bar')
@@ -47,4 +47,4 @@ class VisualizationTool(BaseTool):
             return f"Error creating visualization: {str(e)}"
     
     async def _arun(self, viz_spec: str) -> str:
-        return self._run(viz_spec)
\ No newline at end of file
+        return await run_blocking(self._run, viz_spec)
\ No newline at end of file
@@ -0,0 +1,416 @@
+"""Query backends behind SQLQueryTool and DataAnalysisTool.
+
+- sqlite: banking.db through the pooled read-only connections, with the
+  rollup rewrite, plan-cost check and progress-handler budget.
+- parquet: Parquet snapshots of the tables, exported from banking.db and
+  queried in-process with DuckDB's vectorised, multi-threaded engine.
+  DuckDB is set up to accept the SQLite dialect the agent writes (integer
+  division, strftime, julianday).
+
+Pick one with QUERY_BACKEND=sqlite|parquet. A missing or out-of-date
+Parquet snapshot (banking.db changed since export) falls back to sqlite
+with a warning, so answers never come from stale data.
+"""
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from utils.data_version import DB_PATH, db_version
+from utils.db import read_connection
+from utils.rollups import ROLLUP_TABLE, rewrite_query
+from utils.sql_guard import MAX_JOIN_ROWS, TIMEOUT, QueryBudgetExceeded, QueryTooExpensive, \
+    check_query_cost, query_budget
+
+try:
+    import duckdb
+except ImportError:  # optional: only needed for the parquet backend
+    duckdb = None
+
+PARQUET_DIR = os.getenv('PARQUET_DIR', 'app/data/parquet')
+TABLES = ['loans', 'transactions']
+DATE_COLUMNS = {'loans': ['application_date'], 'transactions': ['timestamp']}
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# In-memory dtypes for the analysis DataFrames: Arrow strings for text and
+# int32 for integers. Generated code does arithmetic on these columns
+# (credit_score ** 2, customer_age * 12), so nothing narrower than int32,
+# and no categoricals, whose group-bys, min/max and unique() behave
+# differently from plain columns. Floats stay float64 so money sums and
+# printed values match SQL.
+DTYPES = {
+    'loans': {
+        'loan_id': 'string[pyarrow]', 'loan_type': 'string[pyarrow]', 'term_months': 'int32',
+        'credit_score': 'int32', 'province': 'string[pyarrow]', 'customer_age': 'int32',
+        'employment_status': 'string[pyarrow]', 'defaulted': 'int32', 'days_past_due': 'int32',
+    },
+    'transactions': {
+        'transaction_id': 'string[pyarrow]', 'customer_id': 'string[pyarrow]', 'type': 'string[pyarrow]',
+        'merchant': 'string[pyarrow]', 'is_fraud': 'int32',
+    },
+}
+COMPACT_DTYPES = os.getenv('COMPACT_DTYPES', '1').lower() not in ('0', 'false', 'off')
+LOAD_CHUNK_ROWS = int(os.getenv('LOAD_CHUNK_ROWS', '200000'))
+
+_MANIFEST = '_manifest.json'
+# Bumped when the export layout changes; older snapshots must be re-exported
+_EXPORT_FORMAT = 2
+# SQLite's date functions over the exported date text, for the SQL the agent
+# writes; system.main.strftime is DuckDB's own (timestamp, format) one
+_SQLITE_MACROS = [
+    "CREATE MACRO sqlite_time(ts) AS CASE WHEN CAST(ts AS VARCHAR) = 'now' "
+    "THEN CAST(timezone('UTC', get_current_timestamp()) AS TIMESTAMP) ELSE TRY_CAST(ts AS TIMESTAMP) END",
+    "CREATE MACRO julianday(ts) AS epoch(sqlite_time(ts)) / 86400.0 + 2440587.5",
+    "CREATE MACRO strftime(fmt, ts) AS system.main.strftime(sqlite_time(ts), fmt)",
+    "CREATE MACRO date(ts) AS system.main.strftime(sqlite_time(ts), '%Y-%m-%d')",
+    "CREATE MACRO datetime(ts) AS system.main.strftime(sqlite_time(ts), '%Y-%m-%d %H:%M:%S')",
+]
+# DuckDB operators that compare every pair of input rows
+_NESTED_JOINS = ('CROSS_PRODUCT', 'NESTED_LOOP_JOIN', 'BLOCKWISE_NL_JOIN')
+
+
+def read_rows(cursor, max_rows: int, max_bytes: int) -> Tuple[List[tuple], int, Optional[str]]:
+    """Read a DB-API cursor until it is exhausted or the row/byte budget runs out.
+
+    Returns the rows, their approximate size and which budget (if any)
+    stopped the read.
+    """
+    rows: List[tuple] = []
+    size = 0
+    truncated_by = None
+    while truncated_by is None:
+        batch = cursor.fetchmany(256)
+        if not batch:
+            break
+        for row in batch:
+            if len(rows) >= max_rows:
+                truncated_by = 'row'
+                break
+            if size >= max_bytes:
+                truncated_by = 'byte'
+                break
+            size += sum(len(str(v)) for v in row) + len(row)
+            rows.append(row)
+    return rows, size, truncated_by
+
+
+def compact_frame(table: str, df: pd.DataFrame) -> pd.DataFrame:
+    """Parse dates and apply DTYPES; integer columns with nulls get nullable types"""
+    for column in DATE_COLUMNS.get(table, []):
+        if column in df.columns and not pd.api.types.is_datetime64_any_dtype(df[column]):
+            df[column] = pd.to_datetime(df[column], format=DATE_FORMAT)
+    for column, dtype in DTYPES.get(table, {}).items():
+        if column not in df.columns:
+            continue
+        try:
+            df[column] = df[column].astype(dtype)
+        except (ValueError, TypeError):
+            if dtype.startswith('int'):
+                df[column] = df[column].astype(dtype.capitalize())
+    return df
+
+
+def concat_frames(chunks: List[pd.DataFrame]) -> pd.DataFrame:
+    """Concatenate compacted chunks"""
+    if len(chunks) == 1:
+        return chunks[0]
+    return pd.concat(chunks, ignore_index=True)
+
+
+def _fetched(columns, rows, size, truncated_by, total_rows, source=None) -> Dict[str, Any]:
+    return {
+        'columns': columns,
+        'rows': rows,
+        'total_rows': total_rows,
+        'truncated': truncated_by is not None,
+        'truncated_by': truncated_by,
+        'bytes': size,
+        'source': source,
+    }
+
+
+class SQLiteBackend:
+    """Row store: banking.db via the read-only connection pool"""
+
+    name = 'sqlite'
+
+    def version(self) -> str:
+        return db_version()
+
+    def fetch(self, query: str, max_rows: int, max_bytes: int) -> Dict[str, Any]:
+        with read_connection() as conn, query_budget(conn):
+            rewritten = rewrite_query(conn, query)
+            if rewritten is not None:
+                query = rewritten
+            check_query_cost(conn, query)
+            cursor = conn.execute(query)
+            columns = [d[0] for d in cursor.description or []]
+            rows, size, truncated_by = read_rows(cursor, max_rows, max_bytes)
+            cursor.close()
+
+            total_rows = len(rows)
+            if truncated_by is not None:
+                total_rows = self._count_rows(conn, query)
+
+        return _fetched(columns, rows, size, truncated_by, total_rows,
+                        ROLLUP_TABLE if rewritten is not None else None)
+
+    @staticmethod
+    def _count_rows(conn, query: str) -> Optional[int]:
+        """Count the full result in SQLite without transferring the rows"""
+        try:
+            inner = query.strip().rstrip(';')
+            return conn.execute(f"SELECT COUNT(*) FROM ({inner})").fetchone()[0]
+        except sqlite3.Error:
+            return None
+
+    def columns(self, table: str) -> List[str]:
+        with read_connection() as conn:
+            return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+    def load_table(self, table: str, compact: bool = COMPACT_DTYPES,
+                   columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """A table (or some of its columns) with parsed dates; compact=True applies
+        DTYPES chunk by chunk.
+
+        Compacting each chunk as it arrives keeps peak memory near the
+        compact size rather than the size of the all-object frame.
+        """
+        query = f"SELECT * FROM {table}"
+        if columns:
+            # A covering index would return a column subset in index order;
+            # rowid order keeps separately loaded columns aligned
+            select = ", ".join(f'"{c}"' for c in columns)
+            query = f"SELECT {select} FROM {table} ORDER BY rowid"
+        with read_connection() as conn:
+            if not compact:
+                df = pd.read_sql_query(query, conn)
+                for column in DATE_COLUMNS.get(table, []):
+                    if column in df.columns:
+                        df[column] = pd.to_datetime(df[column], format=DATE_FORMAT)
+                return df
+            chunks = [
+                compact_frame(table, chunk)
+                for chunk in pd.read_sql_query(query, conn, chunksize=LOAD_CHUNK_ROWS)
+            ]
+        return concat_frames(chunks)
+
+
+class ParquetBackend:
+    """Column store: Parquet snapshots queried with DuckDB"""
+
+    name = 'parquet'
+
+    def __init__(self, directory: str = PARQUET_DIR):
+        self.directory = directory
+        self._conn = None
+        self._conn_version = None
+        self._lock = threading.Lock()
+
+    def manifest(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(os.path.join(self.directory, _MANIFEST)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def version(self) -> str:
+        manifest = self.manifest()
+        return manifest['db_version'] if manifest else 'missing'
+
+    def unavailable_reason(self) -> Optional[str]:
+        """Why this backend can't serve queries right now, or None"""
+        if duckdb is None:
+            return "duckdb is not installed"
+        manifest = self.manifest()
+        if manifest is None:
+            return f"no Parquet export in {self.directory}"
+        if manifest.get('format') != _EXPORT_FORMAT:
+            return "Parquet export was written by an older version; re-export it"
+        if manifest['db_version'] != db_version():
+            return "Parquet export is older than banking.db"
+        return None
+
+    def _connection(self):
+        """Shared DuckDB database with a view per table; rebuilt after a re-export"""
+        version = self.version()
+        with self._lock:
+            if self._conn is None or self._conn_version != version:
+                conn = duckdb.connect(database=':memory:')
+                threads = os.getenv('DUCKDB_THREADS')
+                if threads:
+                    conn.execute(f"SET threads = {int(threads)}")
+                for macro in _SQLITE_MACROS:
+                    conn.execute(macro)
+                for table in TABLES:
+                    path = os.path.abspath(os.path.join(self.directory, f"{table}.parquet")).replace("'", "''")
+                    conn.execute(f"CREATE VIEW {table} AS SELECT * FROM read_parquet('{path}')")
+                if self._conn is not None:
+                    self._conn.close()
+                self._conn, self._conn_version = conn, version
+            cursor = self._conn.cursor()
+        # SQLite semantics for the SQL the agent writes (a per-cursor setting)
+        cursor.execute("SET integer_division = true")
+        return cursor
+
+    @staticmethod
+    def _estimated_rows(node: Dict[str, Any]) -> int:
+        """A plan node's estimated cardinality, or its nearest descendant's"""
+        estimate = node.get('extra_info', {}).get('Estimated Cardinality')
+        if estimate is not None:
+            return int(estimate)
+        return max((ParquetBackend._estimated_rows(c) for c in node.get('children', [])), default=1)
+
+    def _check_plan(self, cursor, query: str) -> None:
+        """Reject cross products / nested-loop joins whose output is over the join budget"""
+        plan = json.loads(cursor.execute(f"EXPLAIN (FORMAT JSON) {query}").fetchone()[1])
+        nodes = list(plan)
+        while nodes:
+            node = nodes.pop()
+            nodes.extend(node.get('children', []))
+            if node['name'].strip() not in _NESTED_JOINS:
+                continue
+            estimate = 1
+            for child in node.get('children', []):
+                estimate *= max(self._estimated_rows(child), 1)
+            if estimate > MAX_JOIN_ROWS:
+                raise QueryTooExpensive({
+                    'error': 'query_too_expensive',
+                    'summary': 'Query too expensive, rewrite it',
+                    'reason': (f"cartesian or nested-loop join would examine ~{estimate:,} rows "
+                               f"(limit {MAX_JOIN_ROWS:,})"),
+                    'hint': "Add a join condition on a key column, or aggregate each table before joining.",
+                    'estimated_rows': estimate,
+                })
+
+    def fetch(self, query: str, max_rows: int, max_bytes: int) -> Dict[str, Any]:
+        cursor = self._connection()
+        query = query.strip().rstrip(';')
+        timer = threading.Timer(TIMEOUT, cursor.interrupt)
+        timer.start()
+        try:
+            self._check_plan(cursor, query)
+            cursor.execute(query)
+            columns = [d[0] for d in cursor.description or []]
+            rows, size, truncated_by = read_rows(cursor, max_rows, max_bytes)
+
+            total_rows = len(rows)
+            if truncated_by is not None:
+                try:
+                    total_rows = cursor.execute(f"SELECT COUNT(*) FROM ({query})").fetchone()[0]
+                except duckdb.Error:
+                    total_rows = None
+        except duckdb.InterruptException:
+            raise QueryBudgetExceeded({
+                'error': 'query_budget_exceeded',
+                'summary': 'Query too expensive, rewrite it',
+                'reason': f"query ran longer than {TIMEOUT:g}s and was stopped",
+                'hint': "Aggregate in SQL, filter on indexed columns and avoid cross joins.",
+            })
+        finally:
+            timer.cancel()
+            cursor.close()
+
+        return _fetched(columns, rows, size, truncated_by, total_rows)
+
+    def columns(self, table: str) -> List[str]:
+        import pyarrow.parquet as pq
+
+        return pq.read_schema(os.path.join(self.directory, f"{table}.parquet")).names
+
+    def load_table(self, table: str, compact: bool = COMPACT_DTYPES,
+                   columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """A table (or some of its columns) with parsed dates; compact=True
+        applies DTYPES.
+
+        Only the requested column chunks are read from the file. Compact
+        loads keep strings in Arrow, skipping the intermediate object
+        columns.
+        """
+        path = os.path.join(self.directory, f"{table}.parquet")
+        if not compact:
+            df = pd.read_parquet(path, columns=columns)
+            for column in DATE_COLUMNS.get(table, []):
+                if column in df.columns:
+                    df[column] = pd.to_datetime(df[column], format=DATE_FORMAT)
+            return df
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        df = pq.read_table(path, columns=columns).to_pandas(
+            types_mapper=lambda t: pd.StringDtype('pyarrow') if t == pa.string() else None
+        )
+        return compact_frame(table, df)
+
+
+def export_parquet(db_path: str = DB_PATH, directory: str = PARQUET_DIR,
+                   chunk_rows: int = 500000) -> Dict[str, int]:
+    """Snapshot each table to Parquet, streaming in chunks to bound memory.
+
+    Date columns stay text, as in banking.db, so comparisons such as
+    BETWEEN '2024-01-01' AND '2024-01-30' and substr() behave the same on
+    both backends. The manifest records the export format and the
+    banking.db version the snapshot was taken from.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    os.makedirs(directory, exist_ok=True)
+    version = db_version(db_path)
+    counts = {}
+    conn = sqlite3.connect(f"file:{os.path.abspath(db_path)}?mode=ro", uri=True)
+    try:
+        for table in TABLES:
+            path = os.path.join(directory, f"{table}.parquet")
+            tmp_path = path + '.tmp'
+            writer, schema, rows = None, None, 0
+            for chunk in pd.read_sql_query(f"SELECT * FROM {table}", conn, chunksize=chunk_rows):
+                if writer is None:
+                    schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+                    writer = pq.ParquetWriter(tmp_path, schema, compression='zstd')
+                writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+                rows += len(chunk)
+            if writer is not None:
+                writer.close()
+                os.replace(tmp_path, path)
+            counts[table] = rows
+    finally:
+        conn.close()
+
+    with open(os.path.join(directory, _MANIFEST), 'w') as f:
+        json.dump({'format': _EXPORT_FORMAT, 'db_version': version, 'rows': counts}, f)
+    return counts
+
+
+_backends: Dict[str, Any] = {}
+_backends_lock = threading.Lock()
+_warned = set()
+
+
+def get_backend(name: Optional[str] = None):
+    """The configured backend (QUERY_BACKEND, default sqlite).
+
+    Falls back to sqlite when the parquet backend can't serve current data.
+    """
+    name = (name or os.getenv('QUERY_BACKEND', 'sqlite')).lower()
+    if name not in ('sqlite', 'parquet'):
+        raise ValueError(f"unknown query backend {name!r}; expected 'sqlite' or 'parquet'")
+
+    with _backends_lock:
+        if name not in _backends:
+            _backends[name] = SQLiteBackend() if name == 'sqlite' else ParquetBackend()
+        backend = _backends[name]
+        if 'sqlite' not in _backends:
+            _backends['sqlite'] = SQLiteBackend()
+
+    if name == 'parquet':
+        reason = backend.unavailable_reason()
+        if reason is not None:
+            if reason not in _warned:
+                _warned.add(reason)
+                print(f"⚠️ Parquet backend unavailable ({reason}); using SQLite")
+            return _backends['sqlite']
+    return backend
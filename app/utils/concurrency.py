@@ -0,0 +1,33 @@
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Blocking work (SQLite, pandas, vector search) is pushed onto one bounded
+# pool so concurrent async queries never need a thread each
+_MAX_WORKERS = int(os.getenv('AGENT_IO_WORKERS', '8'))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Return the process-wide executor for blocking tool work"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=_MAX_WORKERS,
+                    thread_name_prefix='agent-io'
+                )
+    return _executor
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking callable on the shared executor and await the result"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_executor(), functools.partial(func, *args, **kwargs)
+    )
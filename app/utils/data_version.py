@@ -0,0 +1,66 @@
+"""Cheap fingerprints of the data the agent answers from.
+
+Caches store these alongside their entries and drop anything computed
+against a different version of banking.db or the PDF corpus.
+"""
+import hashlib
+import os
+import sqlite3
+
+DB_PATH = 'app/data/structured/banking.db'
+DOCS_DIR = 'app/data/unstructured'
+
+# Single-row table in banking.db, bumped by every write (see bump_data_version)
+DATA_VERSION_TABLE = 'data_version'
+
+
+def bump_data_version(conn: sqlite3.Connection) -> int:
+    """Increment the data-version counter inside the caller's transaction"""
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {DATA_VERSION_TABLE} "
+        f"(id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL)"
+    )
+    conn.execute(
+        f"INSERT INTO {DATA_VERSION_TABLE} (id, version) VALUES (1, 1) "
+        f"ON CONFLICT(id) DO UPDATE SET version = version + 1"
+    )
+    return conn.execute(f"SELECT version FROM {DATA_VERSION_TABLE}").fetchone()[0]
+
+
+def data_version_counter(db_path: str = DB_PATH) -> int:
+    """Current value of the data-version counter (0 if never bumped)"""
+    from utils.db import read_connection
+
+    try:
+        with read_connection(db_path) as conn:
+            row = conn.execute(f"SELECT version FROM {DATA_VERSION_TABLE}").fetchone()
+    except sqlite3.Error:
+        return 0
+    return row[0] if row else 0
+
+
+def db_version(db_path: str = DB_PATH) -> str:
+    """Fingerprint of the SQLite file (version counter, mtime, size), or 'missing'.
+
+    The counter catches writes the file stat misses, e.g. WAL commits that
+    haven't been checkpointed into the main file yet.
+    """
+    try:
+        stat = os.stat(db_path)
+    except OSError:
+        return 'missing'
+    return f"{data_version_counter(db_path)}:{stat.st_mtime_ns}-{stat.st_size}"
+
+
+def corpus_version(docs_dir: str = DOCS_DIR) -> str:
+    """Hash of the name, mtime and size of every PDF in the corpus"""
+    if not os.path.exists(docs_dir):
+        return 'missing'
+
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(docs_dir)):
+        if not name.endswith('.pdf'):
+            continue
+        stat = os.stat(os.path.join(docs_dir, name))
+        digest.update(f"{name}:{stat.st_mtime_ns}:{stat.st_size};".encode('utf-8'))
+    return digest.hexdigest()[:16]
@@ -0,0 +1,149 @@
+"""Pooled read-only connections to banking.db.
+
+Opening SQLite on every tool call means a file open, a schema parse and a
+cold page cache each time. The pool keeps a few connections open in
+read-only URI mode with query_only, a memory-mapped file and a larger page
+cache, pings connections that have sat idle before handing them out, and drops them all
+when banking.db is replaced on disk (e.g. regenerated or restored).
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+
+from utils.data_version import DB_PATH
+
+_MMAP_SIZE = int(os.getenv('DB_MMAP_SIZE', str(256 * 1024 * 1024)))
+_CACHE_KB = int(os.getenv('DB_CACHE_KB', str(32 * 1024)))
+_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '8'))
+_HEALTH_CHECK_INTERVAL = float(os.getenv('DB_HEALTH_CHECK_INTERVAL', '30'))
+
+
+class ReadOnlyConnectionPool:
+    """Thread-safe pool of read-only SQLite connections to one file.
+
+    Connections are created with check_same_thread=False and handed to one
+    caller at a time, so the shared executor threads and Streamlit's
+    per-session threads can all reuse them.
+    """
+
+    def __init__(self, path: str = DB_PATH, max_idle: int = _POOL_SIZE,
+                 health_check_interval: float = _HEALTH_CHECK_INTERVAL):
+        self.path = path
+        self.max_idle = max_idle
+        self.health_check_interval = health_check_interval
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._stats = {"opened": 0, "reused": 0, "discarded": 0}
+
+    def _file_id(self) -> Optional[Tuple[int, int]]:
+        """Device and inode of the file; changes when the file is replaced"""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_dev, stat.st_ino
+
+    def _open(self, file_id: Optional[Tuple[int, int]]) -> Tuple[sqlite3.Connection, tuple, float]:
+        uri = f"file:{os.path.abspath(self.path)}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        conn.execute(f"PRAGMA mmap_size={_MMAP_SIZE}")
+        conn.execute(f"PRAGMA cache_size=-{_CACHE_KB}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA query_only=1")
+        with self._lock:
+            self._stats["opened"] += 1
+        return conn, file_id, time.time()
+
+    def _discard(self, conn: sqlite3.Connection) -> None:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._stats["discarded"] += 1
+
+    def _healthy(self, entry: Tuple[sqlite3.Connection, tuple, float],
+                 file_id: Optional[Tuple[int, int]]) -> bool:
+        conn, opened_for, last_used = entry
+        if opened_for != file_id:
+            return False
+        if time.time() - last_used < self.health_check_interval:
+            return True
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _checkout(self) -> Tuple[sqlite3.Connection, tuple, float]:
+        file_id = self._file_id()
+        while True:
+            with self._lock:
+                entry = self._idle.pop() if self._idle else None
+            if entry is None:
+                return self._open(file_id)
+            if self._healthy(entry, file_id):
+                with self._lock:
+                    self._stats["reused"] += 1
+                return entry[0], entry[1], time.time()
+            self._discard(entry[0])
+
+    def _checkin(self, entry: Tuple[sqlite3.Connection, tuple, float]) -> None:
+        with self._lock:
+            if len(self._idle) < self.max_idle and entry[1] == self._file_id():
+                self._idle.append(entry)
+                return
+        self._discard(entry[0])
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a connection for the duration of the block"""
+        entry = self._checkout()
+        try:
+            yield entry[0]
+        except sqlite3.DatabaseError as e:
+            # Bad SQL leaves the connection usable; anything else (corrupt
+            # or swapped file) means start fresh
+            if isinstance(e, sqlite3.OperationalError):
+                self._checkin(entry)
+            else:
+                self._discard(entry[0])
+            raise
+        except BaseException:
+            self._checkin(entry)
+            raise
+        else:
+            self._checkin(entry)
+
+    def close(self) -> None:
+        """Close every idle connection"""
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for conn, _, _ in idle:
+            self._discard(conn)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, "idle": len(self._idle)}
+
+
+_pools: Dict[str, ReadOnlyConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(path: str = DB_PATH) -> ReadOnlyConnectionPool:
+    """Return the process-wide pool for a database file"""
+    key = os.path.abspath(path)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ReadOnlyConnectionPool(path)
+        return _pools[key]
+
+
+def read_connection(path: str = DB_PATH):
+    """Borrow a pooled read-only connection: `with read_connection() as conn:`"""
+    return get_pool(path).connection()
@@ -0,0 +1,172 @@
+"""Process-wide cache of the loans / transactions DataFrames.
+
+DataAnalysisTool used to re-read both tables and re-parse their dates on
+every call. The cache loads each table once per data version, from the
+configured query backend, and reloads it after banking.db (or the
+Parquet snapshot) changes. Concurrent callers of a table wait for one
+load instead of each starting their own. With a FrameStore, loaded tables
+are memory-mapped Arrow snapshots shared by every process on the host
+(see utils.frame_store). Without one, callers that name the columns they
+need (see utils.frame_usage) get only those loaded; more are added to the
+cached frame as later callers ask for them.
+
+Callers get views, not the cached frames. Views are taken, and the
+user's code runs, inside copy_on_write(): a view shares memory with the
+cache until the code writes to a column. Only that column is then
+copied, so one exec can't corrupt the frames another exec sees. Pandas
+copy-on-write is a process-wide option, so it is switched on only while
+some caller is inside the block; the rest of the process keeps the
+pandas default.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from utils.backends import TABLES, get_backend
+from utils.frame_store import FrameStore, default_frame_store
+
+# Callers currently inside copy_on_write(), and the option value to restore
+_cow_lock = threading.Lock()
+_cow_users = 0
+_cow_previous = None
+
+
+@contextmanager
+def copy_on_write():
+    """Enable pandas copy-on-write until the last concurrent caller leaves.
+
+    pd.option_context would restore the old value when the first of two
+    overlapping threads exits, under the other's feet; this counts them.
+    """
+    global _cow_users, _cow_previous
+    with _cow_lock:
+        if _cow_users == 0:
+            _cow_previous = pd.get_option('mode.copy_on_write')
+            pd.set_option('mode.copy_on_write', True)
+        _cow_users += 1
+    try:
+        yield
+    finally:
+        with _cow_lock:
+            _cow_users -= 1
+            if _cow_users == 0:
+                pd.set_option('mode.copy_on_write', _cow_previous)
+
+
+def view(df: pd.DataFrame) -> pd.DataFrame:
+    """A copy-on-write view: free to take, private once written to.
+
+    Take it, and use it, inside copy_on_write().
+    """
+    return df.copy(deep=False)
+
+
+class FrameCache:
+    """Thread-safe table -> DataFrame cache, keyed on backend and data version"""
+
+    def __init__(self, store: Optional[FrameStore] = None):
+        self.store = store
+        # key -> (version, frame, whether it has every column)
+        self._frames: Dict[str, Tuple[str, pd.DataFrame, bool]] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "loads": 0, "store_hits": 0, "load_seconds": 0.0}
+
+    def _table_lock(self, key: str) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def get(self, table: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """The cached frame for the current data, loading what's missing.
+
+        The frame has at least the named columns, possibly more. Treat it
+        as read-only; hand user code a view() of it.
+        """
+        backend = get_backend()
+        key = f"{backend.name}:{table}"
+        version = backend.version()
+
+        with self._table_lock(key):
+            df, complete = None, False
+            cached = self._frames.get(key)
+            if cached is not None and cached[0] == version:
+                df, complete = cached[1], cached[2]
+
+            if complete or (df is not None and columns is not None and set(columns) <= set(df.columns)):
+                with self._lock:
+                    self._stats["hits"] += 1
+            else:
+                start_time = time.time()
+                if self.store is not None or columns is None:
+                    # A mapped snapshot only pages in the columns that are read
+                    df, complete = self._load(backend, table, version), True
+                else:
+                    missing = [c for c in columns if df is None or c not in df.columns]
+                    part = backend.load_table(table, columns=missing)
+                    if df is not None and backend.version() != version:
+                        # Data changed during the load: the rows may not line
+                        # up with the cached columns, so read them all afresh
+                        version = backend.version()
+                        df, part = None, backend.load_table(table, columns=columns)
+                    if df is None:
+                        df = part
+                    else:
+                        # Reuses the cached columns' blocks instead of copying them
+                        with copy_on_write():
+                            df = pd.concat([df, part], axis=1)
+                # Drop the stale frame before anyone can pick it up again
+                self._frames[key] = (version, df, complete)
+                with self._lock:
+                    self._stats["loads"] += 1
+                    self._stats["load_seconds"] += time.time() - start_time
+            return df
+
+    def _load(self, backend, table: str, version: str) -> pd.DataFrame:
+        """The store's mapped snapshot, writing it from the backend first if needed"""
+        if self.store is None:
+            return backend.load_table(table)
+        df = self.store.load(table, version)
+        if df is not None:
+            with self._lock:
+                self._stats["store_hits"] += 1
+            return df
+        df = backend.load_table(table)
+        try:
+            self.store.save(table, version, df)
+        except OSError as e:
+            print(f"⚠️ Could not write {table} snapshot: {e}")
+            return df
+        # Serve the shared mapping so the private copy can be freed
+        mapped = self.store.load(table, version)
+        return mapped if mapped is not None else df
+
+    def frames(self, columns: Optional[Dict[str, Optional[List[str]]]] = None) -> Dict[str, pd.DataFrame]:
+        """Tables as the {name}_df variables the analysis code expects.
+
+        columns maps each table wanted to the columns to load (None: all);
+        by default every table is loaded in full. Frames may carry more
+        columns than asked for; select_frames() narrows them.
+        """
+        if columns is None:
+            columns = dict.fromkeys(TABLES)
+        return {f"{table}_df": self.get(table, cols) for table, cols in columns.items()}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._frames.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            memory = sum(int(entry[1].memory_usage(deep=True).sum()) for entry in self._frames.values())
+            return {**self._stats, "tables": len(self._frames), "bytes": memory}
+
+
+def default_frame_cache() -> Optional[FrameCache]:
+    """Build the cache unless FRAME_CACHE_ENABLED turns it off"""
+    if os.getenv('FRAME_CACHE_ENABLED', '1').lower() in ('0', 'false', 'off'):
+        return None
+    return FrameCache(store=default_frame_store())
@@ -0,0 +1,99 @@
+"""Memory-mapped Arrow snapshots of the analysis DataFrames.
+
+The first process to need a table at a new data version writes it, with
+its compact dtypes, to an uncompressed Arrow IPC file. Every process then
+memory-maps that file and wraps the columns as DataFrames without copying
+them: numbers, dates and Arrow-backed strings are all used in place. The
+data lives once in the OS page cache:
+
+- forked analysis workers, other agent processes and restarted ones attach
+  instead of reloading from SQLite
+- the mapped pages are shared and clean, so they don't count as any
+  process's private memory and can be dropped under pressure
+- the buffers are read-only; with pandas copy-on-write, code that writes
+  to a column gets a private copy of just that column
+
+Snapshots are keyed on the data version and the table's DTYPES, so a
+dtype change never serves frames written the old way. Snapshots for
+older versions are deleted when a new one is written;
+processes still mapping them keep their view until they let go.
+"""
+import glob
+import hashlib
+import json
+import os
+from typing import Optional
+
+import pandas as pd
+
+from utils.backends import COMPACT_DTYPES, DTYPES
+
+FRAME_STORE_DIR = os.getenv('FRAME_STORE_DIR', 'app/data/cache/frames')
+
+
+def _string_dtype(arrow_type):
+    """Map Arrow large strings to pandas' Arrow-backed string dtype (zero-copy)"""
+    import pyarrow as pa
+
+    return pd.StringDtype('pyarrow') if arrow_type == pa.large_string() else None
+
+
+class FrameStore:
+    """Directory of {table}-{version hash}.arrow snapshots"""
+
+    def __init__(self, directory: str = FRAME_STORE_DIR):
+        self.directory = directory
+
+    def path(self, table: str, version: str) -> str:
+        dtypes = json.dumps(DTYPES.get(table, {}) if COMPACT_DTYPES else {}, sort_keys=True)
+        digest = hashlib.sha256(f"{version}\n{dtypes}".encode()).hexdigest()[:16]
+        return os.path.join(self.directory, f"{table}-{digest}.arrow")
+
+    def load(self, table: str, version: str) -> Optional[pd.DataFrame]:
+        """Map the snapshot for this version, or None if there isn't one"""
+        import pyarrow as pa
+
+        path = self.path(table, version)
+        try:
+            arrow_table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+        except (OSError, pa.ArrowInvalid):
+            return None
+        # split_blocks keeps one block per column, so pandas never
+        # consolidates (copies) the mapped buffers
+        return arrow_table.to_pandas(split_blocks=True, ignore_metadata=True,
+                                     types_mapper=_string_dtype)
+
+    def save(self, table: str, version: str, df: pd.DataFrame) -> str:
+        """Write the snapshot atomically and delete older versions of the table"""
+        import pyarrow as pa
+
+        os.makedirs(self.directory, exist_ok=True)
+        arrow_table = pa.Table.from_pandas(df, preserve_index=False).replace_schema_metadata(None)
+        # One chunk per column and 64-bit string offsets are what make the
+        # pandas conversion zero-copy
+        arrow_table = arrow_table.cast(pa.schema([
+            pa.field(f.name, pa.large_string()) if f.type == pa.string() else f
+            for f in arrow_table.schema
+        ])).combine_chunks()
+
+        path = self.path(table, version)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with pa.OSFile(tmp_path, 'wb') as sink:
+            with pa.ipc.new_file(sink, arrow_table.schema) as writer:
+                writer.write_table(arrow_table, max_chunksize=max(len(arrow_table), 1))
+        os.replace(tmp_path, path)
+
+        for stale in glob.glob(os.path.join(self.directory, f"{table}-*.arrow")):
+            if stale != path:
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+        return path
+
+
+def default_frame_store() -> Optional[FrameStore]:
+    """Build the store unless FRAME_STORE_ENABLED turns it off"""
+    if os.getenv('FRAME_STORE_ENABLED', '1').lower() in ('0', 'false', 'off'):
+        return None
+    return FrameStore()
@@ -0,0 +1,281 @@
+"""Static scan of analysis code for the DataFrames and columns it reads.
+
+Most generated snippets touch two or three columns of loans_df and never
+look at transactions_df. frame_columns() walks the code's AST from every
+use of a frame and follows it through row-only steps (boolean masks,
+.loc[mask], head, sort_values, ...) until a column is picked:
+
+    df = loans_df[loans_df['province'] == 'ON']         # alias, rows only
+    df.groupby('loan_type')['defaulted'].mean()         # -> loan_type, defaulted
+
+Any use it can't prove column-limited marks that frame as needed in full:
+passing the frame to a function, .describe(), .iloc[:, 2], a column name
+held in a variable, or rows left whole in `result` (which the tool
+prints) or in a variable that is never read again. Dynamic access (eval, getattr, locals(), ...)
+or a syntax error gives up on the whole snippet. Over-loading is always
+the fallback, never a missing column.
+"""
+import ast
+import builtins
+import os
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Set, Union
+
+import pandas as pd
+
+LAZY_FRAMES = os.getenv('LAZY_FRAMES_ENABLED', '1').lower() not in ('0', 'false', 'off')
+
+# Names that reach variables or attributes by string
+_DYNAMIC = {'eval', 'exec', 'compile', 'globals', 'locals', 'vars', 'dir',
+            'getattr', 'setattr', 'delattr', '__import__'}
+# Methods that keep a frame's columns and only drop or reorder rows
+_ROW_METHODS = {'head', 'tail', 'sample', 'copy', 'sort_index', 'sort_values',
+                'nlargest', 'nsmallest', 'drop_duplicates', 'dropna'}
+# ...of which these read every column unless given subset=
+_SUBSET_METHODS = {'drop_duplicates', 'dropna'}
+# Series methods that return a boolean mask
+_MASK_METHODS = {'isin', 'between', 'isna', 'isnull', 'notna', 'notnull', 'duplicated',
+                 'contains', 'startswith', 'endswith', 'match', 'fullmatch'}
+# Attributes that need the frame's rows but none of its columns
+_ROW_ATTRIBUTES = {'index', 'empty'}
+# Group-by results that read only the group keys
+_GROUP_ATTRIBUTES = {'size', 'ngroups', 'groups', 'indices'}
+# The variable the tool reads the answer from
+_RESULT = 'result'
+# Names a method argument may use without possibly naming a column: the
+# modules in scope and builtins (str, round, ...) the code doesn't rebind
+_MODULES = {'pd', 'np'}
+_BUILTINS = set(dir(builtins)) - _DYNAMIC
+
+# What following one use of a frame found: True (only the columns
+# recorded), False (the whole frame) or a variable the rows were assigned to
+_Trace = Union[bool, str]
+
+
+def _constant_columns(node: ast.AST) -> Optional[List[str]]:
+    """The column names of df['a'] / df[['a', 'b']], or None"""
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return [node.value]
+    if isinstance(node, ast.List) and all(
+            isinstance(e, ast.Constant) and isinstance(e.value, str) for e in node.elts):
+        return [e.value for e in node.elts]
+    return None
+
+
+def _is_mask(node: ast.AST) -> bool:
+    """Whether a subscript can only select rows (a slice or a boolean mask)"""
+    if isinstance(node, (ast.Slice, ast.Compare)):
+        return True
+    if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.BitAnd, ast.BitOr, ast.BitXor)):
+        return _is_mask(node.left) and _is_mask(node.right)
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.Invert, ast.Not)):
+        return _is_mask(node.operand)
+    if isinstance(node, ast.BoolOp):
+        return all(_is_mask(v) for v in node.values)
+    return (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+            and node.func.attr in _MASK_METHODS)
+
+
+class _Scan:
+    def __init__(self, tree: ast.AST, frames: Set[str]):
+        self.frames = frames
+        self.parents: Dict[ast.AST, ast.AST] = {}
+        self.loads: Dict[str, List[ast.Name]] = defaultdict(list)
+        self.bound: Counter = Counter()
+        self.dynamic = False
+
+        for node in ast.walk(tree):
+            for child in ast.iter_child_nodes(node):
+                self.parents[child] = node
+            if isinstance(node, ast.Name):
+                if node.id in _DYNAMIC:
+                    self.dynamic = True
+                if isinstance(node.ctx, ast.Load):
+                    self.loads[node.id].append(node)
+                else:
+                    self.bound[node.id] += 1
+            elif isinstance(node, ast.Attribute) and node.attr.startswith('__'):
+                self.dynamic = True
+            elif isinstance(node, ast.arg):
+                self.bound[node.arg] += 1
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                self.bound[node.name] += 1
+            elif isinstance(node, ast.ExceptHandler) and node.name:
+                self.bound[node.name] += 1
+            elif isinstance(node, ast.alias):
+                self.bound[(node.asname or node.name).split('.')[0]] += 1
+
+    def columns(self, frame: str, known: List[str]) -> Optional[Set[str]]:
+        """Columns of frame the code reads, or None if it may read any"""
+        if self.bound[frame]:
+            return None
+        used: Set[str] = set()
+        names = {frame}
+        pending = [frame]
+        while pending:
+            for node in self.loads.get(pending.pop(), []):
+                found = self._trace(node, set(known), used, names)
+                if found is False:
+                    return None
+                if isinstance(found, str):
+                    # Rows of the frame under another name, assigned only here.
+                    # With no later reads, the rows are all that's left of it
+                    if (self.bound[found] != 1 or found in names or found in self.frames
+                            or not self.loads.get(found)):
+                        return None
+                    names.add(found)
+                    pending.append(found)
+        return used
+
+    def _arguments(self, call: ast.Call, known: Set[str], used: Set[str],
+                   names: Set[str]) -> bool:
+        """Record the columns a method call names; False if an argument may name others"""
+        allowed = self.frames | names | _MODULES | {b for b in _BUILTINS if not self.bound[b]}
+        for keyword in call.keywords:
+            if keyword.arg is None:
+                return False
+        for arg in call.args + [k.value for k in call.keywords]:
+            for node in ast.walk(arg):
+                if isinstance(node, ast.Name) and node.id not in allowed:
+                    return False
+                if isinstance(node, ast.Constant) and node.value in known:
+                    used.add(node.value)
+        return True
+
+    def _trace(self, node: ast.AST, known: Set[str], used: Set[str], names: Set[str]) -> _Trace:
+        current = node
+        while True:
+            parent = self.parents.get(current)
+
+            if isinstance(parent, ast.Subscript) and parent.value is current:
+                selected = _constant_columns(parent.slice)
+                if selected is not None:
+                    used.update(c for c in selected if c in known)
+                    return True
+                if not _is_mask(parent.slice) or not isinstance(parent.ctx, ast.Load):
+                    return False
+                current = parent
+                continue
+
+            if isinstance(parent, ast.Attribute) and parent.value is current:
+                attr = parent.attr
+                if attr in known:
+                    used.add(attr)
+                    return True
+                if attr in _ROW_ATTRIBUTES:
+                    return True
+                outer = self.parents.get(parent)
+                if attr == 'shape':
+                    return (isinstance(outer, ast.Subscript) and isinstance(outer.slice, ast.Constant)
+                            and outer.slice.value == 0)
+                if attr in ('loc', 'iloc'):
+                    if not (isinstance(outer, ast.Subscript) and outer.value is parent):
+                        return False
+                    if isinstance(outer.slice, ast.Tuple):
+                        selected = _constant_columns(outer.slice.elts[-1]) if attr == 'loc' else None
+                        if selected is None or len(outer.slice.elts) != 2:
+                            return False
+                        used.update(c for c in selected if c in known)
+                        return True
+                    if not isinstance(outer.ctx, ast.Load):
+                        return False
+                    current = outer
+                    continue
+                if not (isinstance(outer, ast.Call) and outer.func is parent):
+                    return False
+                if attr in _ROW_METHODS:
+                    if attr in _SUBSET_METHODS and not any(k.arg == 'subset' for k in outer.keywords):
+                        return False
+                    if not self._arguments(outer, known, used, names):
+                        return False
+                    current = outer
+                    continue
+                if attr == 'groupby':
+                    if not self._arguments(outer, known, used, names):
+                        return False
+                    return self._trace_groups(outer, known, used)
+                return False
+
+            if (isinstance(parent, ast.Call) and isinstance(parent.func, ast.Name)
+                    and parent.func.id == 'len' and len(parent.args) == 1 and parent.args[0] is current):
+                return True
+
+            if (isinstance(parent, ast.Assign) and parent.value is current and len(parent.targets) == 1
+                    and isinstance(parent.targets[0], ast.Name) and parent.targets[0].id != _RESULT):
+                return parent.targets[0].id
+
+            return False
+
+    def _trace_groups(self, groupby: ast.Call, known: Set[str], used: Set[str]) -> bool:
+        """Follow df.groupby(...) to the columns it aggregates"""
+        parent = self.parents.get(groupby)
+        if isinstance(parent, ast.Subscript) and parent.value is groupby:
+            selected = _constant_columns(parent.slice)
+            if selected is None:
+                return False
+            used.update(c for c in selected if c in known)
+            return True
+        if not (isinstance(parent, ast.Attribute) and parent.value is groupby):
+            return False
+        if parent.attr in known:
+            used.add(parent.attr)
+            return True
+        if parent.attr in _GROUP_ATTRIBUTES:
+            return True
+        call = self.parents.get(parent)
+        if parent.attr not in ('agg', 'aggregate') or not (isinstance(call, ast.Call) and call.func is parent):
+            return False
+        # .agg({'col': 'sum'}) or named aggregation .agg(total=('col', 'sum'))
+        if len(call.args) == 1 and not call.keywords and isinstance(call.args[0], ast.Dict):
+            keys = call.args[0].keys
+            if not all(isinstance(k, ast.Constant) and isinstance(k.value, str) for k in keys):
+                return False
+            used.update(k.value for k in keys if k.value in known)
+            return True
+        if call.args or not call.keywords:
+            return False
+        for keyword in call.keywords:
+            value = keyword.value
+            if not (keyword.arg and isinstance(value, ast.Tuple) and value.elts
+                    and isinstance(value.elts[0], ast.Constant) and isinstance(value.elts[0].value, str)):
+                return False
+            if value.elts[0].value in known:
+                used.add(value.elts[0].value)
+        return True
+
+
+def frame_columns(code: str, columns: Dict[str, List[str]]) -> Optional[Dict[str, Optional[List[str]]]]:
+    """Frame -> the columns the code reads (None: all of them).
+
+    columns maps each frame name to its column names. Frames the code never
+    mentions are left out. Returns None if the code can't be analysed.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return None
+    scan = _Scan(tree, set(columns))
+    if scan.dynamic:
+        return None
+
+    usage: Dict[str, Optional[List[str]]] = {}
+    for frame, known in columns.items():
+        if frame not in scan.loads and not scan.bound[frame]:
+            continue
+        used = scan.columns(frame, known)
+        if used is None:
+            usage[frame] = None
+        else:
+            # len(df) and df.index still need the rows: keep the first column
+            usage[frame] = [c for c in known if c in used] or known[:1]
+    return usage
+
+
+def select_frames(code: str, frames: Dict[str, pd.DataFrame]) -> Dict[str, pd.DataFrame]:
+    """The frames and columns the code reads, or all of them if that's unknown"""
+    if not LAZY_FRAMES:
+        return frames
+    usage = frame_columns(code, {name: list(df.columns) for name, df in frames.items()})
+    if usage is None:
+        return frames
+    return {name: frames[name] if cols is None else frames[name][cols] for name, cols in usage.items()}
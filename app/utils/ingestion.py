@@ -0,0 +1,156 @@
+"""Append / upsert new rows into banking.db without rebuilding it.
+
+Each batch is loaded in a single write transaction:
+1. rows are validated, dates normalised, and staged in a temp table
+2. for loans, the rollup delta (new rows minus any rows they replace) is
+   folded into loans_rollup
+3. rows are inserted (or upserted on loan_id / transaction_id)
+4. the data-version counter is bumped, so every version-keyed cache
+   (SQL results, semantic answers, row counts) invalidates itself
+
+Readers keep using the pooled read-only connections throughout; the
+database is switched to WAL so they aren't blocked while a batch commits.
+"""
+import sqlite3
+from typing import Any, Dict, Iterable, List, Union
+
+import pandas as pd
+
+from utils.data_version import DB_PATH, bump_data_version
+from utils.rollups import ROLLUP_TABLE, apply_rollup_delta, rollup_select_sql
+
+# Table -> (key column, date column stored as 'YYYY-MM-DD HH:MM:SS' text)
+TABLES = {
+    'loans': ('loan_id', 'application_date'),
+    'transactions': ('transaction_id', 'timestamp'),
+}
+
+MODES = ('append', 'upsert')
+
+
+def _table_columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def _prepare(frame: pd.DataFrame, table: str, columns: List[str]) -> pd.DataFrame:
+    """Check the batch has exactly the table's columns and normalise dates"""
+    missing = [c for c in columns if c not in frame.columns]
+    extra = [c for c in frame.columns if c not in columns]
+    if missing or extra:
+        raise ValueError(
+            f"{table} rows must have columns {columns}"
+            + (f"; missing {missing}" if missing else "")
+            + (f"; unexpected {extra}" if extra else "")
+        )
+
+    key, date_column = TABLES[table]
+    if frame[key].isna().any():
+        raise ValueError(f"every {table} row needs a {key}")
+    if frame[key].duplicated().any():
+        raise ValueError(f"duplicate {key} values in the batch")
+
+    frame = frame[columns].copy()
+    frame[date_column] = pd.to_datetime(frame[date_column]).dt.strftime('%Y-%m-%d %H:%M:%S')
+    return frame.astype(object).where(frame.notna(), None)
+
+
+def _has_rollups(conn: sqlite3.Connection) -> bool:
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (ROLLUP_TABLE,)
+    ).fetchone() is not None
+
+
+def ingest(table: str, rows: Union[pd.DataFrame, Iterable[Dict[str, Any]]],
+           mode: str = 'append', db_path: str = DB_PATH) -> Dict[str, Any]:
+    """Load a batch of loans or transactions in one transaction.
+
+    mode='append' fails the whole batch if any key already exists;
+    mode='upsert' replaces existing rows with the same key. Returns counts
+    of inserted / updated rows and the new data version.
+    """
+    if table not in TABLES:
+        raise ValueError(f"unknown table {table!r}; expected one of {list(TABLES)}")
+    if mode not in MODES:
+        raise ValueError(f"unknown mode {mode!r}; expected one of {list(MODES)}")
+
+    frame = rows if isinstance(rows, pd.DataFrame) else pd.DataFrame(list(rows))
+    key, _ = TABLES[table]
+
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        columns = _table_columns(conn, table)
+        if not columns:
+            raise ValueError(f"{db_path} has no {table} table; run generate_data.py first")
+        frame = _prepare(frame, table, columns)
+        if frame.empty:
+            return {'table': table, 'inserted': 0, 'updated': 0, 'data_version': None}
+
+        # Upserts need a unique key; also speeds up the staged-row lookups
+        conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS ux_{table}_{key} ON {table} ({key})")
+
+        column_list = ", ".join(columns)
+        placeholders = ", ".join("?" for _ in columns)
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(f"DROP TABLE IF EXISTS temp.staged_{table}")
+            conn.execute(f"CREATE TEMP TABLE staged_{table} AS SELECT * FROM {table} WHERE 0")
+            conn.executemany(
+                f"INSERT INTO staged_{table} ({column_list}) VALUES ({placeholders})",
+                frame.itertuples(index=False, name=None)
+            )
+
+            existing = conn.execute(
+                f"SELECT COUNT(*) FROM staged_{table} WHERE {key} IN (SELECT {key} FROM {table})"
+            ).fetchone()[0]
+            if existing and mode == 'append':
+                raise ValueError(
+                    f"{existing} {table} rows already exist; use mode='upsert' to replace them"
+                )
+
+            if table == 'loans' and _has_rollups(conn):
+                replaced = f" WHERE {key} IN (SELECT {key} FROM staged_{table})"
+                apply_rollup_delta(
+                    conn,
+                    f"{rollup_select_sql(f'staged_{table}')} "
+                    f"UNION ALL {rollup_select_sql('loans', replaced, sign=-1)}"
+                )
+                conn.execute(
+                    "UPDATE rollup_state SET source_rows = source_rows + ? WHERE table_name = ?",
+                    (len(frame) - existing, ROLLUP_TABLE)
+                )
+
+            updates = ", ".join(f"{c} = excluded.{c}" for c in columns if c != key)
+            conn.execute(
+                f"INSERT INTO {table} ({column_list}) SELECT {column_list} FROM staged_{table} "
+                f"WHERE true ON CONFLICT({key}) DO UPDATE SET {updates}"
+            )
+            conn.execute(f"DROP TABLE temp.staged_{table}")
+            version = bump_data_version(conn)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+
+    return {
+        'table': table,
+        'inserted': len(frame) - existing,
+        'updated': existing,
+        'data_version': version,
+    }
+
+
+def read_batch(path: str) -> pd.DataFrame:
+    """Read a CSV, JSON-lines or Parquet file of rows to ingest"""
+    if path.endswith('.csv'):
+        return pd.read_csv(path)
+    if path.endswith('.jsonl') or path.endswith('.ndjson'):
+        return pd.read_json(path, lines=True)
+    if path.endswith('.json'):
+        return pd.read_json(path)
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    raise ValueError(f"unsupported file type: {path}")
@@ -0,0 +1,149 @@
+"""Per-node timing, token and tool accounting.
+
+Nodes report their stats under metadata['nodes'][<node>]; at the end of a
+run those stats are summarised into the run metadata and appended, one JSON
+record per node plus one per run, to a local trace file.
+"""
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+DEFAULT_TRACE_PATH = 'app/data/traces/agent_trace.jsonl'
+
+_trace_lock = threading.Lock()
+
+
+def deep_merge(left: Dict[str, Any], right: Dict[str, Any]) -> Dict[str, Any]:
+    """Recursively merge right into a copy of left"""
+    merged = dict(left or {})
+    for key, value in (right or {}).items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = deep_merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def node_stats(node: str, **stats) -> Dict[str, Any]:
+    """Metadata fragment recording stats for one node"""
+    return {"nodes": {node: stats}}
+
+
+def add_llm_call(metadata: Dict[str, Any], node: str, duration: float,
+                 prompt_tokens: int, completion_tokens: int, cache: Optional[str]) -> Dict[str, Any]:
+    """Accumulate one LLM call into a node's stats (a node may call it more than once)"""
+    current = metadata.get("nodes", {}).get(node, {})
+    return deep_merge(metadata, node_stats(
+        node,
+        llm_calls=current.get("llm_calls", 0) + 1,
+        llm_duration=current.get("llm_duration", 0.0) + duration,
+        prompt_tokens=current.get("prompt_tokens", 0) + prompt_tokens,
+        completion_tokens=current.get("completion_tokens", 0) + completion_tokens,
+        **({"cache": cache} if cache else {})
+    ))
+
+
+def tool_stats(node: str, tool: str, result: str, duration: float,
+               tool_input: Optional[str] = None) -> Dict[str, Any]:
+    """Stats for a tool call, read from the tool's formatted output.
+
+    SQL text is kept so the trace doubles as a log of the agent's queries.
+    """
+    rows = None
+    extra = {}
+    if tool == 'sql':
+        extra['sql'] = tool_input
+        match = re.search(r'Returned (?:more than )?(\d+) rows', result)
+        rows = int(match.group(1)) if match else 0
+    elif tool == 'docs':
+        rows = result.count('--- Source:')
+
+    return node_stats(
+        node,
+        tool=tool,
+        tool_duration=duration,
+        tool_rows=rows,
+        tool_bytes=len(result.encode('utf-8')),
+        **extra
+    )
+
+
+def summarize(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Run-level totals derived from the per-node stats"""
+    nodes = metadata.get("nodes", {})
+    prompt = sum(n.get("prompt_tokens", 0) for n in nodes.values())
+    completion = sum(n.get("completion_tokens", 0) for n in nodes.values())
+    return {
+        "prompt_tokens": prompt,
+        "completion_tokens": completion,
+        "estimated_tokens": prompt + completion,
+        "llm_calls": sum(n.get("llm_calls", 0) for n in nodes.values()),
+        "tools_used": [n["tool"] for name, n in nodes.items() if n.get("tool")],
+    }
+
+
+def trace_records(state: Dict[str, Any]) -> List[Dict[str, Any]]:
+    metadata = state.get('metadata', {})
+    base = {
+        "timestamp": time.time(),
+        "run_id": state.get('run_id'),
+    }
+    records = [
+        {**base, "type": "node", "node": node, **stats}
+        for node, stats in metadata.get("nodes", {}).items()
+    ]
+    records.append({
+        **base,
+        "type": "run",
+        "query": state.get('query'),
+        "model": metadata.get('model'),
+        "success": metadata.get('success'),
+        "error": metadata.get('error'),
+        "duration": metadata.get('duration'),
+        "path_taken": metadata.get('path_taken'),
+        **summarize(metadata),
+    })
+    return records
+
+
+def write_trace(state: Dict[str, Any]) -> None:
+    """Append the run's node and run records to the JSONL trace file.
+
+    Set AGENT_TRACE_ENABLED=0 to turn tracing off and AGENT_TRACE_PATH to
+    move the file.
+    """
+    if os.getenv('AGENT_TRACE_ENABLED', '1').lower() in ('0', 'false', 'off'):
+        return
+
+    path = os.getenv('AGENT_TRACE_PATH', DEFAULT_TRACE_PATH)
+    try:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        lines = "".join(json.dumps(r, default=str) + "\n" for r in trace_records(state))
+        with _trace_lock, open(path, 'a') as f:
+            f.write(lines)
+    except OSError as e:
+        print(f"⚠️ Could not write trace: {e}")
+
+
+def recorded_sql(path: Optional[str] = None) -> List[str]:
+    """Distinct SQL queries the agent ran, in first-seen order, from the trace file"""
+    path = path or os.getenv('AGENT_TRACE_PATH', DEFAULT_TRACE_PATH)
+    queries: List[str] = []
+    if not os.path.exists(path):
+        return queries
+
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            sql = record.get('sql')
+            if record.get('type') == 'node' and sql and sql not in queries:
+                queries.append(sql)
+    return queries
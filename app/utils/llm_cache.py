@@ -0,0 +1,214 @@
+"""Response cache for deterministic (temperature=0) LLM calls.
+
+Responses are keyed on a hash of the model name and every message in the
+prompt. The default cache is two-tiered: an in-process LRU in front of an
+on-disk SQLite store, both with a TTL and a maximum entry count.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+DEFAULT_CACHE_PATH = 'app/data/cache/llm_cache.db'
+
+
+def make_cache_key(model: str, messages: list) -> str:
+    """Stable hash of the model and the (role, content) of each message"""
+    payload = json.dumps(
+        [model, [[m.type, m.content] for m in messages]],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache(ABC):
+    """Interface every cache layer implements"""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: str, created_at: Optional[float] = None) -> None:
+        """Store value; created_at (default now) is when its TTL started"""
+        ...
+
+    def get_entry(self, key: str) -> Optional[Tuple[str, Optional[float]]]:
+        """(value, created_at) of a live entry; created_at is None if the layer doesn't track it"""
+        value = self.get(key)
+        return None if value is None else (value, None)
+
+    @abstractmethod
+    def clear(self) -> None:
+        ...
+
+
+class MemoryLRUCache(ResponseCache):
+    """Thread-safe in-process LRU with a TTL"""
+
+    def __init__(self, max_entries: int = 1000, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self.get_entry(key)
+        return None if entry is None else entry[0]
+
+    def get_entry(self, key: str) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self.ttl is not None and time.time() - entry[1] > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, value: str, created_at: Optional[float] = None) -> None:
+        with self._lock:
+            self._entries[key] = (value, time.time() if created_at is None else created_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteResponseCache(ResponseCache):
+    """On-disk cache that survives restarts, evicting least recently used rows"""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = 10000,
+                 ttl: Optional[float] = None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS llm_responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )"""
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_llm_responses_last_access "
+            "ON llm_responses (last_access)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self.get_entry(key)
+        return None if entry is None else entry[0]
+
+    def get_entry(self, key: str) -> Optional[Tuple[str, float]]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM llm_responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if self.ttl is not None and now - created_at > self.ttl:
+                self._conn.execute("DELETE FROM llm_responses WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute(
+                "UPDATE llm_responses SET last_access = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            return value, created_at
+
+    def set(self, key: str, value: str, created_at: Optional[float] = None) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_responses (key, value, created_at, last_access) "
+                "VALUES (?, ?, ?, ?)",
+                (key, value, now if created_at is None else created_at, now)
+            )
+            if self.ttl is not None:
+                self._conn.execute(
+                    "DELETE FROM llm_responses WHERE created_at < ?", (now - self.ttl,)
+                )
+            self._conn.execute(
+                """DELETE FROM llm_responses WHERE key IN (
+                    SELECT key FROM llm_responses
+                    ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                )""",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_responses")
+            self._conn.commit()
+
+
+class TieredCache(ResponseCache):
+    """Check each layer in order and backfill faster layers on a hit"""
+
+    def __init__(self, layers: List[ResponseCache]):
+        self.layers = layers
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self.get_entry(key)
+        return None if entry is None else entry[0]
+
+    def get_entry(self, key: str) -> Optional[Tuple[str, Optional[float]]]:
+        for i, layer in enumerate(self.layers):
+            entry = layer.get_entry(key)
+            if entry is not None:
+                # Keep the original timestamp so the backfill doesn't extend the TTL
+                for faster in self.layers[:i]:
+                    faster.set(key, *entry)
+                return entry
+        return None
+
+    def set(self, key: str, value: str, created_at: Optional[float] = None) -> None:
+        for layer in self.layers:
+            layer.set(key, value, created_at)
+
+    def clear(self) -> None:
+        for layer in self.layers:
+            layer.clear()
+
+
+def default_llm_cache() -> Optional[ResponseCache]:
+    """Build the cache configured by the LLM_CACHE_* environment variables.
+
+    Returns None when LLM_CACHE_ENABLED is set to 0/false/off.
+    """
+    if os.getenv('LLM_CACHE_ENABLED', '1').lower() in ('0', 'false', 'off'):
+        return None
+
+    ttl = float(os.getenv('LLM_CACHE_TTL', str(7 * 24 * 3600)))
+    return TieredCache([
+        MemoryLRUCache(
+            max_entries=int(os.getenv('LLM_CACHE_MEMORY_ENTRIES', '1000')),
+            ttl=ttl
+        ),
+        SQLiteResponseCache(
+            path=os.getenv('LLM_CACHE_PATH', DEFAULT_CACHE_PATH),
+            max_entries=int(os.getenv('LLM_CACHE_MAX_ENTRIES', '10000')),
+            ttl=ttl
+        ),
+    ])
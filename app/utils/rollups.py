@@ -0,0 +1,449 @@
+"""Materialized rollups of the loans table, and the SQL rewrite that uses them.
+
+Most questions are aggregates of loans over month / quarter / year,
+province, loan type, employment status and credit-score band.
+`loans_rollup` stores counts, default counts and sums / sums of squares of
+the numeric columns at that grain. `rewrite_query` answers a matching
+single-table GROUP BY query from the rollup. A query that can't be mapped
+exactly (other columns, joins, subqueries, dates not on month boundaries)
+returns None and runs against loans as usual.
+"""
+import os
+import re
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from utils.data_version import DB_PATH, db_version
+from utils.sql_cache import tokenize_sql
+
+ROLLUP_TABLE = 'loans_rollup'
+
+QUARTER_SQL = ("strftime('%Y', application_date) || '-Q' || "
+               "((CAST(strftime('%m', application_date) AS INTEGER) + 2) / 3)")
+
+CREDIT_BAND_SQL = """CASE
+        WHEN credit_score < 600 THEN '1. <600'
+        WHEN credit_score < 650 THEN '2. 600-649'
+        WHEN credit_score < 700 THEN '3. 650-699'
+        WHEN credit_score < 750 THEN '4. 700-749'
+        ELSE '5. 750+'
+    END"""
+
+# Rollup dimension -> SQL over loans that it materialises
+DIMENSIONS = {
+    'month': "strftime('%Y-%m', application_date)",
+    'quarter': QUARTER_SQL,
+    'year': "strftime('%Y', application_date)",
+    'province': 'province',
+    'loan_type': 'loan_type',
+    'employment_status': 'employment_status',
+    'credit_band': CREDIT_BAND_SQL,
+}
+
+# Numeric columns with a non-null count, sum and sum of squares
+METRICS = ['defaulted', 'amount', 'income', 'interest_rate', 'credit_score']
+
+LOANS_COLUMNS = {
+    'loan_id', 'application_date', 'loan_type', 'amount', 'interest_rate', 'term_months',
+    'credit_score', 'province', 'customer_age', 'income', 'employment_status',
+    'defaulted', 'days_past_due',
+}
+
+_ENABLED = os.getenv('ROLLUPS_ENABLED', '1').lower() not in ('0', 'false', 'off')
+
+
+def rollup_select_sql(source: str = "loans", where: str = "", sign: int = 1) -> str:
+    """Aggregate rows of a loans-shaped table to the rollup grain.
+
+    sign=-1 negates every measure, giving the delta that removes those rows
+    from the rollup.
+    """
+    neg = "-" if sign < 0 else ""
+    dims = ",\n    ".join(f"{sql} AS {name}" for name, sql in DIMENSIONS.items())
+    measures = ",\n    ".join(
+        f"{neg}COUNT({m}) AS {m}_n, {neg}SUM({m}) AS {m}_sum, {neg}SUM({m} * {m}) AS {m}_sq_sum"
+        for m in METRICS
+    )
+    return f"""SELECT {dims},
+    {neg}COUNT(*) AS loans,
+    {neg}COUNT(loan_id) AS loan_id_n,
+    {measures}
+FROM {source}{where}
+GROUP BY {', '.join(DIMENSIONS)}"""
+
+
+def apply_rollup_delta(conn: sqlite3.Connection, delta_sql: str) -> None:
+    """Fold aggregated deltas (rows shaped like loans_rollup) into the rollup.
+
+    Runs inside the caller's transaction. Only the groups the delta touches
+    are rewritten; groups left with no loans are dropped.
+    """
+    dims = list(DIMENSIONS)
+    measures = [c[1] for c in conn.execute(f"PRAGMA table_info({ROLLUP_TABLE})")
+                if c[1] not in DIMENSIONS]
+    same_group = " AND ".join(f"d.{d} IS r.{d}" for d in dims)
+
+    conn.execute("DROP TABLE IF EXISTS temp.rollup_delta")
+    conn.execute(f"CREATE TEMP TABLE rollup_delta AS {delta_sql}")
+    conn.execute("DROP TABLE IF EXISTS temp.rollup_touched")
+    conn.execute(
+        f"CREATE TEMP TABLE rollup_touched AS SELECT r.* FROM {ROLLUP_TABLE} r "
+        f"WHERE EXISTS (SELECT 1 FROM rollup_delta d WHERE {same_group})"
+    )
+    conn.execute(
+        f"DELETE FROM {ROLLUP_TABLE} AS r "
+        f"WHERE EXISTS (SELECT 1 FROM rollup_delta d WHERE {same_group})"
+    )
+    columns = ", ".join(dims + measures)
+    sums = ", ".join(dims + [f"SUM({m})" for m in measures])
+    conn.execute(
+        f"INSERT INTO {ROLLUP_TABLE} ({columns}) "
+        f"SELECT {sums} FROM ("
+        f"SELECT {columns} FROM rollup_touched UNION ALL SELECT {columns} FROM rollup_delta"
+        f") GROUP BY {', '.join(dims)} HAVING SUM(loans) > 0"
+    )
+    conn.execute("DROP TABLE temp.rollup_delta")
+    conn.execute("DROP TABLE temp.rollup_touched")
+
+
+def build_rollups(db_path: str = DB_PATH) -> int:
+    """(Re)build loans_rollup from scratch; returns the number of rollup rows"""
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            conn.execute(f"DROP TABLE IF EXISTS {ROLLUP_TABLE}")
+            conn.execute(f"CREATE TABLE {ROLLUP_TABLE} AS {rollup_select_sql()}")
+            conn.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_{ROLLUP_TABLE}_month "
+                f"ON {ROLLUP_TABLE} (month, province, loan_type)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rollup_state "
+                "(table_name TEXT PRIMARY KEY, source_rows INTEGER NOT NULL)"
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO rollup_state (table_name, source_rows) "
+                "SELECT ?, COUNT(*) FROM loans", (ROLLUP_TABLE,)
+            )
+        rows = conn.execute(f"SELECT COUNT(*) FROM {ROLLUP_TABLE}").fetchone()[0]
+    finally:
+        conn.close()
+    return rows
+
+
+# database file -> (data version, whether its rollups are current)
+_ready: Dict[str, Tuple[str, bool]] = {}
+_ready_lock = threading.Lock()
+
+
+def _database_path(conn: sqlite3.Connection) -> str:
+    """File of the connection's main database ('' for an in-memory one)"""
+    for _, name, path in conn.execute("PRAGMA database_list"):
+        if name == 'main':
+            return path or ''
+    return ''
+
+
+def rollups_ready(conn: sqlite3.Connection) -> bool:
+    """True when loans_rollup exists and was built from the current loans rows"""
+    path = _database_path(conn)
+    version = db_version(path) if path else None
+    with _ready_lock:
+        cached = _ready.get(path)
+    if version is not None and cached is not None and cached[0] == version:
+        return cached[1]
+    try:
+        recorded = conn.execute(
+            "SELECT source_rows FROM rollup_state WHERE table_name = ?", (ROLLUP_TABLE,)
+        ).fetchone()
+        current = conn.execute("SELECT COUNT(*) FROM loans").fetchone()[0]
+        ready = recorded is not None and recorded[0] == current
+    except sqlite3.Error:
+        ready = False
+    if version is not None:
+        with _ready_lock:
+            _ready[path] = (version, ready)
+    return ready
+
+
+# ----------------------------------------------------------------------
+# Query rewrite
+# ----------------------------------------------------------------------
+
+_CLAUSES = ['select', 'from', 'where', 'group by', 'having', 'order by', 'limit']
+
+_REJECT_TOKENS = {'join', 'union', 'intersect', 'except', 'distinct', 'over', 'with', 'window'}
+
+# Tokens that may appear around rollup columns in a rewritten expression
+_ALLOWED_WORDS = {
+    'and', 'or', 'not', 'in', 'is', 'null', 'between', 'like', 'glob', 'case', 'when',
+    'then', 'else', 'end', 'as', 'asc', 'desc', 'nulls', 'first', 'last', 'round', 'cast',
+    'real', 'integer', 'float', 'numeric', 'text', 'coalesce', 'ifnull', 'nullif', 'abs',
+    'min', 'max', 'printf', 'substr', 'lower', 'upper', 'offset', 'collate', 'nocase',
+}
+
+_MONTH_START = re.compile(r"^'(\d{4})-(\d{2})-01(?: 00:00:00)?'$")
+
+
+def _col(name: str) -> str:
+    return f"{ROLLUP_TABLE}.{name}"
+
+
+def _split_clauses(tokens: List[str]) -> Optional[Dict[str, List[str]]]:
+    """Split top-level SELECT clauses; None if the shape is unsupported"""
+    clauses: Dict[str, List[str]] = {}
+    current, depth, i = None, 0, 0
+    while i < len(tokens):
+        token = tokens[i]
+        pair = f"{token} {tokens[i + 1]}" if i + 1 < len(tokens) else None
+        if token == '(':
+            depth += 1
+        elif token == ')':
+            depth -= 1
+        if depth == 0 and (token in _CLAUSES or pair in _CLAUSES):
+            name = pair if pair in _CLAUSES else token
+            if name in clauses:
+                return None
+            clauses[name] = []
+            current = name
+            i += 2 if name == pair else 1
+            continue
+        if current is None:
+            return None
+        clauses[current].append(token)
+        i += 1
+    return clauses
+
+
+def _split_commas(tokens: List[str]) -> List[List[str]]:
+    items, current, depth = [], [], 0
+    for token in tokens:
+        if token == '(':
+            depth += 1
+        elif token == ')':
+            depth -= 1
+        if token == ',' and depth == 0:
+            items.append(current)
+            current = []
+        else:
+            current.append(token)
+    items.append(current)
+    return items
+
+
+def _replace_sequence(tokens: List[str], pattern: List[str], replacement: List[str]) -> List[str]:
+    out, i = [], 0
+    while i < len(tokens):
+        if tokens[i:i + len(pattern)] == pattern:
+            out.extend(replacement)
+            i += len(pattern)
+        else:
+            out.append(tokens[i])
+            i += 1
+    return out
+
+
+# Longest first so e.g. the quarter expression wins over the year inside it
+_DIMENSION_TOKENS = sorted(
+    ((tokenize_sql(sql), name) for name, sql in DIMENSIONS.items()),
+    key=lambda item: -len(item[0])
+)
+
+
+def _translate(tokens: List[str], aggregates: bool) -> Tuple[Optional[List[str]], bool]:
+    """Map an expression over loans onto loans_rollup columns.
+
+    Returns (tokens, used_aggregate), or (None, False) if some part of the
+    expression has no exact rollup equivalent.
+    """
+    for pattern, name in _DIMENSION_TOKENS:
+        tokens = _replace_sequence(tokens, pattern, [_col(name)])
+
+    # Date-range filters on month boundaries
+    out, i = [], 0
+    while i < len(tokens):
+        if (tokens[i] == 'application_date' and i + 2 < len(tokens)
+                and tokens[i + 1] in ('>=', '<') and _MONTH_START.match(tokens[i + 2])):
+            year, month = _MONTH_START.match(tokens[i + 2]).groups()
+            out.extend([_col('month'), tokens[i + 1], f"'{year}-{month}'"])
+            i += 3
+        else:
+            out.append(tokens[i])
+            i += 1
+    tokens = out
+
+    used_aggregate = False
+    out, i = [], 0
+    while i < len(tokens):
+        window = tokens[i:i + 4]
+        if (len(window) == 4 and window[1] == '(' and window[3] == ')'
+                and window[0] in ('count', 'sum', 'avg', 'total')
+                and not window[2].startswith(f"{ROLLUP_TABLE}.")):
+            func, arg = window[0], window[2]
+            replacement = None
+            if func == 'count' and arg in ('*', '1'):
+                replacement = ['coalesce', '(', 'sum', '(', _col('loans'), ')', ',', '0', ')']
+            elif func == 'count' and arg in METRICS + ['loan_id']:
+                replacement = ['coalesce', '(', 'sum', '(', _col(f'{arg}_n'), ')', ',', '0', ')']
+            elif func == 'sum' and arg in METRICS:
+                replacement = ['sum', '(', _col(f'{arg}_sum'), ')']
+            elif func == 'total' and arg in METRICS:
+                replacement = ['total', '(', _col(f'{arg}_sum'), ')']
+            elif func == 'avg' and arg in METRICS:
+                replacement = ['(', 'sum', '(', _col(f'{arg}_sum'), ')', '*', '1.0', '/',
+                               'sum', '(', _col(f'{arg}_n'), ')', ')']
+            if replacement is None:
+                return None, False
+            if not aggregates:
+                return None, False
+            out.extend(replacement)
+            used_aggregate = True
+            i += 4
+        else:
+            out.append(tokens[i])
+            i += 1
+
+    for token in out:
+        if token.startswith(f"{ROLLUP_TABLE}.") or token in ('sum', 'total'):
+            continue
+        if token[0] in "'0123456789." or not (token[0].isalpha() or token[0] in '_"`['):
+            continue
+        if token not in _ALLOWED_WORDS:
+            return None, False
+    return out, used_aggregate
+
+
+def _strip_alias(tokens: List[str], table_alias: Optional[str]) -> List[str]:
+    """Drop `loans.` / `<alias>.` qualifiers"""
+    out, i = [], 0
+    while i < len(tokens):
+        if tokens[i] in ('loans', table_alias) and i + 1 < len(tokens) and tokens[i + 1] == '.':
+            i += 2
+            continue
+        out.append(tokens[i])
+        i += 1
+    return out
+
+
+def _select_item(tokens: List[str]) -> Tuple[List[str], Optional[str]]:
+    """Split `expr [AS] alias`"""
+    if len(tokens) > 2 and tokens[-2] == 'as':
+        return tokens[:-2], tokens[-1]
+    if (len(tokens) > 1 and re.match(r'^[a-z_]\w*$', tokens[-1])
+            and tokens[-1] not in _ALLOWED_WORDS
+            and (tokens[-2] == ')' or re.match(r'^[a-z_]\w*$', tokens[-2]))):
+        return tokens[:-1], tokens[-1]
+    return tokens, None
+
+
+def _inline_aliases(tokens: List[str], aliases: Dict[str, List[str]]) -> Optional[List[str]]:
+    """Replace references to select aliases with their (translated) expressions.
+
+    A GROUP BY / HAVING name that is also a loans column means the column in
+    SQLite, so such ambiguous aliases are not rewritten.
+    """
+    out = []
+    for token in tokens:
+        if token in aliases:
+            if token in LOANS_COLUMNS:
+                return None
+            out.extend(['('] + aliases[token] + [')'])
+        else:
+            out.append(token)
+    return out
+
+
+def rewrite_query(conn: sqlite3.Connection, query: str) -> Optional[str]:
+    """Rewrite an aggregate over loans to run against loans_rollup.
+
+    Returns the rewritten SQL, or None when rollups are disabled, stale, or
+    the query can't be answered from them exactly.
+    """
+    if not _ENABLED:
+        return None
+
+    tokens = tokenize_sql(query)
+    if not tokens or tokens[0] != 'select' or tokens.count('select') != 1:
+        return None
+    if _REJECT_TOKENS & set(tokens) or any(t[0] in '"`[?:@$' for t in tokens):
+        return None
+
+    clauses = _split_clauses(tokens)
+    if clauses is None or 'from' not in clauses:
+        return None
+
+    source = clauses['from']
+    if source == ['loans']:
+        table_alias = None
+    elif len(source) == 2 and source[0] == 'loans':
+        table_alias = source[1]
+    elif len(source) == 3 and source[:2] == ['loans', 'as']:
+        table_alias = source[2]
+    else:
+        return None
+
+    if not rollups_ready(conn):
+        return None
+
+    clauses = {k: _strip_alias(v, table_alias) for k, v in clauses.items()}
+    grouped = 'group by' in clauses
+
+    # Keep the original result column names; LIMIT 0 returns them without running the query
+    try:
+        original = conn.execute(f"SELECT * FROM ({query.strip().rstrip(';')}) LIMIT 0")
+        names = [d[0] for d in original.description]
+    except sqlite3.Error:
+        return None
+
+    # SELECT list
+    select_parts, aliases, any_aggregate = [], {}, False
+    items = _split_commas(clauses['select'])
+    if len(items) != len(names):
+        return None
+    for item, name in zip(items, names):
+        expr, alias = _select_item(item)
+        translated, used_aggregate = _translate(expr, aggregates=True)
+        if translated is None:
+            return None
+        if not grouped and not used_aggregate:
+            return None
+        any_aggregate = any_aggregate or used_aggregate
+        if alias:
+            aliases[alias] = translated
+        quoted = '"' + name.replace('"', '""') + '"'
+        select_parts.append(" ".join(translated + ['as', quoted]))
+    if not grouped and not any_aggregate:
+        return None
+
+    rewritten = f"SELECT {', '.join(select_parts)} FROM {ROLLUP_TABLE}"
+
+    if 'where' in clauses:
+        where, used_aggregate = _translate(clauses['where'], aggregates=False)
+        if where is None:
+            return None
+        rewritten += f" WHERE {' '.join(where)}"
+
+    for clause, keyword in (('group by', 'GROUP BY'), ('having', 'HAVING'), ('order by', 'ORDER BY')):
+        if clause not in clauses:
+            continue
+        parts = []
+        for item in _split_commas(clauses[clause]):
+            if len(item) >= 1 and re.match(r'^\d+$', item[0]) and all(t in ('asc', 'desc') for t in item[1:]):
+                parts.append(" ".join(item))  # ordinal reference
+                continue
+            inlined = _inline_aliases(item, aliases)
+            if inlined is None:
+                return None
+            translated, _ = _translate(inlined, aggregates=clause != 'group by')
+            if translated is None:
+                return None
+            parts.append(" ".join(translated))
+        rewritten += f" {keyword} {', '.join(parts)}"
+
+    if 'limit' in clauses:
+        if not all(re.match(r'^\d+$', t) or t in (',', 'offset') for t in clauses['limit']):
+            return None
+        rewritten += f" LIMIT {' '.join(clauses['limit'])}"
+
+    return rewritten
@@ -0,0 +1,88 @@
+"""Limits for running LLM-written analysis code.
+
+- restricted_builtins(): the builtins the code gets. There is no open(),
+  eval/exec/compile or input(), and imports are limited to ALLOWED_MODULES.
+- scrub_environment(): drops API keys and other secrets from os.environ
+  in a worker before any job runs.
+- limit_memory() / limit_cpu(): kernel rlimits (RLIMIT_AS, RLIMIT_CPU), so
+  a job fails with MemoryError or is killed by SIGXCPU even between the
+  pool's polls.
+
+These limits guard against accidents and casual misuse. They are not an
+isolation boundary: Python code can still reach the os module through
+objects it is given (e.g. pandas internals). Run the agent under OS-level
+isolation (a container, seccomp, a separate user) if the code could be
+hostile.
+"""
+import builtins
+import math
+import os
+from typing import Any, Dict, Optional
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# Top-level modules analysis code may import
+ALLOWED_MODULES = {
+    'pandas', 'numpy', 'math', 'statistics', 'datetime', 'calendar', 'time', 're',
+    'collections', 'itertools', 'functools', 'operator', 'decimal', 'fractions',
+    'json', 'string', 'textwrap',
+}
+# Builtins that read files, run code from strings or reach other frames
+_BLOCKED_BUILTINS = {'open', 'eval', 'exec', 'compile', 'input', 'breakpoint', 'help',
+                     'exit', 'quit', 'globals', 'locals', 'vars', 'memoryview'}
+# Environment variables workers keep; everything else (API keys) is dropped
+_KEPT_ENVIRONMENT = {'PATH', 'HOME', 'LANG', 'LC_ALL', 'LC_CTYPE', 'TZ', 'TMPDIR'}
+
+
+def _import(name, globals=None, locals=None, fromlist=(), level=0):
+    if level != 0 or name.split('.')[0] not in ALLOWED_MODULES:
+        raise ImportError(f"import of {name!r} is not allowed in analysis code")
+    return builtins.__import__(name, globals, locals, fromlist, level)
+
+
+def restricted_builtins() -> Dict[str, Any]:
+    safe = {name: value for name, value in vars(builtins).items() if name not in _BLOCKED_BUILTINS}
+    safe['__import__'] = _import
+    return safe
+
+
+def scrub_environment() -> None:
+    for name in list(os.environ):
+        if name not in _KEPT_ENVIRONMENT:
+            del os.environ[name]
+
+
+def _virtual_memory() -> Optional[int]:
+    """Bytes of address space the process has mapped (Linux only)"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmSize:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def limit_memory(extra_bytes: int) -> None:
+    """Cap the address space at what is mapped now (shared tables included) plus extra_bytes"""
+    current = _virtual_memory()
+    if resource is None or current is None:
+        return
+    limit = current + extra_bytes
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def limit_cpu(seconds: float) -> None:
+    """Let the process use `seconds` more CPU time before SIGXCPU kills it"""
+    if resource is None:
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    soft = math.ceil(usage.ru_utime + usage.ru_stime + seconds)
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
@@ -0,0 +1,213 @@
+"""Schema catalog for the SQL and analysis prompts.
+
+banking.db is introspected once per data version: columns and types, row
+counts, the exact values of low-cardinality columns (so the LLM writes
+'ON', not 'Ontario'), date ranges and numeric ranges. When a load changes
+the data but not the schema, only the counts, ranges and listed values
+are read again. The rendered block is deterministic for a given version,
+so prompts that start with it keep a stable prefix that providers can
+prompt-cache.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, Optional, Tuple
+
+from utils.backends import COMPACT_DTYPES, DATE_COLUMNS, DTYPES, TABLES
+from utils.data_version import DB_PATH, db_version
+from utils.db import read_connection
+
+# Columns with at most this many distinct values have them listed
+MAX_DISTINCT = int(os.getenv('SCHEMA_MAX_DISTINCT', '12'))
+
+# db_path -> (data version, schema signature, catalog)
+_catalogs: Dict[str, Tuple[str, str, Dict[str, Any]]] = {}
+_catalogs_lock = threading.Lock()
+
+
+def schema_signature(conn: sqlite3.Connection) -> str:
+    """Hash of the CREATE TABLE statements of the catalogued tables"""
+    placeholders = ", ".join("?" for _ in TABLES)
+    rows = conn.execute(
+        f"SELECT name, sql FROM sqlite_master WHERE type = 'table' AND name IN ({placeholders}) ORDER BY name",
+        list(TABLES)
+    ).fetchall()
+    return hashlib.sha256(repr(rows).encode()).hexdigest()[:16]
+
+
+def _stats(conn: sqlite3.Connection, table: str, names) -> Tuple:
+    """Row count, then MIN and MAX of each column, in one scan"""
+    ranges = ", ".join(f'MIN("{name}"), MAX("{name}")' for name in names)
+    return conn.execute(f"SELECT COUNT(*), {ranges} FROM {table}").fetchone()
+
+
+def _distinct(conn: sqlite3.Connection, table: str, name: str) -> Optional[list]:
+    """The column's values, or None if it has more than MAX_DISTINCT"""
+    # LIMIT stops high-cardinality columns (ids) after a few rows
+    values = [row[0] for row in conn.execute(
+        f'SELECT DISTINCT "{name}" FROM {table} WHERE "{name}" IS NOT NULL LIMIT {MAX_DISTINCT + 1}'
+    )]
+    return sorted(values) if len(values) <= MAX_DISTINCT else None
+
+
+def _introspect_table(conn: sqlite3.Connection, table: str) -> Dict[str, Any]:
+    columns = [(row[1], row[2] or 'ANY') for row in conn.execute(f"PRAGMA table_info({table})")]
+    stats = _stats(conn, table, [name for name, _ in columns])
+
+    info = {'rows': stats[0], 'columns': []}
+    for i, (name, sql_type) in enumerate(columns):
+        info['columns'].append({
+            'name': name,
+            'type': sql_type,
+            'date': name in DATE_COLUMNS.get(table, []),
+            'min': stats[1 + 2 * i],
+            'max': stats[2 + 2 * i],
+            'values': _distinct(conn, table, name),
+        })
+    return info
+
+
+def _refresh_table(conn: sqlite3.Connection, table: str, info: Dict[str, Any]) -> Dict[str, Any]:
+    """The table's catalog with row count, ranges and listed values re-read.
+
+    Skips the schema read, and the DISTINCT scans of columns that already
+    had too many values to list.
+    """
+    stats = _stats(conn, table, [c['name'] for c in info['columns']])
+    columns = []
+    for i, column in enumerate(info['columns']):
+        values = column['values']
+        if values is not None:
+            values = _distinct(conn, table, column['name'])
+        columns.append({**column, 'min': stats[1 + 2 * i], 'max': stats[2 + 2 * i], 'values': values})
+    return {'rows': stats[0], 'columns': columns}
+
+
+def schema_catalog(db_path: str = DB_PATH) -> Dict[str, Any]:
+    """Table -> row count and per-column stats, cached per data version.
+
+    Raises sqlite3.Error if the database can't be read.
+    """
+    version = db_version(db_path)
+    with _catalogs_lock:
+        cached = _catalogs.get(db_path)
+    if cached is not None and cached[0] == version:
+        return cached[2]
+
+    with read_connection(db_path) as conn:
+        signature = schema_signature(conn)
+        if cached is not None and cached[1] == signature:
+            catalog = {table: _refresh_table(conn, table, info) for table, info in cached[2].items()}
+        else:
+            catalog = {table: _introspect_table(conn, table) for table in TABLES}
+
+    with _catalogs_lock:
+        _catalogs[db_path] = (version, signature, catalog)
+    return catalog
+
+
+def _literal(value: Any) -> str:
+    if isinstance(value, str):
+        return repr(value)
+    if isinstance(value, float):
+        return f"{value:.2f}".rstrip('0').rstrip('.')
+    return str(value)
+
+
+# SQLite declared type -> pandas dtype of a column without a compact dtype
+_PANDAS_TYPES = {'TEXT': 'object', 'REAL': 'float64', 'INTEGER': 'int64'}
+
+
+def _pandas_type(table: str, column: Dict[str, Any]) -> str:
+    dtype = DTYPES.get(table, {}).get(column['name']) if COMPACT_DTYPES else None
+    if dtype is None:
+        return _PANDAS_TYPES.get(column['type'], 'object')
+    return 'string' if dtype.startswith('string') else dtype
+
+
+def _describe_column(table: str, column: Dict[str, Any], dataframes: bool) -> str:
+    if column['date']:
+        sql_type = 'datetime64' if dataframes else f"{column['type']} text 'YYYY-MM-DD HH:MM:SS'"
+        line = f"{column['name']} {sql_type}"
+        if column['min'] is not None:
+            line += f", {str(column['min'])[:10]} to {str(column['max'])[:10]}"
+        return line
+
+    line = f"{column['name']} {_pandas_type(table, column) if dataframes else column['type']}"
+    if column['values'] is not None:
+        return line + ": " + ", ".join(_literal(v) for v in column['values'])
+    if column['min'] is None:
+        return line + ", all null"
+    if isinstance(column['min'], str):
+        return line + f", e.g. {_literal(column['min'])}"
+    return line + f", {_literal(column['min'])} to {_literal(column['max'])}"
+
+
+def render_schema(catalog: Dict[str, Any], dataframes: bool = False) -> str:
+    """Compact schema block: one line per column.
+
+    dataframes=True names the tables loans_df / transactions_df as the
+    analysis tool exposes them, with their pandas dtypes.
+    """
+    lines = []
+    for table, info in catalog.items():
+        name = f"{table}_df" if dataframes else table
+        lines.append(f"- {name} ({info['rows']:,} rows)")
+        lines.extend(f"    {_describe_column(table, c, dataframes)}" for c in info['columns'])
+    return "\n".join(lines)
+
+
+def schema_prompt(dataframes: bool = False, db_path: Optional[str] = None) -> str:
+    """The rendered catalog for the current data, or a note if it can't be read"""
+    try:
+        catalog = schema_catalog(db_path or DB_PATH)
+    except sqlite3.Error as e:
+        print(f"⚠️ Could not introspect the database schema: {e}")
+        return "(schema unavailable: banking.db could not be read)"
+    return render_schema(catalog, dataframes)
+
+
+# Full names of the province codes in loans.province, so "in Ontario" is
+# recognised as well as "in ON"
+PROVINCE_NAMES = {
+    'AB': 'Alberta', 'BC': 'British Columbia', 'MB': 'Manitoba', 'NB': 'New Brunswick',
+    'NL': 'Newfoundland and Labrador', 'NS': 'Nova Scotia', 'NT': 'Northwest Territories',
+    'NU': 'Nunavut', 'ON': 'Ontario', 'PE': 'Prince Edward Island', 'QC': 'Quebec',
+    'SK': 'Saskatchewan', 'YT': 'Yukon',
+}
+
+
+@lru_cache(maxsize=None)
+def _value_pattern(value: str) -> "re.Pattern":
+    """Codes ('ON') match as written; other values in any case, with
+    hyphens or spaces, singular or plural ('self employed', 'mortgages')"""
+    if value.isupper() and len(value) <= 3:
+        return re.compile(rf'\b{re.escape(value)}\b')
+    words = re.split(r'[\s-]+', value.lower())
+    return re.compile(r'\b' + r'[\s-]+'.join(map(re.escape, words)) + r's?\b', re.IGNORECASE)
+
+
+def mentioned_values(text: str, db_path: Optional[str] = None) -> FrozenSet[str]:
+    """The categorical values a question names, as 'column=value'.
+
+    Values are those the catalog lists for text columns; province names
+    count as their code. Only province names are found if the catalog
+    can't be read.
+    """
+    try:
+        catalog = schema_catalog(db_path or DB_PATH)
+    except sqlite3.Error:
+        catalog = {}
+    found = set()
+    for info in catalog.values():
+        for column in info['columns']:
+            for value in column['values'] or []:
+                if isinstance(value, str) and _value_pattern(value).search(text):
+                    found.add(f"{column['name']}={value}")
+    for code, name in PROVINCE_NAMES.items():
+        if _value_pattern(name).search(text):
+            found.add(f"province={code}")
+    return frozenset(found)
@@ -0,0 +1,231 @@
+"""Answer cache for near-duplicate questions.
+
+Each successful run stores the query embedding and its final state. A new
+query whose embedding is close enough (cosine similarity above the
+threshold) to a stored one gets that answer back, along with where it came
+from. Embeddings can't tell "default rate in Q1 2024" from "default rate in
+Q2 2024", so the numbers, quarters and months in both questions must also
+match. Entries are tied to the banking.db and PDF corpus versions they were
+computed against and are dropped once either changes.
+
+The embeddings are kept in memory as one matrix; a lookup only reads the
+rows other processes added since the last one, and the stored state of the
+hit.
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, FrozenSet, List, Optional
+
+import numpy as np
+
+from utils.data_version import corpus_version, db_version
+from utils.schema_catalog import mentioned_values
+
+DEFAULT_CACHE_PATH = 'app/data/cache/semantic_cache.db'
+
+# Only these keys of the final state are stored and replayed
+CACHED_STATE_KEYS = (
+    'messages', 'analysis_plan', 'document_context', 'sql_results',
+    'analysis_results', 'visualization', 'final_answer'
+)
+
+
+# Numbers, quarters/halves and month names: the parts of a question that
+# change its answer but barely move its embedding
+_KEY_TERM = re.compile(
+    r"\d[\d,]*(?:\.\d+)?|\b[qh]\d\b|\b(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\b",
+    re.IGNORECASE
+)
+
+
+# Words that flip which end of a ranking or trend is asked for, grouped so
+# "highest" and "top" still share an answer
+_POLARITY = {
+    'high': r'highest|most|top|largest|biggest|max\w*',
+    'low': r'lowest|least|bottom|smallest|fewest|min\w*',
+    'up': r'increas\w*|ris\w*|rose|grow\w*|grew',
+    'down': r'decreas\w*|declin\w*|drop\w*|fall\w*|fell',
+}
+_POLARITY_PATTERNS = {name: re.compile(rf'\b({words})\b', re.IGNORECASE) for name, words in _POLARITY.items()}
+
+
+def key_terms(query: str) -> FrozenSet[str]:
+    """The numbers, periods, categorical values and polarity of a question, normalized"""
+    terms = set()
+    for term in _KEY_TERM.findall(query.lower()):
+        if term[0].isdigit():
+            terms.add(f"{float(term.replace(',', '')):g}")
+        elif term[0] in 'qh':
+            terms.add(term)
+        else:
+            terms.add(term[:3])
+    terms.update(name for name, pattern in _POLARITY_PATTERNS.items() if pattern.search(query))
+    terms.update(mentioned_values(query))
+    return frozenset(terms)
+
+
+class SemanticAnswerCache:
+    def __init__(self, embeddings, path: str = DEFAULT_CACHE_PATH,
+                 threshold: float = 0.92, max_entries: int = 5000,
+                 ttl: Optional[float] = None):
+        self.embeddings = embeddings
+        self.path = path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # In-memory copy of the stored embeddings, synced by _refresh()
+        self._versions: Optional[Dict[str, str]] = None
+        self._ids = np.empty(0, dtype=np.int64)
+        self._matrix: Optional[np.ndarray] = None
+        self._created = np.empty(0)
+        self._terms: List[FrozenSet[str]] = []
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS answers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                query TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                state TEXT NOT NULL,
+                db_version TEXT NOT NULL,
+                corpus_version TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )"""
+        )
+        self._conn.commit()
+
+    def current_versions(self) -> Dict[str, str]:
+        return {'db_version': db_version(), 'corpus_version': corpus_version()}
+
+    def _invalidate(self, versions: Dict[str, str]) -> None:
+        """Drop entries from other data versions or past their TTL (run when the versions change)"""
+        self._conn.execute(
+            "DELETE FROM answers WHERE db_version != ? OR corpus_version != ?",
+            (versions['db_version'], versions['corpus_version'])
+        )
+        if self.ttl is not None:
+            self._conn.execute(
+                "DELETE FROM answers WHERE created_at < ?", (time.time() - self.ttl,)
+            )
+        self._conn.commit()
+
+    def _refresh(self, versions: Dict[str, str]) -> None:
+        """Bring the in-memory embeddings in line with the table"""
+        if versions != self._versions:
+            self._invalidate(versions)
+            self._versions = versions
+            self._ids, self._matrix, self._created, self._terms = np.empty(0, dtype=np.int64), None, np.empty(0), []
+
+        count, last_id = self._conn.execute("SELECT COUNT(*), COALESCE(MAX(id), 0) FROM answers").fetchone()
+        known_last = int(self._ids[-1]) if len(self._ids) else 0
+        if count == len(self._ids) and last_id == known_last:
+            return
+
+        # Drop rows deleted elsewhere (trimmed, invalidated), then read new ones
+        if count < len(self._ids) + (last_id - known_last):
+            ids = np.array([row[0] for row in self._conn.execute("SELECT id FROM answers")], dtype=np.int64)
+            keep = np.isin(self._ids, ids)
+            self._ids, self._created = self._ids[keep], self._created[keep]
+            self._matrix = self._matrix[keep] if self._matrix is not None else None
+            self._terms = [t for t, k in zip(self._terms, keep) if k]
+        rows = self._conn.execute(
+            "SELECT id, query, embedding, created_at FROM answers WHERE id > ? ORDER BY id", (known_last,)
+        ).fetchall()
+        if rows:
+            new = np.vstack([np.frombuffer(row[2], dtype=np.float32) for row in rows])
+            self._matrix = new if self._matrix is None else np.vstack([self._matrix, new])
+            self._ids = np.concatenate([self._ids, [row[0] for row in rows]]).astype(np.int64)
+            self._created = np.concatenate([self._created, [row[3] for row in rows]])
+            self._terms.extend(key_terms(row[1]) for row in rows)
+
+    def lookup(self, embedding: List[float], query: str) -> Optional[Dict[str, Any]]:
+        """Return the closest cached state above the threshold whose question
+        has the same numbers, quarters and months, with provenance"""
+        versions = self.current_versions()
+        query_vec = np.asarray(embedding, dtype=np.float32)
+        query_vec /= (np.linalg.norm(query_vec) or 1.0)
+        terms = key_terms(query)
+
+        with self._lock:
+            self._refresh(versions)
+            if self._matrix is None or not len(self._ids):
+                return None
+            similarities = self._matrix @ query_vec
+            if self.ttl is not None:
+                similarities[self._created < time.time() - self.ttl] = -1.0
+            candidates = np.flatnonzero(similarities >= self.threshold)
+            best = next((int(i) for i in candidates[np.argsort(-similarities[candidates])]
+                         if self._terms[i] == terms), None)
+            if best is None:
+                return None
+            row = self._conn.execute(
+                "SELECT query, state, db_version, created_at FROM answers WHERE id = ?",
+                (int(self._ids[best]),)
+            ).fetchone()
+
+        if row is None:
+            return None
+        original, state, version, created_at = row
+        return {
+            'state': json.loads(state),
+            'provenance': {
+                'original_query': original,
+                'similarity': float(similarities[best]),
+                'age_seconds': time.time() - created_at,
+                'db_version': version,
+            }
+        }
+
+    def store(self, query: str, embedding: List[float], state: Dict[str, Any]) -> None:
+        versions = self.current_versions()
+        vec = np.asarray(embedding, dtype=np.float32)
+        vec /= (np.linalg.norm(vec) or 1.0)
+        payload = json.dumps({k: state.get(k) for k in CACHED_STATE_KEYS}, default=str)
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO answers (query, embedding, state, db_version, corpus_version, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (query, vec.tobytes(), payload, versions['db_version'],
+                 versions['corpus_version'], time.time())
+            )
+            self._conn.execute(
+                """DELETE FROM answers WHERE id IN (
+                    SELECT id FROM answers ORDER BY created_at DESC LIMIT -1 OFFSET ?
+                )""",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM answers")
+            self._conn.commit()
+            self._versions = None
+
+
+def default_semantic_cache(embeddings) -> Optional[SemanticAnswerCache]:
+    """Build the cache configured by the SEMANTIC_CACHE_* environment variables.
+
+    Returns None when SEMANTIC_CACHE_ENABLED is set to 0/false/off.
+    """
+    if os.getenv('SEMANTIC_CACHE_ENABLED', '1').lower() in ('0', 'false', 'off'):
+        return None
+
+    ttl = os.getenv('SEMANTIC_CACHE_TTL')
+    return SemanticAnswerCache(
+        embeddings,
+        path=os.getenv('SEMANTIC_CACHE_PATH', DEFAULT_CACHE_PATH),
+        threshold=float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0.92')),
+        max_entries=int(os.getenv('SEMANTIC_CACHE_MAX_ENTRIES', '5000')),
+        ttl=float(ttl) if ttl else None
+    )
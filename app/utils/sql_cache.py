@@ -0,0 +1,136 @@
+"""Result cache for SQL queries against banking.db.
+
+LLM-generated SQL for the same question varies in whitespace, keyword case
+and literal formatting, so queries are keyed on a normalized form of the
+text plus the database version. Entries are evicted least recently used
+once their total size passes a byte budget.
+"""
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+_TOKEN_PATTERN = re.compile(r"""
+    (?P<comment>--[^\n]*|/\*.*?\*/)
+  | (?P<string>'(?:[^']|'')*')
+  | (?P<quoted>"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\])
+  | (?P<number>(?:\d+\.\d*|\.\d+|\d+)(?:[eE][+-]?\d+)?)
+  | (?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+  | (?P<space>\s+)
+  | (?P<op><>|!=|<=|>=|==|\|\||.)
+""", re.VERBOSE | re.DOTALL)
+
+
+def _normalize_number(text: str) -> str:
+    """1.50 and 1.5 match; 1 and 1.0 do not, since SQLite types them differently"""
+    if re.fullmatch(r'\d+', text):
+        return str(int(text))
+    return repr(float(text))
+
+
+def tokenize_sql(query: str) -> List[str]:
+    """Canonical tokens for a query: no comments or whitespace, lowercase
+    keywords and bare identifiers, canonical numbers, no trailing semicolon.
+
+    String literals and quoted names are kept exactly: SQLite reads an
+    unknown "double-quoted" name as a string, so its case matters.
+    """
+    tokens = []
+    for match in _TOKEN_PATTERN.finditer(query):
+        kind, text = match.lastgroup, match.group()
+        if kind in ('comment', 'space'):
+            continue
+        if kind == 'number':
+            text = _normalize_number(text)
+        elif kind == 'word':
+            text = text.lower()
+        tokens.append(text)
+    while tokens and tokens[-1] == ';':
+        tokens.pop()
+    return tokens
+
+
+def normalize_sql(query: str) -> str:
+    """Canonical text for a query (see tokenize_sql), single-spaced"""
+    return " ".join(tokenize_sql(query))
+
+
+# Bytes counted per entry on top of the rows, so empty results still use
+# up the budget: the key, column names and the bookkeeping around them
+ENTRY_OVERHEAD = 64
+
+
+def entry_size(key: str, value: Any, size: int) -> int:
+    """size plus the entry's fixed cost"""
+    columns = value.get('columns') or [] if isinstance(value, dict) else []
+    return max(size, 0) + ENTRY_OVERHEAD + len(key) + sum(len(str(c)) for c in columns)
+
+
+def make_sql_key(query: str, version: str) -> str:
+    payload = f"{version}\n{normalize_sql(query)}"
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class SQLResultCache:
+    """Thread-safe LRU of query results, bounded by total size in bytes"""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self._version = None
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry[0]
+
+    def set(self, key: str, value: Any, size: int) -> None:
+        size = entry_size(key, value, size)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self._stats["evictions"] += 1
+
+    def sync_version(self, version: str) -> None:
+        """Drop every entry once the database changes; they can never hit again"""
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._bytes = 0
+                self._version = version
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, "entries": len(self._entries), "bytes": self._bytes}
+
+
+def default_sql_cache() -> Optional[SQLResultCache]:
+    """Build the cache configured by SQL_CACHE_ENABLED / SQL_CACHE_MAX_BYTES"""
+    if os.getenv('SQL_CACHE_ENABLED', '1').lower() in ('0', 'false', 'off'):
+        return None
+    return SQLResultCache(
+        max_bytes=int(os.getenv('SQL_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+    )
@@ -0,0 +1,262 @@
+"""Guardrails for LLM-written SQL.
+
+Before a query runs, its EXPLAIN QUERY PLAN is costed from table sizes
+(and sqlite_stat1 when ANALYZE has been run). Full scans of very large
+tables, cartesian / nested-loop joins and correlated subqueries that would
+examine too many rows are rejected with a structured "too expensive,
+rewrite" error. While a query runs, SQLite's progress handler enforces a
+wall-time and VM-step budget.
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.data_version import db_version
+
+MAX_SCAN_ROWS = int(os.getenv('SQL_MAX_SCAN_ROWS', '50000000'))
+MAX_JOIN_ROWS = int(os.getenv('SQL_MAX_JOIN_ROWS', '1000000'))
+TIMEOUT = float(os.getenv('SQL_TIMEOUT', '15'))
+MAX_VM_STEPS = int(os.getenv('SQL_MAX_VM_STEPS', '200000000'))
+
+# The progress handler runs every this many VM instructions
+_PROGRESS_INTERVAL = 10000
+# Assumed rows for a grouped/distinct subquery, and per index lookup
+# when sqlite_stat1 has nothing better
+_GROUPED_ROWS = 1000
+_LOOKUP_ROWS = 10
+
+_SCAN_PATTERN = re.compile(r'^SCAN (?:TABLE |SUBQUERY )?(\S+)')
+_SEARCH_PATTERN = re.compile(r'^SEARCH (?:TABLE )?(\S+)(?: AS \S+)? USING (.*)$')
+_CONTAINER_PATTERN = re.compile(r'^(MATERIALIZE|CO-ROUTINE) (\S+)')
+
+
+class QueryRejected(Exception):
+    """A query the agent should rewrite; details is JSON-serialisable"""
+
+    def __init__(self, details: Dict[str, Any]):
+        super().__init__(details['reason'])
+        self.details = details
+
+    def to_message(self) -> str:
+        return f"{self.details['summary']}: {self.details['reason']}\n{json.dumps(self.details)}"
+
+
+class QueryTooExpensive(QueryRejected):
+    pass
+
+
+class QueryBudgetExceeded(QueryRejected):
+    pass
+
+
+_row_counts: Dict[Tuple[str, str], int] = {}
+_row_counts_lock = threading.Lock()
+
+
+def _table_rows(conn: sqlite3.Connection, table: str) -> Optional[int]:
+    """Approximate row count, cached per database version"""
+    key = (db_version(), table)
+    with _row_counts_lock:
+        if key in _row_counts:
+            return _row_counts[key]
+    try:
+        rows = conn.execute(f'SELECT MAX(rowid) FROM "{table}"').fetchone()[0] or 0
+    except sqlite3.Error:
+        try:
+            rows = conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+        except sqlite3.Error:
+            return None
+    with _row_counts_lock:
+        _row_counts[key] = rows
+    return rows
+
+
+def _rows_per_lookup(conn: sqlite3.Connection, table: str, using: str, table_rows: int) -> int:
+    """Rows matched by one index search, from sqlite_stat1 when available"""
+    if 'PRIMARY KEY' in using and '=' in using and '>' not in using and '<' not in using:
+        return 1
+    is_range = '>' in using or '<' in using
+    index = re.search(r'INDEX (\S+)', using)
+    if index and not is_range:
+        try:
+            row = conn.execute(
+                "SELECT stat FROM sqlite_stat1 WHERE tbl = ? AND idx = ?",
+                (table, index.group(1))
+            ).fetchone()
+            if row:
+                parts = row[0].split()
+                if len(parts) > 1:
+                    return max(int(parts[1]), 1)
+        except sqlite3.Error:
+            pass
+    if is_range:
+        return max(table_rows // 4, 1)
+    return _LOOKUP_ROWS
+
+
+class _PlanCoster:
+    """Walk an EXPLAIN QUERY PLAN tree estimating rows examined"""
+
+    def __init__(self, conn: sqlite3.Connection, query: str, plan: List[tuple]):
+        self.conn = conn
+        self.query = query
+        self.children: Dict[int, List[tuple]] = {}
+        for node_id, parent, _, detail in plan:
+            self.children.setdefault(parent, []).append((node_id, detail))
+        self.derived: Dict[str, int] = {}
+        self.findings: List[Dict[str, Any]] = []
+
+    def _resolve(self, name: str) -> Tuple[str, Optional[int]]:
+        """Map a plan name (table, alias or CTE) to a table and its size"""
+        if name in self.derived:
+            return name, self.derived[name]
+        rows = _table_rows(self.conn, name)
+        if rows is not None:
+            return name, rows
+        for match in re.finditer(rf'\b([A-Za-z_]\w*)\s+(?:AS\s+)?{re.escape(name)}\b',
+                                 self.query, re.IGNORECASE):
+            rows = _table_rows(self.conn, match.group(1))
+            if rows is not None:
+                return match.group(1), rows
+        return name, _GROUPED_ROWS
+
+    def cost(self, parent: int = 0) -> Tuple[int, int]:
+        """(rows examined, rows produced) for the loops under a plan node"""
+        outer, examined, grouped, compound = 1, 0, False, []
+        scanned = []
+        for node_id, detail in self.children.get(parent, []):
+            scan = _SCAN_PATTERN.match(detail)
+            search = _SEARCH_PATTERN.match(detail)
+            container = _CONTAINER_PATTERN.match(detail)
+            if scan:
+                table, rows = self._resolve(scan.group(1))
+                if outer > 1:
+                    self.findings.append({
+                        'kind': 'nested_scan',
+                        'tables': scanned + [table],
+                        'rows': outer * rows,
+                    })
+                scanned.append(table)
+                outer *= max(rows, 1)
+                examined += outer
+                if len(scanned) == 1:
+                    self.findings.append({'kind': 'full_scan', 'tables': [table], 'rows': rows})
+            elif search:
+                table, rows = self._resolve(search.group(1))
+                using = search.group(2)
+                if 'AUTOMATIC' in using:
+                    examined += rows
+                scanned.append(table)
+                outer *= _rows_per_lookup(self.conn, table, using, rows)
+                examined += outer
+            elif container:
+                inner_examined, produced = self.cost(node_id)
+                examined += inner_examined
+                self.derived[container.group(2)] = produced
+            elif detail.startswith('CORRELATED'):
+                inner_examined, _ = self.cost(node_id)
+                if outer > 1 and inner_examined > 1:
+                    self.findings.append({
+                        'kind': 'correlated_subquery',
+                        'tables': list(scanned),
+                        'rows': outer * inner_examined,
+                    })
+                examined += outer * inner_examined
+            elif detail.startswith('USE TEMP B-TREE FOR GROUP BY') or detail.startswith('USE TEMP B-TREE FOR DISTINCT'):
+                grouped = True
+            elif node_id in self.children:
+                inner_examined, produced = self.cost(node_id)
+                examined += inner_examined
+                compound.append(produced)
+
+        if compound and not scanned:
+            outer = sum(compound)
+        produced = min(outer, _GROUPED_ROWS) if grouped else outer
+        return examined, produced
+
+
+def check_query_cost(conn: sqlite3.Connection, query: str,
+                     max_scan_rows: int = MAX_SCAN_ROWS,
+                     max_join_rows: int = MAX_JOIN_ROWS) -> Dict[str, Any]:
+    """Cost a query's plan, raising QueryTooExpensive if it is over budget.
+
+    Returns the estimate (rows examined and the plan) otherwise.
+    """
+    plan = conn.execute(f"EXPLAIN QUERY PLAN {query}").fetchall()
+    coster = _PlanCoster(conn, query, plan)
+    examined, _ = coster.cost()
+    estimate = {'estimated_rows': examined, 'plan': [p[3] for p in plan]}
+
+    for finding in coster.findings:
+        tables = " x ".join(finding['tables'])
+        if finding['kind'] == 'nested_scan' and finding['rows'] > max_join_rows:
+            reason = (f"cartesian or unindexed join of {tables} would examine "
+                      f"~{finding['rows']:,} rows (limit {max_join_rows:,})")
+            hint = "Add a join condition on a key column, or aggregate each table before joining."
+        elif finding['kind'] == 'correlated_subquery' and finding['rows'] > max_join_rows:
+            reason = (f"correlated subquery re-scans for every row of {tables}, "
+                      f"~{finding['rows']:,} rows (limit {max_join_rows:,})")
+            hint = "Rewrite the subquery as a JOIN against a pre-aggregated subquery."
+        elif finding['kind'] == 'full_scan' and finding['rows'] > max_scan_rows:
+            reason = (f"full scan of {tables} would read ~{finding['rows']:,} rows "
+                      f"(limit {max_scan_rows:,})")
+            hint = "Filter on an indexed column or a date range, or query a smaller table."
+        else:
+            continue
+        raise QueryTooExpensive({
+            'error': 'query_too_expensive',
+            'summary': 'Query too expensive, rewrite it',
+            'reason': reason,
+            'hint': hint,
+            **estimate,
+        })
+
+    if examined > max_scan_rows:
+        raise QueryTooExpensive({
+            'error': 'query_too_expensive',
+            'summary': 'Query too expensive, rewrite it',
+            'reason': f"plan would examine ~{examined:,} rows (limit {max_scan_rows:,})",
+            'hint': "Filter earlier, aggregate in SQL and avoid repeated scans.",
+            **estimate,
+        })
+    return estimate
+
+
+@contextmanager
+def query_budget(conn: sqlite3.Connection, timeout: float = TIMEOUT,
+                 max_steps: int = MAX_VM_STEPS):
+    """Abort statements on this connection that run past the time or VM-step budget"""
+    start_time = time.monotonic()
+    state = {'steps': 0, 'exceeded': None}
+
+    def _progress():
+        state['steps'] += _PROGRESS_INTERVAL
+        if state['steps'] > max_steps:
+            state['exceeded'] = f"exceeded {max_steps:,} SQLite VM steps"
+            return 1
+        if time.monotonic() - start_time > timeout:
+            state['exceeded'] = f"ran longer than {timeout:g}s"
+            return 1
+        return 0
+
+    conn.set_progress_handler(_progress, _PROGRESS_INTERVAL)
+    try:
+        yield state
+    except sqlite3.OperationalError:
+        if state['exceeded'] is None:
+            raise
+        raise QueryBudgetExceeded({
+            'error': 'query_budget_exceeded',
+            'summary': 'Query too expensive, rewrite it',
+            'reason': f"query {state['exceeded']} and was stopped",
+            'hint': "Aggregate in SQL, filter on indexed columns and avoid cross joins.",
+            'elapsed': round(time.monotonic() - start_time, 3),
+            'vm_steps': state['steps'],
+        })
+    finally:
+        conn.set_progress_handler(None, 0)
@@ -0,0 +1,243 @@
+"""Pre-forked worker processes for running LLM-written code.
+
+Each worker is forked from the agent process after the state it needs
+(the analysis DataFrames) is loaded. It starts with that state already in
+memory, shared copy-on-write with the parent, and then serves jobs over a
+pipe. Before its first job a worker drops the environment (API keys) and
+caps its address space; each job also gets a CPU-time rlimit (see
+utils.sandbox). The parent enforces the rest:
+
+- wall-clock timeout: a job that runs too long has its worker killed
+- memory: a worker whose private RSS passes the limit is killed mid-job,
+  or retired after the job
+- recycling: workers are replaced after max_jobs jobs, after a crash, and
+  when the state version changes (e.g. banking.db was updated)
+
+Forking a process that runs other threads (executor threads, DuckDB,
+Streamlit) copies only the forking thread. Locks another thread held
+then stay locked in the child. The pool is therefore opt-in
+(ANALYSIS_WORKERS), and is best preforked early, before those threads
+are busy.
+
+Idle workers wait in a queue, so concurrent callers each get their own
+process and analysis runs in parallel on all cores. A runaway job only
+takes down its own worker.
+"""
+import atexit
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from utils.sandbox import limit_cpu, limit_memory, scrub_environment
+
+_POLL_INTERVAL = 0.05
+
+
+class WorkerError(Exception):
+    """A job did not produce a result"""
+
+
+class WorkerTimeout(WorkerError):
+    pass
+
+
+class WorkerMemoryExceeded(WorkerError):
+    pass
+
+
+class WorkerCrashed(WorkerError):
+    pass
+
+
+def private_rss(pid: int) -> Optional[int]:
+    """Bytes of memory the process does not share with its parent (Linux only).
+
+    Pages inherited at fork and never written stay shared, so they don't
+    count toward a worker's limit.
+    """
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            return sum(int(line.split()[1]) * 1024 for line in f if line.startswith('Private_'))
+    except (OSError, ValueError):
+        return None
+
+
+def _worker_main(conn, handler: Callable[[Any, Any], Any], state: Any,
+                 max_memory: int, cpu_seconds: float) -> None:
+    scrub_environment()
+    limit_memory(max_memory)
+    while True:
+        try:
+            payload = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        limit_cpu(cpu_seconds)
+        try:
+            result = handler(payload, state)
+        except Exception as e:
+            result = WorkerCrashed(f"{type(e).__name__}: {e}")
+        conn.send(result)
+
+
+class _Worker:
+    def __init__(self, context, handler, state, version, max_memory, cpu_seconds):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, daemon=True,
+                                       args=(child_conn, handler, state, max_memory, cpu_seconds))
+        self.process.start()
+        child_conn.close()
+        self.version = version
+        self.jobs = 0
+
+    def stop(self) -> None:
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class WorkerPool:
+    """Fixed-size pool of forked workers running handler(payload, state).
+
+    load_state() builds the state in the parent before forking;
+    state_version() says when it is stale and workers must be re-forked.
+    """
+
+    def __init__(self, handler: Callable[[Any, Any], Any], load_state: Callable[[], Any],
+                 state_version: Callable[[], str], size: int = 2, timeout: float = 30.0,
+                 max_rss_mb: int = 2048, max_jobs: int = 100):
+        self.handler = handler
+        self.load_state = load_state
+        self.state_version = state_version
+        self.size = size
+        self.timeout = timeout
+        self.max_rss = max_rss_mb * 1024 * 1024
+        self.max_jobs = max_jobs
+        self._context = multiprocessing.get_context('fork')
+        self._idle: "queue.Queue[Optional[_Worker]]" = queue.Queue()
+        self._spawn_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._started = False
+        self._stats = {"jobs": 0, "timeouts": 0, "memory_kills": 0, "crashes": 0, "recycled": 0}
+
+    def _start(self) -> None:
+        with self._spawn_lock:
+            if not self._started:
+                # Empty slots; each is forked on first checkout
+                for _ in range(self.size):
+                    self._idle.put(None)
+                self._started = True
+
+    def _spawn(self, version: str) -> _Worker:
+        with self._spawn_lock:
+            return _Worker(self._context, self.handler, self.load_state(), version,
+                           self.max_rss, self.timeout)
+
+    def _checkout(self) -> _Worker:
+        self._start()
+        worker = self._idle.get()
+        version = self.state_version()
+        if worker is not None and (not worker.process.is_alive() or worker.version != version):
+            self._retire(worker)
+            worker = None
+        if worker is None:
+            try:
+                worker = self._spawn(version)
+            except BaseException:
+                self._idle.put(None)
+                raise
+        return worker
+
+    def prefork(self) -> None:
+        """Fork every worker now, so the first jobs don't wait for it"""
+        workers = [self._checkout() for _ in range(self.size)]
+        for worker in workers:
+            self._idle.put(worker)
+
+    def _retire(self, worker: _Worker) -> None:
+        worker.stop()
+        self._count("recycled")
+
+    def _count(self, stat: str) -> None:
+        with self._stats_lock:
+            self._stats[stat] += 1
+
+    def _crashed(self, worker: _Worker) -> WorkerError:
+        worker.process.join(1)
+        if worker.process.exitcode == -signal.SIGXCPU:
+            self._count("timeouts")
+            return WorkerTimeout(f"used more than {self.timeout:g}s of CPU and was stopped")
+        self._count("crashes")
+        return WorkerCrashed(f"worker exited with code {worker.process.exitcode}")
+
+    def run(self, payload: Any) -> Any:
+        """Run one job on an idle worker, raising a WorkerError if it fails"""
+        worker = self._checkout()
+        healthy = False
+        try:
+            worker.conn.send(payload)
+            deadline = time.monotonic() + self.timeout
+            while not worker.conn.poll(_POLL_INTERVAL):
+                if not worker.process.is_alive():
+                    raise self._crashed(worker)
+                if time.monotonic() > deadline:
+                    self._count("timeouts")
+                    raise WorkerTimeout(f"ran longer than {self.timeout:g}s and was stopped")
+                rss = private_rss(worker.process.pid)
+                if rss is not None and rss > self.max_rss:
+                    self._count("memory_kills")
+                    raise WorkerMemoryExceeded(
+                        f"used more than {self.max_rss // 2**20}MB of memory and was stopped"
+                    )
+            try:
+                result = worker.conn.recv()
+            except EOFError:
+                raise self._crashed(worker)
+            if isinstance(result, WorkerCrashed):
+                raise result
+
+            worker.jobs += 1
+            self._count("jobs")
+            rss = private_rss(worker.process.pid)
+            healthy = worker.jobs < self.max_jobs and (rss is None or rss <= self.max_rss)
+            return result
+        finally:
+            if not healthy:
+                self._retire(worker)
+                worker = None
+            self._idle.put(worker)
+
+    def close(self) -> None:
+        """Stop every idle worker (busy ones are stopped when they finish)"""
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            if worker is not None:
+                worker.stop()
+
+    def stats(self) -> Dict[str, int]:
+        with self._stats_lock:
+            return {**self._stats, "size": self.size}
+
+
+def default_worker_pool(handler: Callable[[Any, Any], Any], load_state: Callable[[], Any],
+                        state_version: Callable[[], str]) -> Optional[WorkerPool]:
+    """Build the pool configured by ANALYSIS_WORKERS and friends (unset or 0: no pool)"""
+    size = int(os.getenv('ANALYSIS_WORKERS', '0'))
+    if size <= 0 or 'fork' not in multiprocessing.get_all_start_methods():
+        return None
+    pool = WorkerPool(
+        handler, load_state, state_version,
+        size=size,
+        timeout=float(os.getenv('ANALYSIS_TIMEOUT', '30')),
+        max_rss_mb=int(os.getenv('ANALYSIS_MAX_RSS_MB', '2048')),
+        max_jobs=int(os.getenv('ANALYSIS_MAX_JOBS', '100')),
+    )
+    atexit.register(pool.close)
+    return pool
@@ -0,0 +1,23 @@
+import os
+import sqlite3
+import sys
+
+import pandas as pd
+import pytest
+
+# The app imports its packages as top-level modules (utils, tools, agents)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app'))
+
+STRUCTURED_DIR = os.path.join(os.path.dirname(__file__), '..', 'app', 'data', 'structured')
+
+
+@pytest.fixture
+def banking_db(tmp_path):
+    """A banking.db built from the sample CSVs, dates stored as in generate_data.py"""
+    path = str(tmp_path / 'banking.db')
+    with sqlite3.connect(path) as conn:
+        for table, date_column in (('loans', 'application_date'), ('transactions', 'timestamp')):
+            df = pd.read_csv(os.path.join(STRUCTURED_DIR, f"{table}.csv"))
+            df[date_column] = pd.to_datetime(df[date_column]).dt.strftime('%Y-%m-%d %H:%M:%S')
+            df.to_sql(table, conn, index=False)
+    return path
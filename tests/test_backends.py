@@ -0,0 +1,96 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from utils.backends import ParquetBackend, compact_frame, concat_frames, export_parquet
+
+
+def loans(**overrides):
+    data = {
+        'loan_id': ['L1', 'L2', 'L3'],
+        'application_date': ['2024-01-05 10:00:00', '2024-02-10 11:30:00', '2024-04-01 09:15:00'],
+        'loan_type': ['Auto', 'Mortgage', 'Auto'],
+        'credit_score': [850, 720, 580],
+        'term_months': [360, 60, 36],
+        'customer_age': [74, 35, 28],
+        'province': ['ON', 'BC', 'ON'],
+        'defaulted': [0, 1, 1],
+    }
+    data.update(overrides)
+    return pd.DataFrame(data)
+
+
+def test_integer_arithmetic_does_not_overflow():
+    df = compact_frame('loans', loans())
+    assert (df['customer_age'] * 12).max() == 888
+    assert (df['credit_score'] * df['term_months']).sum() == 850 * 360 + 720 * 60 + 580 * 36
+    assert (df['credit_score'] ** 2).mean() == (850 ** 2 + 720 ** 2 + 580 ** 2) / 3
+
+
+def test_labels_behave_like_plain_strings():
+    df = compact_frame('loans', loans())
+    assert not any(isinstance(dtype, pd.CategoricalDtype) for dtype in df.dtypes)
+    assert df['province'].max() == 'ON'
+    assert sorted(df['province'].unique()) == ['BC', 'ON']
+    filtered = df[df['province'] == 'ON']
+    assert len(filtered.groupby(['province', 'loan_type'])['defaulted'].mean()) == 1
+
+
+def test_dates_are_parsed_and_missing_integers_stay_nullable():
+    df = compact_frame('loans', loans(defaulted=[0, None, 1]))
+    assert pd.api.types.is_datetime64_any_dtype(df['application_date'])
+    assert str(df['defaulted'].dtype) == 'Int32'
+    assert df['defaulted'].isna().sum() == 1
+
+
+def test_concat_frames_keeps_dtypes():
+    df = concat_frames([compact_frame('loans', loans()), compact_frame('loans', loans())])
+    assert len(df) == 6
+    assert df['province'].dtype == compact_frame('loans', loans())['province'].dtype
+    assert list(df.index) == list(range(6))
+
+
+DATE_QUERIES = [
+    "SELECT COUNT(*) FROM loans WHERE application_date BETWEEN '2024-01-01' AND '2024-01-30'",
+    "SELECT substr(application_date, 1, 7) AS month, COUNT(*) FROM loans GROUP BY month ORDER BY month",
+    "SELECT date(application_date), datetime(application_date) FROM loans ORDER BY loan_id",
+    "SELECT strftime('%Y-%m', application_date) AS month, SUM(defaulted) FROM loans GROUP BY month ORDER BY month",
+    "SELECT loan_id, julianday(application_date) - julianday('2024-01-01') FROM loans ORDER BY loan_id",
+]
+
+
+@pytest.fixture
+def parquet_copy(tmp_path):
+    """A small banking.db and its Parquet export"""
+    pytest.importorskip('duckdb')
+    db_path = str(tmp_path / 'banking.db')
+    df = loans(
+        loan_id=['L1', 'L2', 'L3', 'L4'],
+        application_date=['2024-01-01 00:00:00', '2024-01-30 00:00:00',
+                          '2024-01-30 12:00:00', '2024-02-01 00:00:00'],
+        loan_type=['Auto'] * 4, credit_score=[700] * 4, term_months=[36] * 4,
+        customer_age=[40] * 4, province=['ON'] * 4, defaulted=[0, 1, 0, 1],
+    )
+    with sqlite3.connect(db_path) as conn:
+        df.to_sql('loans', conn, index=False)
+        transactions = pd.DataFrame({'transaction_id': ['T1'], 'timestamp': ['2024-01-02 03:04:05']})
+        transactions.to_sql('transactions', conn, index=False)
+    export_parquet(db_path, str(tmp_path / 'parquet'))
+    return db_path, ParquetBackend(str(tmp_path / 'parquet'))
+
+
+@pytest.mark.parametrize('query', DATE_QUERIES)
+def test_parquet_dates_match_sqlite(parquet_copy, query):
+    db_path, backend = parquet_copy
+    with sqlite3.connect(db_path) as conn:
+        expected = [tuple(row) for row in conn.execute(query).fetchall()]
+    assert [tuple(row) for row in backend.fetch(query, 100, 10**6)['rows']] == expected
+
+
+def test_parquet_load_table_parses_dates(parquet_copy):
+    _, backend = parquet_copy
+    for compact in (False, True):
+        df = backend.load_table('loans', compact=compact)
+        assert pd.api.types.is_datetime64_any_dtype(df['application_date'])
+        assert df['application_date'].max() == pd.Timestamp('2024-02-01')
@@ -0,0 +1,93 @@
+import threading
+
+import pandas as pd
+
+from tools.analysis_tool import DataAnalysisTool
+from utils import frame_cache
+from utils.frame_cache import copy_on_write, view
+
+
+def _cow():
+    return pd.get_option('mode.copy_on_write')
+
+
+def test_copy_on_write_is_scoped_to_the_block():
+    before = _cow()
+    with copy_on_write():
+        assert _cow() is True
+    assert _cow() == before
+
+
+def test_overlapping_blocks_keep_copy_on_write_until_the_last_exits():
+    before = _cow()
+    entered, release = threading.Event(), threading.Event()
+    seen = []
+
+    def other():
+        with copy_on_write():
+            entered.set()
+            release.wait(5)
+            seen.append(_cow())
+
+    thread = threading.Thread(target=other)
+    thread.start()
+    entered.wait(5)
+    with copy_on_write():
+        pass
+    release.set()
+    thread.join(5)
+    assert seen == [True]
+    assert _cow() == before
+
+
+def test_writes_to_a_view_leave_the_cached_frame_alone():
+    cached = pd.DataFrame({'amount': [1.0, 2.0, 3.0], 'status': ['a', 'b', 'c']})
+    with copy_on_write():
+        df = view(cached)
+        df['amount'] *= 10
+        df.loc[0, 'status'] = 'z'
+    assert cached['amount'].tolist() == [1.0, 2.0, 3.0]
+    assert cached['status'].tolist() == ['a', 'b', 'c']
+
+
+def test_analysis_code_cannot_change_shared_frames():
+    loans = pd.DataFrame({'loan_amount': [100.0, 200.0], 'province': ['ON', 'BC']})
+    frames = {'loans_df': loans, 'transactions_df': pd.DataFrame({'amount': [1.0]})}
+    code = "loans_df['loan_amount'] = 0\nloans_df.drop(columns=['province'], inplace=True)\nresult = loans_df['loan_amount'].sum()"
+    assert DataAnalysisTool.execute(code, frames) == '0'
+    assert loans['loan_amount'].tolist() == [100.0, 200.0]
+    assert list(loans.columns) == ['loan_amount', 'province']
+
+
+class _Backend:
+    """Serves a table whose rows change (new version) during one load"""
+    name = 'fake'
+
+    def __init__(self):
+        self.rows = {'v1': [1, 2, 3], 'v2': [3, 1, 2, 4]}
+        self.current = 'v1'
+        self.change_on_load = False
+
+    def version(self):
+        return self.current
+
+    def load_table(self, table, columns=None):
+        rows = self.rows[self.current]
+        if self.change_on_load:
+            self.change_on_load = False
+            self.current = 'v2'
+        data = {'loan_id': rows, 'amount': [r * 10.0 for r in rows], 'term': [r * 12 for r in rows]}
+        return pd.DataFrame({c: data[c] for c in columns or data})
+
+
+def test_partial_load_across_an_ingestion_reads_all_columns_again(monkeypatch):
+    backend = _Backend()
+    monkeypatch.setattr(frame_cache, 'get_backend', lambda: backend)
+    cache = frame_cache.FrameCache()
+    cache.get('loans', ['loan_id'])
+
+    backend.change_on_load = True
+    df = cache.get('loans', ['loan_id', 'amount'])
+    assert df['loan_id'].tolist() == [3, 1, 2, 4]
+    assert df['amount'].tolist() == [30.0, 10.0, 20.0, 40.0]
+    assert cache.get('loans', ['amount']) is df
@@ -0,0 +1,98 @@
+import pandas as pd
+import pytest
+
+from utils.frame_usage import frame_columns, select_frames
+
+LOANS = ['loan_id', 'application_date', 'loan_type', 'amount', 'credit_score', 'province', 'defaulted']
+TRANSACTIONS = ['transaction_id', 'timestamp', 'amount', 'merchant', 'is_fraud']
+COLUMNS = {'loans_df': LOANS, 'transactions_df': TRANSACTIONS}
+
+
+@pytest.fixture
+def frames():
+    loans = pd.DataFrame({
+        'loan_id': ['L1', 'L2', 'L3', 'L4'],
+        'application_date': pd.to_datetime(['2024-01-05', '2024-02-10', '2024-04-01', '2024-05-20']),
+        'loan_type': ['Auto', 'Mortgage', 'Auto', 'Personal'],
+        'amount': [1000.0, 250000.0, 15000.0, 5000.0],
+        'credit_score': [650, 720, 580, 700],
+        'province': ['ON', 'BC', 'ON', 'QC'],
+        'defaulted': [0, 0, 1, 1],
+    })
+    transactions = pd.DataFrame({
+        'transaction_id': ['T1', 'T2', 'T3'],
+        'timestamp': pd.to_datetime(['2024-01-01', '2024-01-02', '2024-01-03']),
+        'amount': [10.0, 20.0, 30.0],
+        'merchant': ['Walmart', 'Amazon', 'Walmart'],
+        'is_fraud': [0, 1, 0],
+    })
+    return {'loans_df': loans, 'transactions_df': transactions}
+
+
+def run(code, frames):
+    namespace = dict(frames)
+    exec(code, namespace)
+    return str(namespace['result'])
+
+
+@pytest.mark.parametrize('code, expected', [
+    ("result = loans_df['defaulted'].mean()", {'loans_df': ['defaulted']}),
+    ("result = loans_df.groupby('province')['defaulted'].mean()", {'loans_df': ['province', 'defaulted']}),
+    ("df = loans_df[loans_df['credit_score'] > 700]\nresult = df.amount.sum()",
+     {'loans_df': ['amount', 'credit_score']}),
+    ("result = loans_df.loc[loans_df.province == 'ON', 'amount'].mean()", {'loans_df': ['amount', 'province']}),
+    ("result = loans_df.groupby('loan_type').agg(n=('loan_id', 'count'), rate=('defaulted', 'mean'))",
+     {'loans_df': ['loan_id', 'loan_type', 'defaulted']}),
+    ("result = loans_df.sort_values('amount').head(2)[['loan_id', 'amount']]", {'loans_df': ['loan_id', 'amount']}),
+    ("result = len(transactions_df[transactions_df['is_fraud'] == 1])", {'transactions_df': ['is_fraud']}),
+    ("result = len(loans_df)", {'loans_df': ['loan_id']}),
+])
+def test_reads_only_the_columns_used(code, expected):
+    assert frame_columns(code, COLUMNS) == expected
+
+
+@pytest.mark.parametrize('code', [
+    # Whole rows end up in the printed result
+    "result = loans_df.head()",
+    "result = loans_df[loans_df['defaulted'] == 1]",
+    "result = loans_df.sort_values('amount').iloc[0]",
+    "result = loans_df.nlargest(3, 'amount')",
+    "top = loans_df.nlargest(3, 'amount')\nresult = top",
+    # Rows kept under a name nobody reads again
+    "top = loans_df.head()\nresult = 1",
+    # Uses that may read any column
+    "result = loans_df.describe()",
+    "cols = ['amount']\nresult = loans_df[cols].mean()",
+    "result = loans_df.iloc[:, 2].mean()",
+    "result = loans_df.dropna().shape[0]",
+    "def f(loans_df):\n    return loans_df.mean()\nresult = f(loans_df)",
+])
+def test_falls_back_to_the_whole_frame(code):
+    assert frame_columns(code, COLUMNS)['loans_df'] is None
+
+
+@pytest.mark.parametrize('code', [
+    "result = eval('loans_df')",
+    "result = getattr(loans_df, 'amount').sum()",
+    "result = loans_df.__dict__",
+    "result = (",
+])
+def test_gives_up_on_dynamic_or_invalid_code(code):
+    assert frame_columns(code, COLUMNS) is None
+
+
+def test_unmentioned_frames_are_not_loaded():
+    assert 'transactions_df' not in frame_columns("result = loans_df['amount'].sum()", COLUMNS)
+
+
+@pytest.mark.parametrize('code', [
+    "result = loans_df.head()",
+    "result = loans_df[loans_df['defaulted'] == 1]",
+    "result = loans_df.sort_values('amount').iloc[0]",
+    "result = loans_df.nlargest(3, 'amount')",
+    "df = loans_df[loans_df['province'] == 'ON']\nresult = df.groupby('loan_type')['amount'].mean()",
+    "result = transactions_df.groupby('merchant')['amount'].sum().nlargest(1)",
+    "result = len(loans_df[loans_df.defaulted == 1]) / len(loans_df)",
+])
+def test_narrowed_frames_give_the_same_result(code, frames):
+    assert run(code, select_frames(code, frames)) == run(code, frames)
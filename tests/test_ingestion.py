@@ -0,0 +1,106 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from utils.data_version import data_version_counter
+from utils.ingestion import ingest
+from utils.rollups import ROLLUP_TABLE, DIMENSIONS, build_rollups, rollup_select_sql
+
+
+def new_loans(ids, **overrides):
+    data = {
+        'loan_id': ids,
+        'application_date': ['2024-10-03'] * len(ids),
+        'loan_type': ['Auto'] * len(ids),
+        'amount': [25000.0] * len(ids),
+        'interest_rate': [6.5] * len(ids),
+        'term_months': [60] * len(ids),
+        'credit_score': [640] * len(ids),
+        'province': ['ON'] * len(ids),
+        'customer_age': [41] * len(ids),
+        'income': [72000.0] * len(ids),
+        'employment_status': ['Full-time'] * len(ids),
+        'defaulted': [1] * len(ids),
+        'days_past_due': [90] * len(ids),
+    }
+    data.update(overrides)
+    return pd.DataFrame(data)
+
+
+def rollup_rows(conn, query):
+    order = ", ".join(DIMENSIONS)
+    return [tuple(round(v, 4) if isinstance(v, float) else v for v in row)
+            for row in conn.execute(f"SELECT * FROM ({query}) ORDER BY {order}")]
+
+
+def assert_rollup_matches_rebuild(db_path):
+    """The incrementally maintained rollup equals one built from scratch"""
+    with sqlite3.connect(db_path) as conn:
+        columns = ", ".join(row[1] for row in conn.execute(f"PRAGMA table_info({ROLLUP_TABLE})"))
+        incremental = rollup_rows(conn, f"SELECT {columns} FROM {ROLLUP_TABLE}")
+        rebuilt = rollup_rows(conn, f"SELECT {columns} FROM ({rollup_select_sql()})")
+        recorded = conn.execute("SELECT source_rows FROM rollup_state").fetchone()[0]
+        assert recorded == conn.execute("SELECT COUNT(*) FROM loans").fetchone()[0]
+    assert incremental == rebuilt
+
+
+@pytest.fixture
+def db(banking_db):
+    build_rollups(banking_db)
+    return banking_db
+
+
+def test_append_inserts_rows_and_updates_the_rollup(db):
+    before = data_version_counter(db)
+    result = ingest('loans', new_loans(['N1', 'N2']), db_path=db)
+    assert (result['inserted'], result['updated']) == (2, 0)
+    assert data_version_counter(db) == before + 1
+    with sqlite3.connect(db) as conn:
+        stored = conn.execute("SELECT application_date FROM loans WHERE loan_id = 'N1'").fetchone()[0]
+    assert stored == '2024-10-03 00:00:00'
+    assert_rollup_matches_rebuild(db)
+
+
+def test_upsert_moves_replaced_rows_between_rollup_groups(db):
+    changed = new_loans(['L000000', 'L000001', 'N1'], province=['BC', 'NS', 'ON'],
+                        application_date=['2022-02-15', '2024-01-01', '2024-10-03'])
+    result = ingest('loans', changed, mode='upsert', db_path=db)
+    assert (result['inserted'], result['updated']) == (1, 2)
+    with sqlite3.connect(db) as conn:
+        assert conn.execute("SELECT province FROM loans WHERE loan_id = 'L000001'").fetchone()[0] == 'NS'
+    assert_rollup_matches_rebuild(db)
+
+
+def test_append_of_an_existing_key_changes_nothing(db):
+    before = data_version_counter(db)
+    with sqlite3.connect(db) as conn:
+        count = conn.execute("SELECT COUNT(*) FROM loans").fetchone()[0]
+
+    with pytest.raises(ValueError, match="already exist"):
+        ingest('loans', new_loans(['N1', 'L000000']), db_path=db)
+
+    with sqlite3.connect(db) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM loans").fetchone()[0] == count
+    assert data_version_counter(db) == before
+    assert_rollup_matches_rebuild(db)
+
+
+@pytest.mark.parametrize("rows, message", [
+    (new_loans(['N1']).drop(columns=['income']), "missing"),
+    (new_loans(['N1']).assign(extra=1), "unexpected"),
+    (new_loans(['N1', 'N1']), "duplicate"),
+    (new_loans([None]), "needs a loan_id"),
+])
+def test_invalid_batches_are_rejected(db, rows, message):
+    with pytest.raises(ValueError, match=message):
+        ingest('loans', rows, db_path=db)
+
+
+def test_transactions_are_appended(db):
+    rows = [{'transaction_id': 'TN1', 'timestamp': '2024-10-03T12:30:00', 'customer_id': 'C00001',
+             'type': 'Deposit', 'amount': 150.0, 'merchant': 'Payroll', 'is_fraud': 0}]
+    assert ingest('transactions', rows, db_path=db)['inserted'] == 1
+    with sqlite3.connect(db) as conn:
+        stored = conn.execute("SELECT timestamp FROM transactions WHERE transaction_id = 'TN1'").fetchone()[0]
+    assert stored == '2024-10-03 12:30:00'
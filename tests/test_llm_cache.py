@@ -0,0 +1,45 @@
+import time
+
+import pytest
+
+from utils import llm_cache
+from utils.llm_cache import MemoryLRUCache, ResponseCache, SQLiteResponseCache, TieredCache
+
+
+def test_incomplete_cache_layers_cannot_be_created():
+    class NoClear(ResponseCache):
+        def get(self, key):
+            return None
+
+        def set(self, key, value):
+            pass
+
+    with pytest.raises(TypeError):
+        ResponseCache()
+    with pytest.raises(TypeError):
+        NoClear()
+
+
+def test_tiered_cache_fills_the_front_layer(tmp_path):
+    memory, disk = MemoryLRUCache(), SQLiteResponseCache(str(tmp_path / 'llm.db'))
+    disk.set('k', 'answer')
+    cache = TieredCache([memory, disk])
+    assert cache.get('k') == 'answer'
+    assert memory.get('k') == 'answer'
+    cache.clear()
+    assert cache.get('k') is None
+
+
+def test_backfilled_entries_keep_their_original_age(tmp_path, monkeypatch):
+    memory = MemoryLRUCache(ttl=60)
+    disk = SQLiteResponseCache(str(tmp_path / 'llm.db'), ttl=60)
+    created_at = time.time() - 50
+    disk.set('k', 'answer', created_at=created_at)
+    cache = TieredCache([memory, disk])
+    assert cache.get('k') == 'answer'
+    assert memory.get_entry('k') == ('answer', created_at)
+
+    # 20s later the entry is past its TTL in both layers
+    now = time.time() + 20
+    monkeypatch.setattr(llm_cache.time, 'time', lambda: now)
+    assert cache.get('k') is None
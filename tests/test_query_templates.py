@@ -0,0 +1,81 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from agents.query_templates import match_template
+from tools.analysis_tool import DataAnalysisTool
+
+
+@pytest.mark.parametrize("query", [
+    "Is there a default option for products?",
+    "What's the default setting for monthly statements?",
+    "Average income of defaulted loans by province",
+    "Default rate by credit score and province",
+    "Default rate by province over the years",
+    "Default rate by province in Q1",
+    "Default rate by province Q1 vs Q2 2024",
+    "Default rate by province last year",
+    "Default rate by province in March 2024",
+    "Which merchants have the most transactions by province?",
+])
+def test_questions_without_a_full_template_intent_fall_through(query):
+    assert match_template(query) is None
+
+
+@pytest.mark.parametrize("query", [
+    "default rate by province for mortgage loans",
+    "Average loan amount by province for self-employed borrowers",
+    "default rate by loan type in Ontario",
+    "Default rate by loan type in ON",
+    "default rate by quarter for borrowers with credit score below 600",
+    "default rate by province for loans over $500,000",
+    "default rate by province where income above 100k",
+    "default rate by province excluding Quebec",
+    "Which province has the lowest default rate among personal loans?",
+    "Default rate by province for Retired borrowers only",
+    "Default rate by loan type for terms of 60 months",
+])
+def test_filtered_questions_fall_through(query):
+    # The templates can't apply these filters; answering unfiltered would be wrong
+    assert match_template(query) is None
+
+
+@pytest.mark.parametrize("query, name, title", [
+    ("What is the default rate by province?", 'default_rate_by_dimension', "Default rate by province"),
+    ("Which province has the highest default rate?", 'default_rate_by_dimension', "Default rate by province"),
+    ("Provincial default rates", 'default_rate_by_dimension', "Default rate by province"),
+    ("Show defaults by loan type in 2023", 'default_rate_by_dimension', "Default rate by loan type (2023)"),
+    ("Default rate by province in Q1 2024", 'default_rate_by_dimension', "Default rate by province (Q1 2024)"),
+    ("Compare default rates of Q1 vs Q2 2024", 'default_rate_by_dimension',
+     "Default rate by quarter (Q1 2024 vs Q2 2024)"),
+    ("Default rates 2023 vs 2024", 'default_rate_by_dimension', "Default rate by year (2023 vs 2024)"),
+    ("Monthly default rate in Q4 2023 and Q1 2024", 'default_rate_by_dimension',
+     "Default rate by month (Q4 2023 vs Q1 2024)"),
+    ("How does credit score relate to default?", 'credit_band_vs_default', "Default rate by credit score band"),
+    ("Average loan amount by loan type", 'average_amount_by_dimension', "Average loan amount by loan type"),
+])
+def test_matched_templates(query, name, title):
+    template = match_template(query)
+    assert (template['name'], template['title']) == (name, title)
+
+
+def test_compared_quarters_are_the_only_rows():
+    loans = pd.DataFrame({
+        'loan_id': ['L1', 'L2', 'L3', 'L4', 'L5'],
+        'application_date': ['2024-01-15 00:00:00', '2024-02-01 00:00:00', '2024-05-10 00:00:00',
+                             '2024-08-01 00:00:00', '2023-02-01 00:00:00'],
+        'defaulted': [1, 0, 1, 1, 0],
+    })
+    template = match_template("Compare default rates of Q1 vs Q2 2024")
+
+    with sqlite3.connect(':memory:') as conn:
+        loans.to_sql('loans', conn, index=False)
+        rows = conn.execute(template['sql']).fetchall()
+    assert rows == [('2024-Q1', 2, 1, 50.0), ('2024-Q2', 1, 1, 100.0)]
+
+    frames = {'loans_df': loans.assign(application_date=pd.to_datetime(loans['application_date']))}
+    result = DataAnalysisTool.execute(template['analysis_code'], frames)
+    assert "- 2024-Q1: 50.0% (1 of 2 loans)" in result
+    assert "- 2024-Q2: 100.0% (1 of 1 loans)" in result
+    assert "2024-Q3" not in result and "2023" not in result
@@ -0,0 +1,85 @@
+import sqlite3
+
+import pytest
+
+from agents.query_templates import match_template
+from utils import rollups
+from utils.rollups import ROLLUP_TABLE, build_rollups, rewrite_query
+
+
+@pytest.fixture
+def conn(banking_db, monkeypatch):
+    """A connection to a database with rollups built, and the rewrite switched on"""
+    build_rollups(banking_db)
+    monkeypatch.setattr(rollups, '_ENABLED', True)
+    monkeypatch.setattr(rollups, '_ready', {})
+    conn = sqlite3.connect(banking_db)
+    yield conn
+    conn.close()
+
+
+def rows(conn, query):
+    return [tuple(round(v, 6) if isinstance(v, float) else v for v in row)
+            for row in conn.execute(query).fetchall()]
+
+
+REWRITTEN = [
+    "SELECT province, AVG(defaulted) FROM loans GROUP BY province ORDER BY province",
+    "SELECT loan_type, COUNT(*) AS n, SUM(amount) AS total FROM loans GROUP BY loan_type ORDER BY total DESC",
+    "SELECT l.province, ROUND(AVG(l.interest_rate), 2) FROM loans l GROUP BY l.province ORDER BY 1",
+    "SELECT strftime('%Y-%m', application_date) AS month, COUNT(*) FROM loans "
+    "WHERE application_date >= '2023-01-01' AND application_date < '2023-07-01' GROUP BY month ORDER BY month",
+    "SELECT employment_status, AVG(credit_score) FROM loans WHERE province IN ('ON', 'BC') "
+    "GROUP BY employment_status HAVING COUNT(*) > 10 ORDER BY 2 DESC LIMIT 3",
+    "SELECT COUNT(*), SUM(defaulted), AVG(income) FROM loans",
+]
+
+
+@pytest.mark.parametrize("query", REWRITTEN)
+def test_rewritten_queries_match_the_loans_table(conn, query):
+    rewritten = rewrite_query(conn, query)
+    assert rewritten is not None and ROLLUP_TABLE in rewritten
+    assert rows(conn, rewritten) == rows(conn, query)
+
+
+@pytest.mark.parametrize("question", [
+    "What is the default rate by province?",
+    "Compare default rates of Q1 vs Q2 2024",
+    "Default rate by credit score band",
+    "Average loan amount by loan type in 2023",
+])
+def test_template_sql_is_answered_from_the_rollup(conn, question):
+    query = match_template(question)['sql']
+    rewritten = rewrite_query(conn, query)
+    assert rewritten is not None
+    assert rows(conn, rewritten) == rows(conn, query)
+
+
+@pytest.mark.parametrize("query", [
+    # Not on a month boundary, a column the rollup lacks, a join, DISTINCT
+    "SELECT province, COUNT(*) FROM loans WHERE application_date >= '2023-01-15' GROUP BY province",
+    "SELECT province, AVG(term_months) FROM loans GROUP BY province",
+    "SELECT l.province, COUNT(*) FROM loans l JOIN transactions t ON 1 = 1 GROUP BY l.province",
+    "SELECT COUNT(DISTINCT province) FROM loans",
+    "SELECT * FROM loans",
+])
+def test_queries_without_an_exact_rollup_answer_are_left_alone(conn, query):
+    assert rewrite_query(conn, query) is None
+
+
+def test_stale_rollups_are_not_used(conn, banking_db):
+    with sqlite3.connect(banking_db) as writer:
+        writer.execute("DELETE FROM loans WHERE province = 'ON'")
+    rollups._ready.clear()
+    assert rewrite_query(conn, REWRITTEN[0]) is None
+
+
+def test_readiness_is_tracked_per_database(conn, tmp_path):
+    assert rewrite_query(conn, REWRITTEN[0]) is not None
+    other = sqlite3.connect(str(tmp_path / 'other.db'))
+    try:
+        other.execute("CREATE TABLE loans (loan_id TEXT, province TEXT, defaulted INTEGER)")
+        assert rewrite_query(other, REWRITTEN[0]) is None
+        assert rewrite_query(conn, REWRITTEN[0]) is not None
+    finally:
+        other.close()
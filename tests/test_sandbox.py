@@ -0,0 +1,62 @@
+import os
+
+import pytest
+
+from utils.sandbox import restricted_builtins
+from utils.worker_pool import WorkerPool, WorkerTimeout
+
+
+def _run(code):
+    namespace = {'__builtins__': restricted_builtins()}
+    exec(code, namespace)
+    return namespace.get('result')
+
+
+def test_allowed_modules_import():
+    assert _run("import math\nresult = math.sqrt(16)") == 4.0
+
+
+@pytest.mark.parametrize("code", [
+    "import os",
+    "import subprocess",
+    "from os import path",
+    "__import__('socket')",
+])
+def test_other_imports_are_blocked(code):
+    with pytest.raises(ImportError):
+        _run(code)
+
+
+@pytest.mark.parametrize("name", ["open", "eval", "exec", "compile"])
+def test_blocked_builtins_are_missing(name):
+    with pytest.raises(NameError):
+        _run(f"{name}")
+
+
+def _read_env(payload, state):
+    return os.environ.get(payload)
+
+
+def _spin(payload, state):
+    while True:
+        pass
+
+
+def test_workers_drop_secrets_from_the_environment(monkeypatch):
+    monkeypatch.setenv('SANDBOX_TEST_SECRET', 'sk-secret')
+    pool = WorkerPool(_read_env, lambda: None, lambda: 'v1', size=1)
+    try:
+        assert pool.run('SANDBOX_TEST_SECRET') is None
+        assert pool.run('PATH') == os.environ['PATH']
+    finally:
+        pool.close()
+
+
+def test_runaway_job_is_stopped():
+    pool = WorkerPool(_spin, lambda: None, lambda: 'v1', size=1, timeout=1.0)
+    try:
+        with pytest.raises(WorkerTimeout):
+            pool.run(None)
+        assert pool.stats()['timeouts'] == 1
+    finally:
+        pool.close()
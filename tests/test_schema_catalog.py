@@ -0,0 +1,57 @@
+import sqlite3
+
+import pytest
+
+from utils import schema_catalog
+from utils.schema_catalog import render_schema
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'banking.db')
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE loans (loan_id TEXT, application_date TEXT, province TEXT, amount REAL)")
+        conn.execute("CREATE TABLE transactions (transaction_id TEXT, timestamp TEXT, amount REAL)")
+        conn.execute("INSERT INTO loans VALUES ('L1', '2024-01-05 00:00:00', 'ON', 1000.0)")
+        conn.execute("INSERT INTO transactions VALUES ('T1', '2024-01-06 00:00:00', 25.0)")
+    return path
+
+
+@pytest.fixture
+def introspections(monkeypatch):
+    calls = []
+    introspect = schema_catalog._introspect_table
+
+    def counted(conn, table):
+        calls.append(table)
+        return introspect(conn, table)
+
+    monkeypatch.setattr(schema_catalog, '_introspect_table', counted)
+    return calls
+
+
+def test_new_rows_refresh_values_and_ranges(db_path, introspections):
+    schema_catalog.schema_catalog(db_path)
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("INSERT INTO loans VALUES ('L2', '2025-06-01 00:00:00', 'PE', 2000.0)")
+    rendered = render_schema(schema_catalog.schema_catalog(db_path))
+    assert "- loans (2 rows)" in rendered
+    assert "province TEXT: 'ON', 'PE'" in rendered
+    assert "2024-01-05 to 2025-06-01" in rendered
+    # Same schema: the columns aren't introspected again
+    assert introspections == ['loans', 'transactions']
+
+
+def test_a_schema_change_introspects_again(db_path, introspections):
+    schema_catalog.schema_catalog(db_path)
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("ALTER TABLE loans ADD COLUMN defaulted INTEGER")
+    catalog = schema_catalog.schema_catalog(db_path)
+    assert 'defaulted' in [c['name'] for c in catalog['loans']['columns']]
+    assert len(introspections) == 4
+
+
+def test_rendered_schema(db_path):
+    rendered = render_schema(schema_catalog.schema_catalog(db_path))
+    assert "- loans (1 rows)\n" in rendered
+    assert "province TEXT: 'ON'" in rendered
@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+
+from utils import semantic_cache
+from utils.schema_catalog import mentioned_values
+from utils.semantic_cache import SemanticAnswerCache, key_terms
+
+VERSIONS = {'db_version': 'v1', 'corpus_version': 'c1'}
+
+
+@pytest.fixture(autouse=True)
+def catalog(banking_db, monkeypatch):
+    # Categorical values come from the test database's catalog
+    monkeypatch.setattr(semantic_cache, 'mentioned_values', lambda text: mentioned_values(text, banking_db))
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    versions = dict(VERSIONS)
+    monkeypatch.setattr(SemanticAnswerCache, 'current_versions', lambda self: dict(versions))
+    cache = SemanticAnswerCache(None, path=str(tmp_path / 'answers.db'), threshold=0.9)
+    cache.versions = versions
+    return cache
+
+
+def vector(*values):
+    return list(np.array(values, dtype=np.float32))
+
+
+def answer(text):
+    return {'final_answer': text}
+
+
+def test_key_terms_normalize_numbers_quarters_and_months():
+    assert key_terms("Default rate in Q1 2024 for loans over 10,000.0") == {'q1', '2024', '10000'}
+    assert key_terms("Spending in January vs February") == {'jan', 'feb'}
+    assert key_terms("What drives defaults?") == frozenset()
+
+
+def test_key_terms_include_categorical_values_and_polarity():
+    assert key_terms("Which province has the highest default rate among mortgages?") == {
+        'high', 'loan_type=Mortgage'}
+    assert key_terms("Top provinces besides Ontario") == {'high', 'province=ON'}
+
+
+def test_close_question_with_the_same_terms_hits(cache):
+    cache.store("Default rate in Q1 2024?", vector(1, 0, 0), answer("5%"))
+    hit = cache.lookup(vector(0.99, 0.05, 0), "What was the default rate in Q1 2024")
+    assert hit['state']['final_answer'] == "5%"
+    assert hit['provenance']['original_query'] == "Default rate in Q1 2024?"
+
+
+@pytest.mark.parametrize("query", [
+    "Default rate in Q2 2024?",
+    "Default rate in Q1 2023?",
+    "Default rate in Q1?",
+    "Default rate in Q1 2024 for loans over 5000?",
+])
+def test_different_numbers_or_periods_miss(cache, query):
+    cache.store("Default rate in Q1 2024?", vector(1, 0, 0), answer("5%"))
+    assert cache.lookup(vector(1, 0, 0), query) is None
+
+
+@pytest.mark.parametrize("stored, query", [
+    ("Default rate for Mortgage loans", "Default rate for Auto loans"),
+    ("Average loan amount in Ontario", "Average loan amount in Quebec"),
+    ("Which province has the highest default rate?", "Which province has the lowest default rate?"),
+])
+def test_different_values_or_polarity_miss(cache, stored, query):
+    cache.store(stored, vector(1, 0, 0), answer("a"))
+    assert cache.lookup(vector(1, 0, 0), query) is None
+
+
+def test_the_closest_entry_with_matching_terms_wins(cache):
+    cache.store("Default rate in Q1 2024?", vector(1, 0, 0), answer("Q1"))
+    cache.store("Default rate in Q2 2024?", vector(0.95, 0.3, 0), answer("Q2"))
+    hit = cache.lookup(vector(1, 0, 0), "Default rate for Q2 2024")
+    assert hit['state']['final_answer'] == "Q2"
+
+
+def test_entries_from_other_processes_and_deletions_are_picked_up(cache, tmp_path):
+    cache.store("Loans by province", vector(1, 0, 0), answer("a"))
+    assert cache.lookup(vector(1, 0, 0), "Loans by province") is not None
+
+    other = SemanticAnswerCache(None, path=cache.path, threshold=0.9)
+    other.store("Deposits by month", vector(0, 1, 0), answer("b"))
+    assert cache.lookup(vector(0, 1, 0), "Deposits by month")['state']['final_answer'] == "b"
+
+    other.clear()
+    assert cache.lookup(vector(1, 0, 0), "Loans by province") is None
+
+
+def test_a_new_data_version_drops_entries(cache):
+    cache.store("Loans by province", vector(1, 0, 0), answer("a"))
+    assert cache.lookup(vector(1, 0, 0), "Loans by province") is not None
+    cache.versions['db_version'] = 'v2'
+    assert cache.lookup(vector(1, 0, 0), "Loans by province") is None
+
+
+def test_lookup_does_not_reread_stored_embeddings(cache, monkeypatch):
+    for i in range(20):
+        cache.store(f"Question {i}", vector(1, i, 0), answer(str(i)))
+    cache.lookup(vector(1, 0, 0), "Question 0")
+
+    calls = []
+    monkeypatch.setattr(semantic_cache.np, 'frombuffer', lambda *a, **k: calls.append(a) or np.zeros(3))
+    cache.lookup(vector(1, 0, 0), "Question 0")
+    assert calls == []
@@ -0,0 +1,55 @@
+from utils.sql_cache import ENTRY_OVERHEAD, SQLResultCache, make_sql_key, normalize_sql, tokenize_sql
+
+
+def test_formatting_differences_share_a_key():
+    a = "SELECT province, COUNT(*)\n  FROM loans -- by province\n GROUP BY province;"
+    b = "select province,count(*) from LOANS /* grouped */ group by Province"
+    assert normalize_sql(a) == normalize_sql(b)
+    assert make_sql_key(a, 'v1') == make_sql_key(b, 'v1')
+
+
+def test_numbers_are_canonical_but_keep_their_type():
+    assert normalize_sql("SELECT 1.50") == normalize_sql("SELECT 1.5")
+    assert normalize_sql("SELECT 1") != normalize_sql("SELECT 1.0")
+    assert normalize_sql("SELECT 007") == normalize_sql("SELECT 7")
+
+
+def test_string_literals_keep_their_case():
+    assert (normalize_sql("SELECT * FROM transactions WHERE type = 'Deposit'")
+            != normalize_sql("SELECT * FROM transactions WHERE type = 'deposit'"))
+
+
+def test_quoted_names_keep_their_case():
+    # SQLite treats an unknown double-quoted name as a string literal
+    for quoted in ('"Deposit"', '`Deposit`', '[Deposit]'):
+        lower = quoted.replace('Deposit', 'deposit')
+        assert (normalize_sql(f"SELECT COUNT(*) FROM transactions WHERE type = {quoted}")
+                != normalize_sql(f"SELECT COUNT(*) FROM transactions WHERE type = {lower}"))
+    assert tokenize_sql('SELECT "Amount" FROM loans') == ['select', '"Amount"', 'from', 'loans']
+
+
+def test_keys_depend_on_the_data_version():
+    assert make_sql_key("SELECT 1", 'v1') != make_sql_key("SELECT 1", 'v2')
+
+
+def test_cache_evicts_least_recently_used_and_clears_on_new_version():
+    cache = SQLResultCache(max_bytes=2 * (ENTRY_OVERHEAD + 5))
+    cache.sync_version('v1')
+    cache.set('a', 'A', 4)
+    cache.set('b', 'B', 4)
+    cache.get('a')
+    cache.set('c', 'C', 4)
+    assert cache.get('b') is None
+    assert cache.get('a') == 'A'
+    cache.sync_version('v2')
+    assert cache.get('a') is None
+
+
+def test_empty_results_count_against_the_budget():
+    cache = SQLResultCache(max_bytes=10 * ENTRY_OVERHEAD)
+    empty = {'columns': ['province', 'default_rate'], 'rows': [], 'bytes': 0}
+    for i in range(100):
+        cache.set(f'key{i}', empty, 0)
+    stats = cache.stats()
+    assert stats['entries'] < 10
+    assert 0 < stats['bytes'] <= cache.max_bytes
@@ -0,0 +1,17 @@
+from tools import sql_tool
+from tools.sql_tool import SQLQueryTool
+
+
+def test_description_recovers_once_the_schema_is_readable(monkeypatch):
+    schema = ["(schema unavailable: banking.db could not be read)"]
+    monkeypatch.setattr(sql_tool, 'schema_prompt', lambda: schema[0])
+    tool = SQLQueryTool()
+    assert "schema unavailable" in tool.description
+
+    schema[0] = "- loans\n    province TEXT: 'BC', 'ON'"
+    assert "schema unavailable" not in tool.description
+    assert "        province TEXT: 'BC', 'ON'" in tool.description
+
+
+def test_a_custom_description_is_kept():
+    assert SQLQueryTool(description="Run SQL").description == "Run SQL"